@@ -21,6 +21,7 @@ def is_current_system_raspberry_pi():
 
 
 install_requires = [
+    'numpy',
     'psutil',
     'smbus',
 ]
@@ -1,2 +1,6 @@
 
+from .line_follower import LineFollower, line_positions
 from .serobot import Serobot
+from .telemetry import (
+    TelemetryColumn, TelemetryRecorder, open_telemetry_chunk, read_telemetry,
+    record_serobot_telemetry)
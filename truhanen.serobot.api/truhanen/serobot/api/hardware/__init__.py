@@ -1,11 +1,17 @@
 
+from .backend import Backend, RaspberryPiBackend, default_backend
 from .buzzer import Buzzer
 from .camera import Camera
 from .distance_sensor import DistanceSensor
-from .leds import Leds, RgbValue
+from .leds import Leds, LedAnimation, RgbValue
 from .line_trackers import LineTrackers
+from .metrics import MetricsRegistry, Counter, Gauge, Histogram, metrics_registry
 from .motors import Motors
-from .proximity_sensor import ProximitySensors
+from .proximity_sensor import ProximitySensors, ObstacleEvent
 from .raspberry_pi import RaspberryPi
 from .rc_receiver import RCReceiver, RCCode
+from .scheduler import HardwareScheduler, Priority, hardware_scheduler
+from .replay import ReplayBackend, ReplayClock, ReplayOutput, diff_replay_outputs
+from .simulator import SimulatedBackend
 from .speaker import Speaker
+from .timer_wheel import TimerWheel, TimerHandle, timer_wheel
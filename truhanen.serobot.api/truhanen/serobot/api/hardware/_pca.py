@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
 import time
-import smbus
 import logging
+from typing import Optional
+
+from .backend import Backend, NullSMBus, default_backend
 
 # ============================================================================
 # Raspberry Pi PCA9685 16-Channel PWM Servo Driver
@@ -29,6 +31,10 @@ class PCA:
     _ALLLED_OFF_L       = 0xFC
     _ALLLED_OFF_H       = 0xFD
 
+    _LED_REGISTER_COUNT = 4  # ON_L, ON_H, OFF_L, OFF_H of one channel
+    _CHANNEL_COUNT = 16
+
+    mode_bit_auto_increment = 5
     mode_bit_sleep = 4
     mode_bit_restart = 7
 
@@ -37,43 +43,68 @@ class PCA:
 
     _pwm_freq = 50
 
-    def __init__(self, address=0x40):
+    def __init__(self, address=0x40, backend: Optional[Backend] = None):
         try:
-            self.bus = smbus.SMBus(1)
-        except PermissionError:
-            logger.warning('Caught a PermissionError on connecting to a I2C '
-                           'device interface. The PCA instance (camera tilt/pan) '
-                           'will have no physical functionality.')
-            self.bus = None
+            self.bus = (backend or default_backend()).smbus.SMBus(1)
+        except OSError as error:
+            # E.g. PermissionError, or FileNotFoundError if there is no
+            # I2C device interface.
+            logger.warning(f'Caught {error!r} on connecting to a I2C '
+                           f'device interface. The PCA instance (camera '
+                           f'tilt/pan) will have no physical functionality.')
+            self.bus = NullSMBus()
         self.address = address
+        # Shadow copy of the values written to the registers. Writes that
+        # would not change a register are skipped.
+        self._registers = dict()
         self.reset()
         self._set_pwm_freq()
 
-    def write(self, reg, value):
-        """Write an 8-bit value to the specified register/address"""
-        log_message = 'I2C: Write {:#b} to register {:#b}.'.format(value, reg)
-        if self.bus is not None:
-            self.bus.write_byte_data(self.address, reg, value)
-            logger.debug(log_message)
-        else:
-            logger.info(f'Missing SMBus instance. Failed {log_message}')
+    def write(self, reg, value, force=False):
+        """Write an 8-bit value to the specified register/address.
+        Skip the write if the register already has the value, unless force
+        is True.
+        """
+        if not force and self._registers.get(reg) == value:
+            return
+        self.bus.write_byte_data(self.address, reg, value)
+        logger.debug('I2C: Write %#b to register %#b.', value, reg)
+        self._registers[reg] = value
+
+    def write_block(self, reg, values):
+        """Write 8-bit values to consecutive registers, starting from the
+        specified register, in a single I2C transaction. Requires the
+        auto-increment mode. Only the span of registers whose values change
+        is written.
+        """
+        changed = [i for (i, value) in enumerate(values)
+                   if self._registers.get(reg + i) != value]
+        if not changed:
+            return
+        first, last = changed[0], changed[-1]
+        reg += first
+        values = values[first:last + 1]
+
+        self.bus.write_i2c_block_data(self.address, reg, values)
+        logger.debug('I2C: Write %s to registers from %#b.', values, reg)
+        for i, value in enumerate(values):
+            self._registers[reg + i] = value
 
     def read(self, reg):
         """Read an unsigned byte from the I2C device"""
-        log_message = f'I2C: Read from device {self.address:#b}, reg {reg:#b}.'
-        if self.bus is not None:
-            result = self.bus.read_byte_data(self.address, reg)
-            log_message += f' Result {result & 0xFF:#b}.'
-            logger.debug(log_message)
-        else:
-            logger.info(f'Missing SMBus instance. Failed {log_message}')
-            result = None
+        result = self.bus.read_byte_data(self.address, reg)
+        logger.debug('I2C: Read from device %#b, reg %#b. Result %#b.',
+                     self.address, reg, result & 0xFF)
         return result
 
     def set_mode_value(self, value):
-        self.write(self._MODE1, value)
+        self.write(self._MODE1, value, force=True)
+        # The restart bit clears itself after the restart.
+        self._registers[self._MODE1] = value & ~(1 << self.mode_bit_restart)
 
     def get_mode_value(self):
+        if self._MODE1 in self._registers:
+            return self._registers[self._MODE1]
         return self.read(self._MODE1)
 
     def set_mode_bit(self, mode_bit, on=True):
@@ -87,10 +118,13 @@ class PCA:
 
     def reset(self):
         logger.debug('Resetting PCA9685')
-        self.set_mode_value(0b00000000)
+        # The register values are unknown after a reset.
+        self._registers.clear()
+        # Enable auto-increment for block writes.
+        self.set_mode_value(1 << self.mode_bit_auto_increment)
 
     def sleep(self, sleep=True):
-        logger.debug('Setting sleep {}'.format(sleep))
+        logger.debug('Setting sleep %s', sleep)
         self.set_mode_bit(self.mode_bit_sleep, sleep)
         if not sleep:
             # Wait for oscillator to stabilize
@@ -103,7 +137,7 @@ class PCA:
         oscillator_freq = 25e6
         prescale_value = oscillator_freq / 4096 / self._pwm_freq
         prescale_value = int(round(prescale_value)) - 1
-        logger.debug('Setting PWM frequency to {} Hz'.format(self._pwm_freq))
+        logger.debug('Setting PWM frequency to %s Hz', self._pwm_freq)
 
         # Set SLEEP bit on for setting the PRE_SCALE register
         self.sleep()
@@ -112,12 +146,28 @@ class PCA:
         # Return from sleep
         self.sleep(False)
 
+    @staticmethod
+    def _pwm_register_values(off):
+        """Values of the ON_L, ON_H, OFF_L, and OFF_H registers."""
+        return [0, 0, off & 0b11111111, off >> 8]
+
     def set_pwm(self, channel, off):
         """Sets a single PWM channel"""
-        self.write(self._LED0_ON_L + 4 * channel, 0)
-        self.write(self._LED0_ON_H + 4 * channel, 0)
-        self.write(self._LED0_OFF_L + 4 * channel, off & 0b11111111)
-        self.write(self._LED0_OFF_H + 4 * channel, off >> 8)
+        self.write_block(self._LED0_ON_L + self._LED_REGISTER_COUNT * channel,
+                         self._pwm_register_values(off))
+
+    def set_all_pwm(self, off):
+        """Sets all PWM channels"""
+        values = self._pwm_register_values(off)
+        # Always write, since the ALL_LED registers are not read back.
+        for reg in range(self._ALLLED_ON_L, self._ALLLED_OFF_H + 1):
+            self._registers.pop(reg, None)
+        self.write_block(self._ALLLED_ON_L, values)
+        # Writing the ALL_LED registers fills the registers of every channel.
+        for channel in range(self._CHANNEL_COUNT):
+            reg = self._LED0_ON_L + self._LED_REGISTER_COUNT * channel
+            for i, value in enumerate(values):
+                self._registers[reg + i] = value
 
     def set_servo_pulse(self, channel, pulse):
         """Sets the servo pulse
@@ -129,7 +179,7 @@ class PCA:
         pulse: int
             Servo duty cycle in milliseconds. 1500 is center.
         """
-        logger.debug('Setting servo {} pulse {}'.format(channel, pulse))
+        logger.debug('Setting servo %s pulse %s', channel, pulse)
         period_us = 1 / self._pwm_freq * 1000000
         pulse = int(pulse * 4096 / period_us)
         self.set_pwm(channel, pulse)
@@ -0,0 +1,181 @@
+
+import logging
+import subprocess
+from types import ModuleType
+from typing import Optional, Callable
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+
+def _no_op(*_args, **_kwargs):
+    pass
+
+
+class NullGpio:
+    """No-op replacement of the RPi.GPIO module. Inputs read as 2, the value
+    of GpioState.UNKNOWN.
+    """
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    setmode = setwarnings = setup = cleanup = output = staticmethod(_no_op)
+    add_event_detect = remove_event_detect = staticmethod(_no_op)
+
+    @staticmethod
+    def input(_channel) -> int:
+        return 2
+
+    @staticmethod
+    def PWM(_channel, _frequency) -> 'NullPwm':
+        return NullPwm()
+
+
+class NullPwm:
+    """No-op replacement of RPi.GPIO.PWM."""
+    start = stop = ChangeDutyCycle = ChangeFrequency = staticmethod(_no_op)
+
+
+class NullSMBus:
+    """No-op replacement of the smbus module. Reads return zeros."""
+    write_byte_data = write_i2c_block_data = staticmethod(_no_op)
+
+    def SMBus(self, _bus=None) -> 'NullSMBus':
+        return self
+
+    @staticmethod
+    def read_byte_data(_address, _register) -> int:
+        return 0
+
+    @staticmethod
+    def read_i2c_block_data(_address, _register, length=32):
+        return [0] * length
+
+
+class NullPixelStrip:
+    """No-op replacement of rpi_ws281x.PixelStrip."""
+    def __init__(self, num, *_args, **_kwargs):
+        self._num = num
+
+    begin = setPixelColorRGB = setBrightness = show = staticmethod(_no_op)
+
+    def numPixels(self) -> int:
+        return self._num
+
+
+class NullRpiWs281x:
+    """No-op replacement of the rpi_ws281x module."""
+    PixelStrip = NullPixelStrip
+
+
+class Backend:
+    """The libraries through which the hardware classes access the hardware.
+
+    Each library is either the actual module, or an object with the same
+    interface, e.g. a simulation, see simulator.SimulatedBackend. A missing
+    GPIO, I2C, or LED library is replaced by a no-op null object, after a
+    single warning, so that the hardware classes need no checks for it. A
+    missing picamera is None.
+    """
+    def __init__(self, gpio: Optional[ModuleType] = None,
+                 smbus: Optional[ModuleType] = None,
+                 picamera: Optional[ModuleType] = None,
+                 rpi_ws281x: Optional[ModuleType] = None,
+                 reboot: Optional[Callable[[], None]] = None):
+        """
+        Parameters
+        ----------
+        gpio
+            Replacement of the RPi.GPIO module.
+        smbus
+            Replacement of the smbus module.
+        picamera
+            Replacement of the picamera module.
+        rpi_ws281x
+            Replacement of the rpi_ws281x module.
+        reboot
+            Function for rebooting the system.
+        """
+        # Names of the libraries replaced by null objects
+        self.missing_libraries = tuple(
+            name for (name, library) in (
+                ('RPi.GPIO', gpio), ('smbus', smbus), ('rpi_ws281x', rpi_ws281x))
+            if library is None)
+        if self.missing_libraries:
+            logger.warning(f'{self.name} is missing {", ".join(self.missing_libraries)}. '
+                           f'The respective hardware will have no physical '
+                           f'functionality.')
+
+        self.gpio = gpio if gpio is not None else NullGpio()
+        self.smbus = smbus if smbus is not None else NullSMBus()
+        self.picamera = picamera
+        self.rpi_ws281x = rpi_ws281x if rpi_ws281x is not None else NullRpiWs281x()
+        self._reboot = reboot
+
+        # Set general settings before the channels are used.
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setwarnings(False)
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def reboot(self):
+        if self._reboot is not None:
+            self._reboot()
+        else:
+            logger.warning(f'{self.name} cannot reboot the system.')
+
+
+def _reboot_raspberry_pi():
+    subprocess.run(['sudo', 'reboot'])
+
+
+class RaspberryPiBackend(Backend):
+    """The actual hardware libraries of the Raspberry Pi, those of which are
+    installed.
+    """
+    def __init__(self):
+        try:
+            import RPi.GPIO as gpio
+        except ModuleNotFoundError:
+            gpio = None
+        try:
+            import smbus
+        except ModuleNotFoundError:
+            smbus = None
+        try:
+            import picamera
+        except ModuleNotFoundError:
+            picamera = None
+        try:
+            import rpi_ws281x
+        except ModuleNotFoundError:
+            rpi_ws281x = None
+
+        super().__init__(gpio=gpio, smbus=smbus, picamera=picamera,
+                         rpi_ws281x=rpi_ws281x, reboot=_reboot_raspberry_pi)
+
+
+_default_backend: Optional[Backend] = None
+
+
+def default_backend() -> Backend:
+    """The backend used by the hardware classes when none is given. Created
+    on the first call.
+    """
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = RaspberryPiBackend()
+    return _default_backend
@@ -1,13 +1,16 @@
 
 import asyncio as aio
+from typing import Optional
 
+from .backend import Backend
 from .bcm_channel import BcmChannel
 from .gpio import GpioOutput, GpioState
 
 
 class Buzzer:
-    def __init__(self):
-        self._output = GpioOutput(BcmChannel.buzzer, initial=GpioState.LOW)
+    def __init__(self, backend: Optional[Backend] = None):
+        self._output = GpioOutput(
+            BcmChannel.buzzer, initial=GpioState.LOW, backend=backend)
         self._on = False
 
     @property
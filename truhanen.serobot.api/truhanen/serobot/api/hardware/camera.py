@@ -2,22 +2,109 @@
 from functools import partial
 import asyncio as aio
 import logging
-from typing import Union
+import threading
+from typing import Union, Tuple, AsyncIterator, Optional
 
 from ._pca import PCA  # PCA9685 driver from the AlphaBot2 demo package
-try:
-    import picamera
-except ModuleNotFoundError:
-    picamera = None
+from .backend import Backend, default_backend
+from .metrics import metrics_registry
+from .scheduler import hardware_scheduler
 
 
 logger = logging.getLogger(__name__)
 
+_streamed_frame_counter = metrics_registry.counter(
+    'serobot_camera_frames_total',
+    'Pictures captured by Camera.async_stream_pictures().')
+_dropped_frame_counter = metrics_registry.counter(
+    'serobot_camera_dropped_frames_total',
+    'Pictures of Camera.async_stream_pictures() replaced by a newer one '
+    'before being consumed.')
+_streamed_byte_counter = metrics_registry.counter(
+    'serobot_camera_bytes_total',
+    'Bytes of the pictures captured by Camera.async_stream_pictures().')
+
+
+class PictureBufferPool:
+    """Pool of reusable buffers for encoded pictures.
+
+    A buffer is handed out again only when no memoryviews of it exist, i.e.
+    when every consumer of the previous picture in it has released its view.
+    """
+    def __init__(self, buffer_size: int, max_buffer_count: int = 8):
+        """
+        Parameters
+        ----------
+        buffer_size : int
+            Initial size of each buffer, in bytes. A buffer grows if a
+            picture does not fit into it.
+        max_buffer_count : int
+            The maximum number of buffers kept in the pool. If all of them
+            are in use, unpooled buffers are created.
+        """
+        self._buffer_size = buffer_size
+        self._max_buffer_count = max_buffer_count
+        self._buffers = []
+
+    @staticmethod
+    def _is_exported(buffer: bytearray) -> bool:
+        # A bytearray cannot be resized while memoryviews of it exist.
+        try:
+            buffer.append(0)
+        except BufferError:
+            return True
+        del buffer[-1]
+        return False
+
+    def acquire(self) -> bytearray:
+        """Return a buffer that is not in use."""
+        for buffer in self._buffers:
+            if not self._is_exported(buffer):
+                return buffer
+        buffer = bytearray(self._buffer_size)
+        if len(self._buffers) < self._max_buffer_count:
+            self._buffers.append(buffer)
+        return buffer
+
+
+class _PictureStreamOutput:
+    """File-like output for the MJPEG encoder of PiCamera. Collects the
+    encoder output of each picture to a pooled buffer.
+    """
+    def __init__(self, camera: 'picamera.PiCamera', callback,
+                 buffer_pool: PictureBufferPool):
+        self._camera = camera
+        self._callback = callback
+        self._buffer_pool = buffer_pool
+        self._buffer = buffer_pool.acquire()
+        self._length = 0
+
+    def write(self, data: bytes) -> int:
+        end = self._length + len(data)
+        # Grows the buffer only if the picture does not fit.
+        self._buffer[self._length:end] = data
+        self._length = end
+
+        # A picture may consist of several encoder output buffers.
+        if self._camera.frame.complete:
+            self._callback(memoryview(self._buffer)[:end])
+            self._buffer = self._buffer_pool.acquire()
+            self._length = 0
+
+        return len(data)
+
+    def flush(self):
+        pass
+
 
 class Camera:
     # I2C address of the camera pan/tilt control
     i2c_camera_servo_address = 0x40
 
+    # Device names for the hardware scheduler
+    io_device_camera = 'camera'
+    io_device_servos = 'camera_servos'
+
     pan_center_value = 1500  # Greater value is more left
     tilt_center_value = 1600  # Greater value is more down
     pan_min_value = 1000  # Was 600
@@ -25,17 +112,31 @@ class Camera:
     tilt_min_value = 1000  # Was 700
     tilt_max_value = 2000  # Was 2000
 
-    def __init__(self):
+    # Camera framerate used for still pictures
+    framerate = 5
+
+    # Servo motion towards the target position
+    servo_update_rate = 50  # Hz
+    servo_max_velocity = 1000  # Pan/tilt value units per second
+
+    def __init__(self, backend: Optional[Backend] = None):
+        backend = backend or default_backend()
         # These will be initialized by the setters
         self._pan_value = None
         self._tilt_value = None
-        self._pwm = PCA(self.i2c_camera_servo_address)
+        self._pan_target = None
+        self._tilt_target = None
+        self._pwm = PCA(self.i2c_camera_servo_address, backend=backend)
+        # Task moving the servos towards the targets, see move_to().
+        self._servo_motion_task: Optional[aio.Task] = None
 
+        picamera = backend.picamera
         if picamera is not None:
             # Setup camera.
             # Resolution 1640x1232, 4:3, full FOV, 2x2 binning.
             # Use low framerate for better low-light images.
-            self._camera = picamera.PiCamera(resolution=(1640, 1232), framerate=5)
+            self._camera = picamera.PiCamera(
+                resolution=(1640, 1232), framerate=self.framerate)
 
             # Set camera settings.
             self._camera.exposure_mode = 'night'  # Good for indoors
@@ -70,10 +171,19 @@ class Camera:
 
     @pan_value.setter
     def pan_value(self, value):
-        value = max(min(value, self.pan_max_value), self.pan_min_value)
+        value = self._clamp_pan_value(value)
         self._pan_value = value
+        self._pan_target = value
         self._pwm.set_servo_pulse(0, value)
 
+    def _clamp_pan_value(self, value):
+        return max(min(value, self.pan_max_value), self.pan_min_value)
+
+    @property
+    def pan_target(self):
+        """The pan value towards which the camera is moving, see move_to()."""
+        return self._pan_target
+
     @property
     def tilt_value(self):
         """
@@ -85,14 +195,78 @@ class Camera:
 
     @tilt_value.setter
     def tilt_value(self, value):
-        value = max(min(value, self.tilt_max_value), self.tilt_min_value)
+        value = self._clamp_tilt_value(value)
         self._tilt_value = value
+        self._tilt_target = value
         self._pwm.set_servo_pulse(1, value)
 
+    def _clamp_tilt_value(self, value):
+        return max(min(value, self.tilt_max_value), self.tilt_min_value)
+
+    @property
+    def tilt_target(self):
+        """The tilt value towards which the camera is moving, see move_to()."""
+        return self._tilt_target
+
     def set_to_center(self):
         self.pan_value = self.pan_center_value
         self.tilt_value = self.tilt_center_value
 
+    def move_to(self, pan=None, tilt=None):
+        """Set the target position of the camera and start moving towards it.
+
+        The servos are moved smoothly by a background task, at most
+        servo_max_velocity and servo_update_rate times per second. Only the
+        latest target is applied, so this can be called at any rate. Must be
+        called from the running event loop.
+
+        Parameters
+        ----------
+        pan : Number | None
+            The target pan value. If None, the pan target is not changed.
+        tilt : Number | None
+            The target tilt value. If None, the tilt target is not changed.
+        """
+        if pan is not None:
+            self._pan_target = self._clamp_pan_value(pan)
+        if tilt is not None:
+            self._tilt_target = self._clamp_tilt_value(tilt)
+        if self._servo_motion_task is None or self._servo_motion_task.done():
+            self._servo_motion_task = aio.create_task(self._servo_motion_worker())
+
+    def move_to_center(self):
+        """See move_to()."""
+        self.move_to(self.pan_center_value, self.tilt_center_value)
+
+    def _set_servo_values(self, pan, tilt):
+        """Set the servo positions without changing the targets."""
+        if pan != self._pan_value:
+            self._pan_value = pan
+            self._pwm.set_servo_pulse(0, pan)
+        if tilt != self._tilt_value:
+            self._tilt_value = tilt
+            self._pwm.set_servo_pulse(1, tilt)
+
+    async def _servo_motion_worker(self):
+        """Coroutine for moving the servos towards the targets."""
+        def step(value, target):
+            return value + max(-max_step, min(max_step, target - value))
+
+        max_step = round(self.servo_max_velocity / self.servo_update_rate)
+        while (self._pan_value != self._pan_target
+               or self._tilt_value != self._tilt_target):
+            await hardware_scheduler.run(
+                self.io_device_servos, self._set_servo_values,
+                step(self._pan_value, self._pan_target),
+                step(self._tilt_value, self._tilt_target))
+            await aio.sleep(1 / self.servo_update_rate)
+
+    async def _wait_servo_motion(self):
+        """Wait until the servos have reached the targets."""
+        if self._servo_motion_task is not None:
+            # Do not cancel the motion if the waiting is cancelled.
+            await aio.shield(self._servo_motion_task)
+
     def take_picture(self, output, **kwargs):
         """Take a picture with the camera"""
         if self.camera is not None:
@@ -100,18 +274,125 @@ class Camera:
         else:
             logger.warning('Picture not taken due to missing picamera.')
 
+    def stream_pictures(self, callback, stop_event: threading.Event,
+                        framerate: int, resize: Tuple[int, int], **kwargs):
+        """Record MJPEG pictures continuously from the video port of the
+        camera until stop_event is set. Blocks the calling thread.
+
+        The pictures are encoded by the hardware encoder of the camera, and
+        the encoder output is collected to reusable buffers. The callback is
+        called from a camera thread.
+
+        Parameters
+        ----------
+        callback : Callable[[memoryview], Any]
+            Function called with a view to each encoded picture. The view
+            should be released when no longer needed, so that the underlying
+            buffer can be reused.
+        stop_event : threading.Event
+            Stop capturing when this is set.
+        framerate : int
+            The camera framerate to be used during the capture.
+        resize : Tuple[int, int]
+            The resolution of the pictures.
+        **kwargs : Any
+            Keyword arguments to be passed to PiCamera.start_recording(),
+            e.g. quality.
+        """
+        if self.camera is None:
+            logger.warning('Pictures not streamed due to missing picamera.')
+            return
+
+        # Most JPEG pictures fit into one byte per pixel.
+        buffer_pool = PictureBufferPool(resize[0] * resize[1])
+        output = _PictureStreamOutput(self.camera, callback, buffer_pool)
+        self.camera.framerate = framerate
+        self.camera.start_recording(
+            output, format='mjpeg', resize=resize, **kwargs)
+        try:
+            while not stop_event.is_set():
+                # Raises if there was an error in the encoder.
+                self.camera.wait_recording(.5)
+        finally:
+            self.camera.stop_recording()
+            self.camera.framerate = self.framerate
+
     async def async_set_pan_value(self, value):
-        return await aio.get_running_loop().run_in_executor(
-            None, setattr, self, 'pan_value', value)
+        """Move smoothly to the pan value, see move_to()."""
+        self.move_to(pan=value)
+        await self._wait_servo_motion()
 
     async def async_set_tilt_value(self, value):
-        return await aio.get_running_loop().run_in_executor(
-            None, setattr, self, 'tilt_value', value)
+        """Move smoothly to the tilt value, see move_to()."""
+        self.move_to(tilt=value)
+        await self._wait_servo_motion()
 
     async def async_set_to_center(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.set_to_center)
+        """Move smoothly to the center, see move_to()."""
+        self.move_to_center()
+        await self._wait_servo_motion()
 
     async def async_take_picture(self, *args, **kwargs):
-        return await aio.get_running_loop().run_in_executor(
-            None, partial(self.take_picture, *args, **kwargs))
+        return await hardware_scheduler.run(
+            self.io_device_camera, partial(self.take_picture, *args, **kwargs))
+
+    async def async_stream_pictures(
+            self, resize: Tuple[int, int] = (640, 480), framerate: int = 20,
+            **kwargs) -> AsyncIterator[memoryview]:
+        """Iterator for yielding JPEG pictures captured continuously by the
+        camera.
+
+        The camera pipeline is kept open for the whole iteration, and the
+        pictures are encoded by the MJPEG encoder of the camera. The yielded
+        pictures are memoryviews to reusable buffers and are not copied
+        after encoding. They must not be modified. If the iteration does not
+        keep up with the camera, the older pictures are dropped so that the
+        newest picture is always yielded next.
+
+        Parameters
+        ----------
+        resize : Tuple[int, int]
+            The resolution of the pictures.
+        framerate : int
+            The camera framerate to be used while streaming.
+        **kwargs : Any
+            Additional keyword arguments to be passed to
+            PiCamera.start_recording().
+        """
+        loop = aio.get_running_loop()
+        pictures = aio.Queue(maxsize=1)
+
+        def put_picture(picture):
+            # Replace a picture that has not been consumed yet.
+            if pictures.full():
+                pictures.get_nowait()
+                _dropped_frame_counter.inc()
+            pictures.put_nowait(picture)
+            if picture is not None:
+                _streamed_frame_counter.inc()
+                _streamed_byte_counter.inc(len(picture))
+
+        def stream_pictures():
+            try:
+                self.stream_pictures(
+                    lambda picture: loop.call_soon_threadsafe(
+                        put_picture, picture),
+                    stop_event, framerate, resize, **kwargs)
+            finally:
+                # Tell the iterator that no more pictures will arrive.
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(put_picture, None)
+
+        stop_event = threading.Event()
+        thread = threading.Thread(target=stream_pictures, daemon=True)
+        thread.start()
+        try:
+            while True:
+                picture = await pictures.get()
+                if picture is None:
+                    break
+                yield picture
+                # Allow the buffer to be reused.
+                del picture
+        finally:
+            stop_event.set()
@@ -1,43 +1,129 @@
 
+from collections import deque
+import statistics
+import threading
 import time
 import asyncio as aio
+from typing import Optional
 
+from .backend import Backend
 from .bcm_channel import BcmChannel
-from .gpio import GpioOutput, GpioInput, GpioState
+from .gpio import GpioOutput, GpioInput, GpioState, GpioEdge, GpioEdgeEvent
+from .scheduler import hardware_scheduler, Priority
 
 
 class DistanceSensor:
-    def __init__(self):
-        self._emitter = GpioOutput(BcmChannel.ultrasonic_emitter, initial=GpioState.LOW)
-        self._sensor = GpioInput(BcmChannel.ultrasonic_sensor)
+    # Device name for the hardware scheduler
+    io_device = 'distance_sensor'
+
+    sound_velocity = 343  # m/s
+    # Maximum time to wait for the echo, in seconds.
+    # Covers well the maximum range of the sensor.
+    echo_timeout = .1
+
+    def __init__(self, backend: Optional[Backend] = None):
+        self._emitter = GpioOutput(
+            BcmChannel.ultrasonic_emitter, initial=GpioState.LOW, backend=backend)
+        self._sensor = GpioInput(BcmChannel.ultrasonic_sensor, backend=backend)
+
+        # Times of the rising and the falling edge of the echo signal of the
+        # current measurement, set by _on_echo_edge(), and the event set when
+        # both are recorded. None between the measurements.
+        self._echo_start: Optional[float] = None
+        self._echo_end: Optional[float] = None
+        self._echo_received: Optional[threading.Event] = None
+        # Guards the above against the event thread.
+        self._echo_lock = threading.Lock()
+        # Only one measurement can be done at a time.
+        self._measurement_lock = threading.Lock()
+        self._sensor.add_edge_callback(self._on_echo_edge, GpioEdge.BOTH)
+
+    def _on_echo_edge(self, edge: GpioEdgeEvent):
+        """Record the time of an edge of the echo signal. Called from the
+        event thread of RPi.GPIO.
+        """
+        with self._echo_lock:
+            if self._echo_received is None or self._echo_received.is_set():
+                return
+            if edge.state == GpioState.HIGH:
+                self._echo_start = edge.timestamp
+            elif edge.state == GpioState.LOW and self._echo_start is not None:
+                # The echo is received when the signal has risen and fallen.
+                # A falling edge without a rising one is left from before
+                # the measurement.
+                self._echo_end = edge.timestamp
+                self._echo_received.set()
 
     def get_distance(self):
+        """Measure the distance to an obstacle.
+
+        The echo signal is timed with GPIO edge events, so the waiting does
+        not consume CPU.
+
+        Returns
+        -------
+        distance : float
+            The distance in meters. -1 if no echo was received, and 0 if the
+            sensor could not be read.
+        """
         if self._sensor.state == GpioState.UNKNOWN:
             return 0
 
-        # Emit sound.
-        emit_time = time.time()
-        self._emitter.state = GpioState.HIGH
-        time.sleep(.000015)
-        self._emitter.state = GpioState.LOW
+        with self._measurement_lock:
+            echo_received = threading.Event()
+            with self._echo_lock:
+                self._echo_start = self._echo_end = None
+                self._echo_received = echo_received
 
-        # Wait that the primary wave is not detected anymore.
-        while self._sensor.state == GpioState.LOW:
-            # Guard against faults.
-            if time.time() - emit_time >= 1:
-                return -1
+            # Emit sound.
+            self._emitter.state = GpioState.HIGH
+            time.sleep(.000015)
+            self._emitter.state = GpioState.LOW
 
-        # Measure the time it takes for the reflected sound to return
-        while self._sensor.state == GpioState.HIGH:
-            # Guard against faults.
-            if time.time() - emit_time >= 1:
+            received = echo_received.wait(self.echo_timeout)
+            with self._echo_lock:
+                # The echo signal is high for the round trip time of the sound.
+                echo_start, echo_end = self._echo_start, self._echo_end
+                self._echo_received = None
+            if not received:
                 return -1
 
-        return_time = time.time()
-
         # total_distance = time * sound_velocity
-        return (return_time - emit_time) * 343 / 2
+        return (echo_end - echo_start) * self.sound_velocity / 2
+
+    async def async_get_distance(self, priority=Priority.NORMAL):
+        return await hardware_scheduler.run(
+            self.io_device, self.get_distance, priority=priority)
+
+    async def async_read_distances(self, period=.1, filter_size=5):
+        """Iterator for yielding distances measured continuously at a fixed
+        rate.
+
+        Parameters
+        ----------
+        period : Number
+            The interval between the measurements, in seconds.
+        filter_size : int
+            The number of the latest valid measurements whose median is
+            yielded. Filters out spurious echoes.
+
+        Yields
+        ------
+        distance : float
+            See get_distance().
+        """
+        distances = deque(maxlen=filter_size)
+        loop = aio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            distance = await self.async_get_distance(priority=Priority.LOW)
+            if distance > 0:
+                distances.append(distance)
+            if distances:
+                yield statistics.median(distances)
+            else:
+                yield distance
 
-    async def async_get_distance(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.get_distance)
+            # Keep the rate fixed regardless of the measurement time.
+            next_time = max(next_time + period, loop.time())
+            await aio.sleep(next_time - loop.time())
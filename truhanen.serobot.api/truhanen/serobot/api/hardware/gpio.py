@@ -1,45 +1,56 @@
-
-from enum import IntEnum, auto
+import asyncio as aio
+from dataclasses import dataclass
+from enum import IntEnum
 import logging
-from typing import Optional, List
-
-try:
-    import RPi.GPIO as GPIO
-except ModuleNotFoundError:
-    GPIO = None
+import time
+from typing import Optional, List, Callable, AsyncIterator, Tuple
 
+from .backend import Backend, default_backend
 from .bcm_channel import BcmChannel
 
 
+# The values of the enums below are those of the respective RPi.GPIO
+# constants, which the backends should also use.
+
 class GpioDirection(IntEnum):
-    IN = GPIO.IN if GPIO is not None else auto()
-    OUT = GPIO.OUT if GPIO is not None else auto()
+    IN = 1
+    OUT = 0
 
 
 class GpioState(IntEnum):
-    HIGH = GPIO.HIGH if GPIO is not None else auto()
-    LOW = GPIO.LOW if GPIO is not None else auto()
+    HIGH = 1
+    LOW = 0
     # This tells e.g. that a GPIO state could not be read.
-    UNKNOWN = 2 if GPIO is not None else auto()
+    UNKNOWN = 2
 
 
 class GpioPull(IntEnum):
-    OFF = GPIO.PUD_OFF if GPIO is not None else auto()
-    DOWN = GPIO.PUD_DOWN if GPIO is not None else auto()
-    UP = GPIO.PUD_UP if GPIO is not None else auto()
+    OFF = 20
+    DOWN = 21
+    UP = 22
+
+
+class GpioEdge(IntEnum):
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+
+@dataclass(frozen=True)
+class GpioEdgeEvent:
+    """Edge of a GPIO input signal."""
+    # The state of the input after the edge
+    state: GpioState
+    # Time of the edge, in seconds of time.monotonic()
+    timestamp: float
 
 
 # Module-level logger
 logger = logging.getLogger(__name__)
 
-
-if GPIO is not None:
-    # Set general settings whenever this module is used.
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-else:
-    logger.warning('Module RPi.GPIO is missing. General GPIO settings were '
-                   'not applied.')
+# The states indexed by their values, for converting the values read from the
+# GPIO library without the cost of calling the enum.
+_states_by_value = tuple(sorted(GpioState, key=int))
 
 
 class GpioSetup:
@@ -47,82 +58,186 @@ class GpioSetup:
     def __init__(self, bcm_channel: BcmChannel,
                  direction: GpioDirection,
                  pull: Optional[GpioPull] = None,
-                 initial: Optional[GpioState] = None):
+                 initial: Optional[GpioState] = None,
+                 backend: Optional[Backend] = None):
         self._channel = bcm_channel
-        if GPIO is not None:
-            # Create kwargs without None values.
-            kwargs = dict(direction=direction)
-            if pull is not None:
-                kwargs['pull_up_down'] = pull
-            if initial is not None:
-                kwargs['initial'] = initial
-            GPIO.setup(bcm_channel, **kwargs)
-        else:
-            logger.warning(f'Module RPi.GPIO is missing. Did not really '
-                           f'setup {bcm_channel!r}.')
+        # The plain channel number, which is cheaper to pass to the GPIO
+        # library than the enum.
+        self._pin = int(bcm_channel)
+        # The RPi.GPIO module or its replacement
+        self._gpio = (backend or default_backend()).gpio
+        # Create kwargs without None values.
+        kwargs = dict(direction=direction)
+        if pull is not None:
+            kwargs['pull_up_down'] = pull
+        if initial is not None:
+            kwargs['initial'] = initial
+        self._gpio.setup(self._pin, **kwargs)
 
     def __del__(self):
-        if GPIO is not None:
-            GPIO.cleanup(self.channel)
-        else:
-            logger.warning(f'Module RPi.GPIO is missing. Did not really '
-                           f'cleanup {self.channel!r}.')
+        self._gpio.cleanup(self._pin)
 
     @property
     def channel(self):
         return self._channel
 
+    @property
+    def gpio(self):
+        """The RPi.GPIO module or its replacement used by this instance. A
+        no-op replacement if RPi.GPIO is missing, see backend.NullGpio.
+        """
+        return self._gpio
+
 
 class GpioInput(GpioSetup):
     """Class for managing a GPIO input channel."""
-    def __init__(self, bcm_channel: BcmChannel, pull: Optional[GpioPull] = None):
-        super().__init__(bcm_channel, direction=GpioDirection.IN, pull=pull)
+    def __init__(self, bcm_channel: BcmChannel, pull: Optional[GpioPull] = None,
+                 backend: Optional[Backend] = None):
+        super().__init__(bcm_channel, direction=GpioDirection.IN, pull=pull,
+                         backend=backend)
+        # Callbacks and their edge types, see add_edge_callback()
+        self._edge_callbacks: Tuple[Tuple[Callable, GpioEdge], ...] = ()
 
     @property
     def state(self) -> GpioState:
         """The state of the GPIO input pin."""
-        if GPIO is not None:
-            state = GpioState(GPIO.input(self.channel))
-        else:
-            logger.info(f'Module RPi.GPIO is missing. Did not really read '
-                        f'the state of {self.channel!r}.')
-            state = GpioState.UNKNOWN
-        return state
+        return _states_by_value[self._gpio.input(self._pin)]
+
+    def add_edge_callback(self, callback: Callable[[GpioEdgeEvent], None],
+                          edge: GpioEdge = GpioEdge.BOTH):
+        """Call a function on each detected edge of the input signal.
+
+        Any number of callbacks can be added. RPi.GPIO detects the edges of a
+        channel in its single event thread, from which this instance passes
+        them to each of the callbacks.
+
+        Parameters
+        ----------
+        callback : Callable[[GpioEdgeEvent], None]
+            Function to be called with the edge. It is called from the event
+            thread of RPi.GPIO, so it should return quickly.
+        edge : GpioEdge
+            The type of the edges to be passed to the callback.
+        """
+        # Replace instead of modifying, as the tuple is iterated in the event
+        # thread.
+        self._edge_callbacks = self._edge_callbacks + ((callback, edge),)
+        if len(self._edge_callbacks) == 1:
+            self._gpio.add_event_detect(
+                self._pin, GpioEdge.BOTH, callback=self._on_edge)
+
+    def remove_edge_callback(self, callback: Callable[[GpioEdgeEvent], None]):
+        """Stop calling a function added by add_edge_callback()."""
+        if not self._edge_callbacks:
+            return
+        self._edge_callbacks = tuple(
+            (other, edge) for (other, edge) in self._edge_callbacks
+            if other != callback)
+        if not self._edge_callbacks:
+            self._gpio.remove_event_detect(self._pin)
+
+    def _on_edge(self, _channel, timestamp: Optional[float] = None):
+        """Pass an edge to the callbacks. Called from the event thread of
+        RPi.GPIO.
+
+        Parameters
+        ----------
+        timestamp : float | None
+            The time of the edge, given by simulated backends. By default
+            the time of the call.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        event = GpioEdgeEvent(_states_by_value[self._gpio.input(self._pin)], timestamp)
+        for callback, edge in self._edge_callbacks:
+            if (edge == GpioEdge.BOTH
+                    or (edge == GpioEdge.RISING) == (event.state == GpioState.HIGH)):
+                callback(event)
+
+    async def edges(self, edge: GpioEdge = GpioEdge.BOTH, debounce: float = 0.,
+                    max_pending: int = 64) -> AsyncIterator[GpioEdgeEvent]:
+        """Iterator for yielding the edges of the input signal.
+
+        The edges are passed from the event thread of RPi.GPIO to the
+        running event loop. Edges that do not change the state, e.g. because
+        of contact bounce faster than the detection, are skipped.
+
+        Parameters
+        ----------
+        edge : GpioEdge
+            The type of the edges to be yielded.
+        debounce : float
+            If positive, an edge is yielded only after the state has stayed
+            the same for this many seconds. The timestamp is that of the last
+            edge, i.e. the one after which the state settled.
+        max_pending : int
+            Maximum number of edges waiting to be consumed. The oldest ones
+            are dropped first.
+
+        Yields
+        ------
+        edge : GpioEdgeEvent
+        """
+        loop = aio.get_running_loop()
+        events = aio.Queue(maxsize=max_pending)
+        last_state = self.state
+        settle_timer: Optional[aio.TimerHandle] = None
+
+        def put_event(event: GpioEdgeEvent):
+            nonlocal last_state
+            if event.state == last_state:
+                return
+            last_state = event.state
+            if (edge == GpioEdge.BOTH
+                    or (edge == GpioEdge.RISING) == (event.state == GpioState.HIGH)):
+                if events.full():
+                    events.get_nowait()
+                events.put_nowait(event)
+
+        def on_event(event: GpioEdgeEvent):
+            nonlocal settle_timer
+            if debounce <= 0:
+                put_event(event)
+                return
+            if settle_timer is not None:
+                settle_timer.cancel()
+            settle_timer = loop.call_later(debounce, put_event, event)
+
+        def callback(event: GpioEdgeEvent):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(on_event, event)
+
+        self.add_edge_callback(callback)
+        try:
+            while True:
+                yield await events.get()
+        finally:
+            self.remove_edge_callback(callback)
+            if settle_timer is not None:
+                settle_timer.cancel()
 
 
 class GpioOutput(GpioSetup):
     """Class for managing a GPIO output channel."""
-    def __init__(self, bcm_channel: BcmChannel, initial: Optional[GpioState] = None):
-        super().__init__(bcm_channel, direction=GpioDirection.OUT, initial=initial)
+    def __init__(self, bcm_channel: BcmChannel, initial: Optional[GpioState] = None,
+                 backend: Optional[Backend] = None):
+        super().__init__(bcm_channel, direction=GpioDirection.OUT, initial=initial,
+                         backend=backend)
 
     @property
     def state(self) -> GpioState:
         """The state of the GPIO output pin."""
-        if GPIO is not None:
-            state = GpioState(GPIO.input(self.channel))
-        else:
-            logger.info(f'Module RPi.GPIO is missing. Did not really read '
-                        f'the state of {self.channel!r}.')
-            state = GpioState.UNKNOWN
-        return state
+        return _states_by_value[self._gpio.input(self._pin)]
 
     @state.setter
     def state(self, value: GpioState):
-        if GPIO is not None:
-            GPIO.output(self.channel, value)
-        else:
-            logger.info(f'Module RPi.GPIO is missing. Did not physically change '
-                        f'the state of {self.channel!r}.')
+        self._gpio.output(self._pin, value)
 
     @classmethod
     def set_multiple(cls, outputs: List['GpioOutput'], states: List[GpioState]):
         """Set the states of multiple GPIO outputs with a single call."""
-        channels = [output.channel for output in outputs]
-        if GPIO is not None:
-            GPIO.output(channels, states)
-        else:
-            logger.info(f'Module RPi.GPIO is missing. Did not physically change '
-                        f'the states of {channels!r}.')
+        if outputs:
+            outputs[0].gpio.output([output._pin for output in outputs], states)
 
 
 class GpioPwm(GpioSetup):
@@ -130,7 +245,8 @@ class GpioPwm(GpioSetup):
     def __init__(self, bcm_channel: BcmChannel,
                  initial: Optional[GpioState] = None,
                  frequency: int = 1,
-                 duty_cycle: int = 100):
+                 duty_cycle: int = 100,
+                 backend: Optional[Backend] = None):
         """
         Parameters
         ----------
@@ -142,16 +258,15 @@ class GpioPwm(GpioSetup):
             The initial frequency of the PWM, in Hertz.
         duty_cycle
             The initial duty cycle of the PWM, as percentage.
+        backend
+            The backend providing the GPIO library. Defaults to
+            default_backend().
         """
-        super().__init__(bcm_channel, direction=GpioDirection.OUT, initial=initial)
+        super().__init__(bcm_channel, direction=GpioDirection.OUT, initial=initial,
+                         backend=backend)
         self._frequency = frequency
         self._duty_cycle = duty_cycle
-        if GPIO is not None:
-            self._pwm = GPIO.PWM(self.channel, frequency)
-        else:
-            logger.warning(f'Module RPi.GPIO is missing. Did not really '
-                           f'setup the PWM for {bcm_channel!r}.')
-            self._pwm = None
+        self._pwm = self._gpio.PWM(self._pin, frequency)
 
     @property
     def frequency(self) -> float:
@@ -160,11 +275,7 @@ class GpioPwm(GpioSetup):
     @frequency.setter
     def frequency(self, value: float):
         self._frequency = value
-        if self._pwm is not None:
-            self._pwm.ChangeFrequency(value)
-        else:
-            logger.info(f'The PWM instance is missing. Did not physically change '
-                        f'the frequency of the PWM in {self.channel!r}.')
+        self._pwm.ChangeFrequency(value)
 
     @property
     def duty_cycle(self) -> float:
@@ -173,22 +284,10 @@ class GpioPwm(GpioSetup):
     @duty_cycle.setter
     def duty_cycle(self, value: float):
         self._duty_cycle = value
-        if self._pwm is not None:
-            self._pwm.ChangeDutyCycle(value)
-        else:
-            logger.info(f'The PWM instance is missing. Did not physically change '
-                        f'the duty cycle of the PWM in {self.channel!r}.')
+        self._pwm.ChangeDutyCycle(value)
 
     def start(self):
-        if self._pwm is not None:
-            self._pwm.start(self.duty_cycle)
-        else:
-            logger.info(f'The PWM instance is missing. Did not physically '
-                        f'start the PWM in {self.channel!r}.')
+        self._pwm.start(self._duty_cycle)
 
     def stop(self):
-        if self._pwm is not None:
-            self._pwm.stop()
-        else:
-            logger.info(f'The PWM instance is missing. Did not physically '
-                        f'stop the PWM in {self.channel!r}.')
+        self._pwm.stop()
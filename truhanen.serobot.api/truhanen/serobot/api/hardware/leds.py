@@ -1,14 +1,15 @@
 
+from array import array
+import colorsys
 from enum import Enum
 import asyncio as aio
 import logging
+import math
+from typing import Optional, Callable, List
 
-try:
-    import rpi_ws281x
-except ModuleNotFoundError:
-    rpi_ws281x = None
-
+from .backend import Backend, NullPixelStrip, default_backend
 from .bcm_channel import BcmChannel
+from .scheduler import hardware_scheduler
 
 
 # Module-level logger
@@ -30,26 +31,40 @@ class Leds:
     led_count = 4
     dma = 10  # DMA channel
     default_on_brightness = 50
+    # Device name for the hardware scheduler
+    io_device = 'leds'
+    # Maximum rate of showing the requested changes, see request_rgb()
+    refresh_rate = 30  # Hz
 
-    def __init__(self):
+    def __init__(self, backend: Optional[Backend] = None):
         self._brightness = None
         self._rgb_values = [None] * self.led_count
 
+        # Requested changes not yet shown, see request_rgb()
+        self._pending_rgb = None
+        self._pending_brightness = None
+        # Resolved when the pending changes have been shown
+        self._frame_shown: Optional[aio.Future] = None
+        self._render_task: Optional[aio.Task] = None
+
+        # The animation being played, see play_animation()
+        self._animation: Optional[LedAnimation] = None
+        self._animation_start = None
+        self._animation_frame = None
+        # Resolved when the animation ends or is stopped
+        self._animation_done: Optional[aio.Future] = None
+
         # Initialize the LED interface.
-        failed_message = 'The Leds instance will have no physical functionality.'
-        if rpi_ws281x is not None:
-            try:
-                self._leds = rpi_ws281x.PixelStrip(
-                    self.led_count, BcmChannel.leds, dma=self.dma)
-                self._leds.begin()
-            except RuntimeError:
-                logger.warning(
-                    'Could not initialize rpi_ws281.PixelStrip. You may have '
-                    'to run as root. ' + failed_message)
-                self._leds = None
-        else:
-            logger.warning('Module rpi_ws281x is missing. ' + failed_message)
-            self._leds = None
+        try:
+            self._leds = (backend or default_backend()).rpi_ws281x.PixelStrip(
+                self.led_count, BcmChannel.leds, dma=self.dma)
+            self._leds.begin()
+        except RuntimeError:
+            logger.warning(
+                'Could not initialize rpi_ws281.PixelStrip. You may have '
+                'to run as root. The Leds instance will have no physical '
+                'functionality.')
+            self._leds = NullPixelStrip(self.led_count)
 
         self.brightness = 0
         self.rgb = RgbValue.WHITE
@@ -61,10 +76,7 @@ class Leds:
 
     def show(self):
         """Apply the changes made by the set methods."""
-        if self._leds is not None:
-            self._leds.show()
-        else:
-            logger.info('Leds not fully initialized. Display not physically updated.')
+        self._leds.show()
 
     @property
     def rgb(self):
@@ -87,22 +99,10 @@ class Leds:
             contain four values, one for each LED, from the rightmost to the
             leftmost.
         """
-        # Broadcast if a single value is given.
-        if isinstance(value, RgbValue):
-            value = [value] * self.led_count
-        elif isinstance(value, tuple):
-            value = [value] * self.led_count
-
-        # Convert RgbValues to tuples.
-        value = [v.value if isinstance(v, RgbValue) else v for v in value]
-
         # Set values.
-        for position, rgb in enumerate(value):
-            if self._leds is not None:
-                self._leds.setPixelColorRGB(position, *rgb)
+        for position, rgb in enumerate(_rgb_tuples(value, self.led_count)):
+            self._leds.setPixelColorRGB(position, *rgb)
             self._rgb_values[position] = rgb
-        if self._leds is None:
-            logger.info('Leds not fully initialized. RGB not physically changed.')
 
     @property
     def brightness(self):
@@ -122,11 +122,7 @@ class Leds:
         value : int
             Brightness value of the LEDs. Value range 0-255.
         """
-        if self._leds is not None:
-            self._leds.setBrightness(value)
-        else:
-            logger.info('Leds not fully initialized. Brightness not physically '
-                        'changed.')
+        self._leds.setBrightness(value)
         self._brightness = value
 
     @property
@@ -140,20 +136,274 @@ class Leds:
         else:
             self.brightness = 0
 
+    def request_rgb(self, value) -> aio.Future:
+        """Request the RGB value(s) to be set and shown in the next frame.
+
+        The requested changes are shown by a background task at most
+        refresh_rate times per second, and only the newest request of each
+        frame is shown. Returns immediately. Must be called from the running
+        event loop.
+
+        Parameters
+        ----------
+        value
+            See the rgb setter.
+
+        Returns
+        -------
+        frame_shown : asyncio.Future
+            Future resolved when the frame containing the change is shown.
+        """
+        # An explicitly requested colour replaces the animation.
+        self.stop_animation()
+        self._pending_rgb = value
+        return self._request_frame()
+
+    def request_brightness(self, value) -> aio.Future:
+        """Request the brightness to be set and shown in the next frame.
+        See request_rgb().
+        """
+        self._pending_brightness = value
+        return self._request_frame()
+
+    def _request_frame(self) -> aio.Future:
+        if self._frame_shown is None:
+            self._frame_shown = aio.get_running_loop().create_future()
+        if self._render_task is None or self._render_task.done():
+            self._render_task = aio.create_task(self._render_worker())
+        return self._frame_shown
+
+    def play_animation(self, animation: 'LedAnimation') -> aio.Future:
+        """Start playing an animation, replacing the previous one.
+
+        The frames are shown by the same background task as the requested
+        changes, see request_rgb(). Brightness requests apply on top of the
+        animation, whereas RGB requests stop it. Must be called from the
+        running event loop.
+
+        Parameters
+        ----------
+        animation : LedAnimation
+            The animation to be played.
+
+        Returns
+        -------
+        animation_done : asyncio.Future
+            Future resolved when the animation has played to its end, or when
+            it is stopped.
+        """
+        self.stop_animation()
+        loop = aio.get_running_loop()
+        self._animation = animation
+        self._animation_start = loop.time()
+        self._animation_frame = None
+        self._animation_done = loop.create_future()
+        if self._render_task is None or self._render_task.done():
+            self._render_task = aio.create_task(self._render_worker())
+        return self._animation_done
+
+    def stop_animation(self):
+        """Stop the animation being played, if any. The LEDs are left
+        showing the latest frame.
+        """
+        animation_done = self._animation_done
+        self._animation = None
+        self._animation_done = None
+        if animation_done is not None and not animation_done.done():
+            animation_done.set_result(None)
+
+    @property
+    def animation(self) -> Optional['LedAnimation']:
+        """The animation being played, or None."""
+        return self._animation
+
+    def _next_animation_frame(self) -> Optional[memoryview]:
+        """Return the animation frame to be shown now, or None if the frame
+        is already shown. Stops the animation after its last frame.
+        """
+        animation = self._animation
+        elapsed = aio.get_running_loop().time() - self._animation_start
+        index = int(elapsed * animation.frame_rate)
+        if index >= animation.frame_count:
+            if not animation.loop:
+                self.stop_animation()
+                return None
+            index %= animation.frame_count
+        if index == self._animation_frame:
+            return None
+        self._animation_frame = index
+        return animation.frame(index)
+
+    def _render(self, rgb, brightness, frame=None):
+        """Set and show the given values. None values are not changed."""
+        if frame is not None:
+            self._set_frame(frame)
+        if rgb is not None:
+            self.rgb = rgb
+        if brightness is not None:
+            self.brightness = brightness
+        self.show()
+
+    def _set_frame(self, frame: memoryview):
+        """Set the RGB values from an animation frame, see LedAnimation."""
+        set_pixel = self._leds.setPixelColorRGB
+        for position in range(self.led_count):
+            red, green, blue = frame[3 * position:3 * position + 3]
+            set_pixel(position, red, green, blue)
+            self._rgb_values[position] = (red, green, blue)
+
+    async def _render_worker(self):
+        """Coroutine for showing the requested changes and the animation
+        frames. Exits when there are no more requests and no animation.
+        """
+        while self._frame_shown is not None or self._animation is not None:
+            rgb, self._pending_rgb = self._pending_rgb, None
+            brightness, self._pending_brightness = self._pending_brightness, None
+            frame_shown, self._frame_shown = self._frame_shown, None
+            frame = (self._next_animation_frame()
+                     if self._animation is not None else None)
+
+            if frame_shown is not None or frame is not None:
+                try:
+                    await hardware_scheduler.run(
+                        self.io_device, self._render, rgb, brightness, frame)
+                except Exception as exception:
+                    if frame_shown is not None:
+                        frame_shown.set_exception(exception)
+                    else:
+                        logger.exception('Could not show an animation frame.')
+                else:
+                    if frame_shown is not None:
+                        frame_shown.set_result(None)
+
+            # Limit the refresh rate.
+            await aio.sleep(1 / self.refresh_rate)
+
     async def async_show(self):
-        return await aio.get_running_loop().run_in_executor(None, self.show)
+        return await hardware_scheduler.run(self.io_device, self.show)
 
     async def async_set_rgb(self, value):
-        await aio.get_running_loop().run_in_executor(
-            None, setattr, self, 'rgb', value)
-        return await self.async_show()
+        """See request_rgb()."""
+        await self.request_rgb(value)
 
     async def async_set_brightness(self, value):
-        await aio.get_running_loop().run_in_executor(
-            None, setattr, self, 'brightness', value)
-        return await self.async_show()
+        """See request_brightness()."""
+        await self.request_brightness(value)
 
     async def async_set_on(self, value):
-        await aio.get_running_loop().run_in_executor(
-            None, setattr, self, 'on', value)
-        return await self.async_show()
+        """See request_brightness()."""
+        await self.request_brightness(self.default_on_brightness if value else 0)
+
+    async def async_play_animation(self, animation: 'LedAnimation'):
+        """See play_animation()."""
+        await self.play_animation(animation)
+
+
+def _rgb_tuples(value, led_count: int) -> List[tuple]:
+    """Convert the value(s) accepted by the Leds.rgb setter to a list of RGB
+    tuples, one for each LED.
+    """
+    # Broadcast if a single value is given.
+    if isinstance(value, (RgbValue, tuple)):
+        value = [value] * led_count
+    # Convert RgbValues to tuples.
+    return [v.value if isinstance(v, RgbValue) else v for v in value]
+
+
+class LedAnimation:
+    """Animation of the LEDs, with the frames computed in advance.
+
+    The frames are stored in a single array of bytes, frame after frame,
+    with the RGB values of each LED from the rightmost to the leftmost.
+    Playing the animation only copies the bytes of a frame to the LEDs.
+    """
+    def __init__(self, frames: array, frame_rate: float = Leds.refresh_rate,
+                 loop: bool = True, led_count: int = Leds.led_count):
+        """
+        Parameters
+        ----------
+        frames : array.array
+            The frames, as an array of type 'B' with led_count * 3 values
+            for each frame.
+        frame_rate : float
+            The number of frames shown per second. Rates above
+            Leds.refresh_rate skip frames.
+        loop : bool
+            Whether to restart the animation after the last frame.
+        led_count : int
+            The number of LEDs in each frame.
+        """
+        frame_size = 3 * led_count
+        if frames.typecode != 'B' or not frames or len(frames) % frame_size:
+            raise ValueError(f'Frames should be a non-empty array of type B '
+                             f'with a multiple of {frame_size} values.')
+        self._frames = frames
+        self._frame_size = frame_size
+        self.frame_rate = frame_rate
+        self.loop = loop
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._frames) // self._frame_size
+
+    @property
+    def duration(self) -> float:
+        """Duration of a single playthrough, in seconds."""
+        return self.frame_count / self.frame_rate
+
+    def frame(self, index: int) -> memoryview:
+        """Return the RGB values of the LEDs in a frame, without copying."""
+        start = index * self._frame_size
+        return memoryview(self._frames)[start:start + self._frame_size]
+
+    @classmethod
+    def from_function(cls, function: Callable[[float], object], duration: float,
+                      frame_rate: float = Leds.refresh_rate, loop: bool = True,
+                      led_count: int = Leds.led_count) -> 'LedAnimation':
+        """Compute the frames of an animation from a function of time.
+
+        Parameters
+        ----------
+        function : Callable[[float], RgbValue | tuple | List[RgbValue] | List[tuple]]
+            Function returning the RGB value(s) of the LEDs at the given time
+            in seconds, see the Leds.rgb setter.
+        duration : float
+            Duration of the animation, in seconds.
+        """
+        frame_count = max(1, round(duration * frame_rate))
+        frames = array('B')
+        for index in range(frame_count):
+            for rgb in _rgb_tuples(function(index / frame_rate), led_count):
+                frames.extend(min(255, max(0, int(v))) for v in rgb)
+        return cls(frames, frame_rate=frame_rate, loop=loop, led_count=led_count)
+
+    @classmethod
+    def blink(cls, rgb=RgbValue.WHITE, period: float = 1.,
+              **kwargs) -> 'LedAnimation':
+        """Animation switching the LEDs on for the first half of each period."""
+        rgb = _rgb_tuples(rgb, kwargs.get('led_count', Leds.led_count))
+        off = RgbValue.NONE.value
+        return cls.from_function(
+            lambda t: rgb if t < period / 2 else off, period, **kwargs)
+
+    @classmethod
+    def breathe(cls, rgb=RgbValue.WHITE, period: float = 2.,
+                **kwargs) -> 'LedAnimation':
+        """Animation fading the LEDs smoothly on and off once in a period."""
+        rgb = _rgb_tuples(rgb, kwargs.get('led_count', Leds.led_count))
+
+        def function(t):
+            intensity = .5 - .5 * math.cos(2 * math.pi * t / period)
+            return [tuple(intensity * v for v in value) for value in rgb]
+        return cls.from_function(function, period, **kwargs)
+
+    @classmethod
+    def rainbow(cls, period: float = 3., **kwargs) -> 'LedAnimation':
+        """Animation cycling the hue of the LEDs, each LED at its own phase."""
+        led_count = kwargs.get('led_count', Leds.led_count)
+
+        def function(t):
+            return [tuple(255 * v for v in colorsys.hsv_to_rgb(
+                        (t / period + position / led_count) % 1., 1., 1.))
+                    for position in range(led_count)]
+        return cls.from_function(function, period, **kwargs)
@@ -1,58 +1,138 @@
 
 import time
-import asyncio as aio
+from itertools import chain
+from typing import Iterable, List, Optional
 
+import numpy as np
+
+from .backend import Backend
 from .bcm_channel import BcmChannel
 from .gpio import GpioOutput, GpioInput, GpioState, GpioPull
+from .scheduler import hardware_scheduler
 
 
 class LineTrackers:
     tracker_count = 5
+    # Number of analog input channels of the TLC1543 ADC
+    adc_channel_count = 11
+    # Device name for the hardware scheduler
+    io_device = 'line_trackers'
 
-    def __init__(self):
-        self._conversation_output = GpioOutput(BcmChannel.line_trackers_conversation)
-        self._address_output = GpioOutput(BcmChannel.line_trackers_address, initial=GpioState.LOW)
-        self._clock_output = GpioOutput(BcmChannel.line_trackers_clock, initial=GpioState.LOW)
-        self._sensors_input = GpioInput(BcmChannel.line_trackers_sensors, pull=GpioPull.UP)
+    def __init__(self, backend: Optional[Backend] = None):
+        self._conversation_output = GpioOutput(
+            BcmChannel.line_trackers_conversation, backend=backend)
+        self._address_output = GpioOutput(
+            BcmChannel.line_trackers_address, initial=GpioState.LOW, backend=backend)
+        self._clock_output = GpioOutput(
+            BcmChannel.line_trackers_clock, initial=GpioState.LOW, backend=backend)
+        self._sensors_input = GpioInput(
+            BcmChannel.line_trackers_sensors, pull=GpioPull.UP, backend=backend)
 
-    def read_analog_values(self):
-        if self._sensors_input.state == GpioState.UNKNOWN:
-            return None
+        # Plain channel numbers for calling RPi.GPIO directly
+        self._channels = tuple(int(gpio.channel) for gpio in (
+            self._conversation_output, self._address_output,
+            self._clock_output, self._sensors_input))
+        # Address bits of each ADC channel, most significant bit first
+        self._address_bits = [
+            tuple((address >> (3 - j)) & 0x01 for j in range(4))
+            for address in range(self.adc_channel_count)]
+
+    def _transfer(self, addresses: Iterable[int]) -> List[int]:
+        """Do consecutive ADC transfers.
 
-        value = [0] * (self.tracker_count + 1)
-        for i in range(len(value)):
+        The GPIO functions are called directly, bypassing GpioOutput and
+        GpioInput, since this is run hundreds of times per read.
+
+        Parameters
+        ----------
+        addresses : Iterable[int]
+            The ADC channel address sent in each transfer.
+
+        Returns
+        -------
+        results : List[int]
+            The 10-bit result received in each transfer. Each is the
+            conversion result of the channel addressed in the previous
+            transfer.
+        """
+        gpio = self._sensors_input.gpio
+        output = gpio.output
+        input_ = gpio.input
+        high, low = gpio.HIGH, gpio.LOW
+        conversation, address, clock, sensors = self._channels
+        address_bits = self._address_bits
+        sleep = time.sleep
+
+        results = []
+        for bits in map(address_bits.__getitem__, addresses):
             # Trigger conversation.
-            self._conversation_output.state = GpioState.LOW
+            output(conversation, low)
+
+            # Transfer channel address on clock 0 to 4, while receiving the
+            # first 4 bits of the previous conversion result.
+            value = 0
+            for bit in bits:
+                output(address, bit)
+                value = (value << 1) | input_(sensors)
+                output(clock, high)
+                output(clock, low)
 
-            for j in range(4):
-                # Transfer channel address on clock 0 to 4.
-                if (i >> (3 - j)) & 0x01:
-                    self._address_output.state = GpioState.HIGH
-                else:
-                    self._address_output.state = GpioState.LOW
+            # Receive the last 6 bits of the previous conversion result.
+            for _ in range(6):
+                value = (value << 1) | input_(sensors)
+                output(clock, high)
+                output(clock, low)
 
-                # Receive the first 4 bits of the previous conversion result.
-                value[i] <<= 1
-                if self._sensors_input.state == GpioState.HIGH:
-                    value[i] |= 0x01
+            results.append(value)
+            sleep(.0001)
+            output(conversation, high)
 
-                self._clock_output.state = GpioState.HIGH
-                self._clock_output.state = GpioState.LOW
+        return results
 
-            # Receive the last 6 bits of the previous conversation result.
-            for j in range(6):
-                value[i] <<= 1
-                if self._sensors_input.state == GpioState.HIGH:
-                    value[i] |= 0x01
+    def read_analog_values(self):
+        """
+        Returns
+        -------
+        values : List[int] | None
+            The 10-bit values of the trackers, or None if they could not
+            be read.
+        """
+        if self._sensors_input.state == GpioState.UNKNOWN:
+            return None
 
-                self._clock_output.state = GpioState.HIGH
-                self._clock_output.state = GpioState.LOW
+        # The first result belongs to an earlier conversion.
+        return self._transfer(range(self.tracker_count + 1))[1:]
 
-            time.sleep(.0001)
-            self._conversation_output.state = GpioState.HIGH
+    def read_many(self, count: int):
+        """Read the tracker values multiple times in a row.
 
-        return value[1:]
+        The consecutive reads are pipelined, so that each read takes one ADC
+        transfer less than with read_analog_values().
+
+        Parameters
+        ----------
+        count : int
+            The number of reads.
+
+        Returns
+        -------
+        values : numpy.ndarray | None
+            Array of shape (count, tracker_count) of the 10-bit values, or
+            None if the values could not be read.
+        """
+        if self._sensors_input.state == GpioState.UNKNOWN:
+            return None
+
+        trackers = range(self.tracker_count)
+        results = self._transfer(chain(chain.from_iterable(
+            trackers for _ in range(count)), [0]))
+        return np.array(results[1:], dtype=np.uint16).reshape(
+            count, self.tracker_count)
 
     async def async_read_analog_values(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.read_analog_values)
+        return await hardware_scheduler.run(
+            self.io_device, self.read_analog_values)
+
+    async def async_read_many(self, count: int):
+        return await hardware_scheduler.run(
+            self.io_device, self.read_many, count)
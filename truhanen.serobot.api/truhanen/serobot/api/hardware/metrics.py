@@ -0,0 +1,272 @@
+
+from bisect import bisect_left
+import math
+import threading
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+
+# Default upper bounds of the histogram buckets, for latencies in seconds
+latency_buckets = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05,
+                   .1, .25, .5, 1., 2.5, 5.)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    escaped_values = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+                      for value in values)
+    return '{' + ','.join(f'{name}="{value}"'
+                          for (name, value) in zip(names, escaped_values)) + '}'
+
+
+class _Metric:
+    """Base class of the metrics of this module.
+
+    A metric with label names has one child per combination of label values,
+    see labels(). Updating a value is a plain attribute update without
+    locking, so each child should be updated from a single thread, e.g.
+    the event loop or a device worker of the hardware scheduler.
+    """
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = ()):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the metric in the Prometheus exposition format.
+        documentation : str
+            The HELP text of the metric.
+        label_names : Sequence[str]
+            Names of the labels, whose values are given to labels().
+        """
+        self._name = name
+        self._documentation = documentation
+        self._label_names = tuple(label_names)
+        self._children = dict()
+        self._children_lock = threading.Lock()
+        if not self._label_names:
+            self._default = self.labels()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _create_child(self):
+        raise NotImplementedError
+
+    def labels(self, *label_values):
+        """The child of the given label values, created on the first call.
+        Store the child for frequent updates, instead of calling this each
+        time.
+        """
+        key = tuple(str(value) for value in label_values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self._label_names):
+                raise ValueError(f'{self._name} has labels {self._label_names}, '
+                                 f'got values {key}.')
+            with self._children_lock:
+                child = self._children.setdefault(key, self._create_child())
+        return child
+
+    def remove(self, *label_values):
+        """Remove the child of the given label values."""
+        with self._children_lock:
+            self._children.pop(tuple(str(value) for value in label_values), None)
+
+    def _samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """Yield (suffix, label names, label values, value) of each sample."""
+        raise NotImplementedError
+
+    def collect(self) -> Iterator[str]:
+        """Yield the lines of this metric in the Prometheus text format."""
+        yield f'# HELP {self._name} {self._documentation}'
+        yield f'# TYPE {self._name} {self.type_name}'
+        for suffix, label_names, label_values, value in self._samples():
+            yield (f'{self._name}{suffix}{_format_labels(label_names, label_values)} '
+                   f'{_format_value(value)}')
+
+
+class _CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.
+
+    def inc(self, amount: float = 1.):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. of events or bytes. By convention
+    the name ends with _total.
+    """
+    type_name = 'counter'
+
+    def _create_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.):
+        """Increase the value of a metric without labels."""
+        self._default.value += amount
+
+    @property
+    def value(self) -> float:
+        """The value of a metric without labels."""
+        return self._default.value
+
+    def _samples(self):
+        for label_values, child in list(self._children.items()):
+            yield '', self._label_names, label_values, child.value
+
+
+class _GaugeValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. a queue depth.
+
+    The value is either set, or read from a function only when the metrics
+    are collected, which costs nothing between the scrapes.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = (),
+                 function: Optional[Callable[[], Union[float, Dict[Tuple, float]]]] = None):
+        """
+        Parameters
+        ----------
+        function : Callable[[], float | Dict[Tuple, float]] | None
+            If given, returns the value on collection. For a metric with
+            labels, it returns a dict from tuples of label values to values.
+        """
+        super().__init__(name, documentation, label_names)
+        self._function = function
+
+    def _create_child(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def set(self, value: float):
+        """Set the value of a metric without labels."""
+        self._default.value = value
+
+    def _samples(self):
+        if self._function is None:
+            values = {label_values: child.value
+                      for (label_values, child) in list(self._children.items())}
+        elif self._label_names:
+            values = self._function()
+        else:
+            values = {(): self._function()}
+        for label_values, value in values.items():
+            yield '', self._label_names, tuple(map(str, label_values)), value
+
+
+class _HistogramValue:
+    __slots__ = ('_bounds', 'bucket_counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = bounds
+        # Non-cumulative counts of the buckets, the last one being +Inf
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies, in buckets."""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = latency_buckets):
+        """
+        Parameters
+        ----------
+        buckets : Sequence[float]
+            Increasing upper bounds of the buckets. The +Inf bucket is added.
+        """
+        self._bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def _create_child(self) -> _HistogramValue:
+        return _HistogramValue(self._bounds)
+
+    def observe(self, value: float):
+        """Observe a value of a metric without labels."""
+        self._default.observe(value)
+
+    def _samples(self):
+        bucket_label_names = self._label_names + ('le',)
+        for label_values, child in list(self._children.items()):
+            cumulative_count = 0
+            for bound, count in zip(self._bounds + (math.inf,),
+                                    list(child.bucket_counts)):
+                cumulative_count += count
+                yield ('_bucket', bucket_label_names,
+                       label_values + (_format_value(bound),), cumulative_count)
+            yield '_sum', self._label_names, label_values, child.sum
+            yield '_count', self._label_names, label_values, child.count
+
+
+class MetricsRegistry:
+    """Collection of metrics, rendered together for scraping."""
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = dict()
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered.')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, metric: _Metric):
+        self._metrics.pop(metric.name, None)
+
+    def counter(self, name: str, documentation: str,
+                label_names: Sequence[str] = ()) -> Counter:
+        """Create and register a Counter."""
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str,
+              label_names: Sequence[str] = (), function=None) -> Gauge:
+        """Create and register a Gauge."""
+        return self.register(Gauge(name, documentation, label_names, function))
+
+    def histogram(self, name: str, documentation: str,
+                  label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = latency_buckets) -> Histogram:
+        """Create and register a Histogram."""
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        return ''.join(f'{line}\n' for metric in list(self._metrics.values())
+                       for line in metric.collect())
+
+
+# Registry of the metrics of the hardware classes
+metrics_registry = MetricsRegistry()
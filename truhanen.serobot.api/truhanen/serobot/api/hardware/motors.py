@@ -1,8 +1,23 @@
 
 import asyncio as aio
+from concurrent.futures import Future, TimeoutError
+import logging
+from typing import Optional, Tuple
 
+from .backend import Backend
 from .bcm_channel import BcmChannel
 from .gpio import GpioOutput, GpioPwm, GpioState
+from .metrics import metrics_registry
+from .scheduler import hardware_scheduler, Priority
+from .timer_wheel import TimerHandle, timer_wheel
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+_watchdog_expiry_counter = metrics_registry.counter(
+    'serobot_motor_watchdog_expiries_total',
+    'Motor halts due to missing keepalives, see Motors.enable_watchdog().')
 
 
 class Motors:
@@ -11,26 +26,124 @@ class Motors:
     dc_move = 50  # Duty cycle for moving forwards/backwards
     dc_turn = 30  # Duty cycle for turning
 
-    def __init__(self):
+    # Device name for the hardware scheduler
+    io_device = 'motors'
+    # Ramping of the duty cycles towards the velocity setpoints
+    control_rate = 50  # Hz
+    max_acceleration = 400  # Duty cycle percentage units per second
+    # Time to wait for the halting write outside the event loop, in seconds
+    halt_timeout = 1.
+
+    def __init__(self, backend: Optional[Backend] = None):
+        # Velocity setpoints and the duty cycles currently applied
+        self._left_target = 0
+        self._right_target = 0
+        self._left_dc = 0
+        self._right_dc = 0
+        # Incremented when the pending duty cycle writes are superseded, see
+        # _apply_dc().
+        self._dc_generation = 0
+        # Task ramping the duty cycles, see set_velocity().
+        self._control_task: Optional[aio.Task] = None
+        # Set when the current timed move is superseded, see async_move().
+        self._move_superseded: Optional[aio.Event] = None
+        # Dead-man watchdog, see enable_watchdog().
+        self._watchdog_timeout: Optional[float] = None
+        self._watchdog_timer: Optional[TimerHandle] = None
+
         # Setup outputs.
-        self._output_left_1 = GpioOutput(BcmChannel.motor_left_1, initial=GpioState.LOW)
-        self._output_left_2 = GpioOutput(BcmChannel.motor_left_2, initial=GpioState.LOW)
-        self._output_right_1 = GpioOutput(BcmChannel.motor_right_1, initial=GpioState.LOW)
-        self._output_right_2 = GpioOutput(BcmChannel.motor_right_2, initial=GpioState.LOW)
+        self._output_left_1 = GpioOutput(
+            BcmChannel.motor_left_1, initial=GpioState.LOW, backend=backend)
+        self._output_left_2 = GpioOutput(
+            BcmChannel.motor_left_2, initial=GpioState.LOW, backend=backend)
+        self._output_right_1 = GpioOutput(
+            BcmChannel.motor_right_1, initial=GpioState.LOW, backend=backend)
+        self._output_right_2 = GpioOutput(
+            BcmChannel.motor_right_2, initial=GpioState.LOW, backend=backend)
 
         # Setup PWMs
         self._pwm_left = GpioPwm(
             BcmChannel.motor_left_pwm, frequency=self.pwm_freq,
-            duty_cycle=self.dc_move)
+            duty_cycle=self.dc_move,
+            backend=backend)
         self._pwm_right = GpioPwm(
             BcmChannel.motor_right_pwm, frequency=self.pwm_freq,
-            duty_cycle=self.dc_move)
+            duty_cycle=self.dc_move,
+            backend=backend)
 
         self._pwm_left.start()
         self._pwm_right.start()
 
     def __del__(self):
-        self.stop()
+        # The jobs of the worker of io_device refer to self, so none can be
+        # in progress, and the worker may be gone at exit.
+        self._apply_dc(0, 0)
+
+    @property
+    def watchdog_timeout(self) -> Optional[float]:
+        """The timeout of the watchdog in seconds, or None if disabled."""
+        return self._watchdog_timeout
+
+    def enable_watchdog(self, timeout: float = .5):
+        """Require keepalives during the motion set by set_velocity().
+
+        If neither keepalive() nor set_velocity() is called within the timeout
+        while the setpoints are non-zero, the motors are halted. Useful when
+        the setpoints come from a remote client, whose connection may be lost
+        in the middle of a motion. Timed moves, see async_move(), stop by
+        themselves and are not watched.
+
+        Parameters
+        ----------
+        timeout : float
+            The timeout in seconds. Resolution is the tick of the shared
+            timer wheel.
+        """
+        self._watchdog_timeout = timeout
+
+    def disable_watchdog(self):
+        self._watchdog_timeout = None
+        self._disarm_watchdog()
+
+    def keepalive(self):
+        """Postpone the expiry of the watchdog, see enable_watchdog()."""
+        if self._watchdog_timer is not None:
+            self._watchdog_timer.restart(self._watchdog_timeout)
+
+    def _arm_watchdog(self):
+        if self._watchdog_timeout is None:
+            return
+        if self._left_target == 0 and self._right_target == 0:
+            self._disarm_watchdog()
+        elif self._watchdog_timer is not None and self._watchdog_timer.active:
+            self._watchdog_timer.restart(self._watchdog_timeout)
+        else:
+            self._watchdog_timer = timer_wheel.schedule(
+                self._watchdog_timeout, self._on_watchdog_expired)
+
+    def _disarm_watchdog(self):
+        if self._watchdog_timer is not None:
+            self._watchdog_timer.cancel()
+            self._watchdog_timer = None
+
+    def _on_watchdog_expired(self):
+        self._watchdog_timer = None
+        _watchdog_expiry_counter.inc()
+        logger.warning(f'No motor keepalive within {self._watchdog_timeout} s. '
+                       f'Halting the motors.')
+        self.halt()
+
+    @property
+    def velocity(self) -> Tuple[float, float]:
+        """The duty cycles currently applied to the left and the right motor."""
+        return self._left_dc, self._right_dc
+
+    @property
+    def velocity_target(self) -> Tuple[float, float]:
+        """The velocity setpoints of the left and the right motor, see
+        set_velocity().
+        """
+        return self._left_target, self._right_target
 
     def _set_dc(self, left, right):
         """
@@ -70,61 +183,218 @@ class Motors:
             (self._output_right_2, right_2_state),
         ))
 
+    def _apply_dc(self, left, right, generation: Optional[int] = None):
+        """Write the duty cycles, unless the write belongs to an earlier
+        generation than self._dc_generation, i.e. it was submitted to the
+        hardware scheduler before being superseded.
+        """
+        if generation is not None and generation != self._dc_generation:
+            return
+        self._set_dc(left, right)
+        self._left_dc = left
+        self._right_dc = right
+
+    def set_velocity(self, left, right):
+        """Set the velocity setpoints of the motors.
+
+        If called from the running event loop, the duty cycles are ramped
+        towards the setpoints by a background task, at most max_acceleration
+        and control_rate times per second. Otherwise the setpoints are applied
+        immediately. Supersedes the timed move in progress, see async_move().
+        Arms the watchdog, if enabled, see enable_watchdog().
+
+        Parameters
+        ----------
+        left : Number
+            Duty cycle for the left motor, in the range [-100, 100]. Negative
+            value sets the motor to go backwards.
+        right : Number
+            Duty cycle for the right motor, see left.
+        """
+        self._supersede_move()
+        self._set_targets(left, right)
+        try:
+            aio.get_running_loop()
+        except RuntimeError:
+            return
+        self._arm_watchdog()
+
+    async def async_set_duty_cycles(self, left, right):
+        """Apply the duty cycles immediately, without ramping, for closed-loop
+        control at a higher rate than control_rate. Supersedes the timed move
+        in progress and the ramping towards earlier setpoints. Arms the
+        watchdog, if enabled, see enable_watchdog().
+
+        Parameters
+        ----------
+        left, right : Number
+            The duty cycles, see set_velocity().
+        """
+        self._supersede_move()
+        self._cancel_control()
+        self._left_target = max(-100, min(100, left))
+        self._right_target = max(-100, min(100, right))
+        await hardware_scheduler.run(
+            self.io_device, self._apply_dc, self._left_target,
+            self._right_target, self._dc_generation)
+        self._arm_watchdog()
+
+    def _set_targets(self, left, right):
+        self._left_target = max(-100, min(100, left))
+        self._right_target = max(-100, min(100, right))
+        try:
+            aio.get_running_loop()
+        except RuntimeError:
+            self._apply_dc(self._left_target, self._right_target)
+            return
+        if self._control_task is None or self._control_task.done():
+            self._control_task = aio.create_task(self._control_worker())
+
+    def _supersede_move(self):
+        if self._move_superseded is not None:
+            self._move_superseded.set()
+            self._move_superseded = None
+
+    async def _control_worker(self):
+        """Coroutine for ramping the duty cycles towards the setpoints."""
+        def step(value, target):
+            return value + max(-max_step, min(max_step, target - value))
+
+        max_step = self.max_acceleration / self.control_rate
+        generation = self._dc_generation
+        while (self._left_dc != self._left_target
+               or self._right_dc != self._right_target):
+            await hardware_scheduler.run(
+                self.io_device, self._apply_dc,
+                step(self._left_dc, self._left_target),
+                step(self._right_dc, self._right_target), generation)
+            await aio.sleep(1 / self.control_rate)
+
+    def _cancel_control(self):
+        """Stop the ramping, and drop its writes that have not started yet.
+        Cancelling the task does not stop a write in progress in the worker
+        of io_device, so the subsequent writes must be done by the same
+        worker.
+        """
+        self._dc_generation += 1
+        if self._control_task is not None:
+            self._control_task.cancel()
+            self._control_task = None
+
+    def halt(self) -> Future:
+        """Stop the motors immediately, without ramping.
+
+        The zero duty cycles are written by the worker of io_device, before
+        its other waiting jobs and after the write in progress, if any.
+        Outside the running event loop, the write is waited for, and done
+        directly if the worker does not respond.
+
+        Returns
+        -------
+        stopped : concurrent.futures.Future
+            Future resolved when the motors are stopped.
+        """
+        self._supersede_move()
+        self._disarm_watchdog()
+        self._cancel_control()
+        self._left_target = self._right_target = 0
+        stopped = hardware_scheduler.submit(
+            self.io_device, self._apply_dc, 0, 0, priority=Priority.HIGH)
+        try:
+            aio.get_running_loop()
+        except RuntimeError:
+            try:
+                stopped.result(timeout=self.halt_timeout)
+            except TimeoutError:
+                self._apply_dc(0, 0)
+        return stopped
+
     def stop(self):
-        self._set_dc(0, 0)
+        """Stop the motors immediately, without ramping, see halt()."""
+        self.halt()
 
     def move_forward(self):
-        self._set_dc(self.dc_move, self.dc_move)
+        self.set_velocity(self.dc_move, self.dc_move)
 
     def move_backward(self):
-        self._set_dc(-self.dc_move, -self.dc_move)
+        self.set_velocity(-self.dc_move, -self.dc_move)
 
     def turn_left(self):
-        self._set_dc(-self.dc_turn, self.dc_turn)
+        self.set_velocity(-self.dc_turn, self.dc_turn)
 
     def turn_right(self):
-        self._set_dc(self.dc_turn, -self.dc_turn)
+        self.set_velocity(self.dc_turn, -self.dc_turn)
+
+    async def async_move(self, left, right, duration=.5) -> bool:
+        """Move with the given velocity setpoints for a while, then stop.
+
+        A new move, or a call to set_velocity() or any of the methods using
+        it, supersedes the move in progress, in which case the motors are
+        left to the new setpoints. If the waiting is cancelled, the motors
+        are stopped.
+
+        Parameters
+        ----------
+        left, right : Number
+            The velocity setpoints, see set_velocity().
+        duration : Number
+            Duration of the movement in seconds.
+
+        Returns
+        -------
+        completed : bool
+            True if the move was completed and the motors stopped, False if
+            the move was superseded.
+        """
+        self._supersede_move()
+        self._disarm_watchdog()
+        superseded = self._move_superseded = aio.Event()
+        self._set_targets(left, right)
+        try:
+            await aio.wait_for(superseded.wait(), duration)
+        except aio.TimeoutError:
+            pass
+        except aio.CancelledError:
+            if self._move_superseded is superseded:
+                self.stop()
+            raise
+        else:
+            return False
+        await aio.wrap_future(self.halt())
+        return True
 
-    async def async_move_forward(self, duration=.5):
+    async def async_move_forward(self, duration=.5) -> bool:
         """
         Parameters
         ----------
         duration : Number
             Duration of the movement in seconds.
         """
-        self.move_forward()
-        await aio.sleep(duration)
-        self.stop()
+        return await self.async_move(self.dc_move, self.dc_move, duration)
 
-    async def async_move_backward(self, duration=.5):
+    async def async_move_backward(self, duration=.5) -> bool:
         """
         Parameters
         ----------
         duration : Number
             Duration of the movement in seconds.
         """
-        self.move_backward()
-        await aio.sleep(duration)
-        self.stop()
+        return await self.async_move(-self.dc_move, -self.dc_move, duration)
 
-    async def async_turn_left(self, duration=.5):
+    async def async_turn_left(self, duration=.5) -> bool:
         """
         Parameters
         ----------
         duration : Number
             Duration of the turn in seconds.
         """
-        self.turn_left()
-        await aio.sleep(duration)
-        self.stop()
+        return await self.async_move(-self.dc_turn, self.dc_turn, duration)
 
-    async def async_turn_right(self, duration=.5):
+    async def async_turn_right(self, duration=.5) -> bool:
         """
         Parameters
         ----------
         duration : Number
             Duration of the turn in seconds.
         """
-        self.turn_right()
-        await aio.sleep(duration)
-        self.stop()
+        return await self.async_move(self.dc_turn, -self.dc_turn, duration)
@@ -1,14 +1,36 @@
 
 import asyncio as aio
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 
+from .backend import Backend
 from .bcm_channel import BcmChannel
 from .gpio import GpioInput, GpioPull, GpioState
+from .scheduler import hardware_scheduler
+
+
+@dataclass(frozen=True)
+class ObstacleEvent:
+    """Change in the state of a proximity sensor."""
+    # 'left' | 'right'
+    side: str
+    # True if the sensor is triggered by an obstacle
+    detected: bool
+    # Time of the change, in seconds of time.monotonic()
+    timestamp: float
 
 
 class ProximitySensors:
-    def __init__(self):
-        self._left_sensor = GpioInput(BcmChannel.proximity_sensor_left, pull=GpioPull.UP)
-        self._right_sensor = GpioInput(BcmChannel.proximity_sensor_right, pull=GpioPull.UP)
+    # Device name for the hardware scheduler
+    io_device = 'proximity_sensors'
+    # Default time the sensor state must stay unchanged to be reported
+    debounce = .01  # s
+
+    def __init__(self, backend: Optional[Backend] = None):
+        self._left_sensor = GpioInput(
+            BcmChannel.proximity_sensor_left, pull=GpioPull.UP, backend=backend)
+        self._right_sensor = GpioInput(
+            BcmChannel.proximity_sensor_right, pull=GpioPull.UP, backend=backend)
 
     def get_left_proximity(self):
         """
@@ -29,9 +51,50 @@ class ProximitySensors:
         return self._right_sensor.state == GpioState.LOW
 
     async def async_get_left_proximity(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.get_left_proximity)
+        return await hardware_scheduler.run(
+            self.io_device, self.get_left_proximity)
 
     async def async_get_right_proximity(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.get_right_proximity)
+        return await hardware_scheduler.run(
+            self.io_device, self.get_right_proximity)
+
+    async def async_obstacle_events(
+            self, debounce: float = None) -> AsyncIterator[ObstacleEvent]:
+        """Iterator for yielding the changes of the sensor states as soon as
+        they happen, see GpioInput.edges().
+
+        Parameters
+        ----------
+        debounce : float | None
+            See GpioInput.edges(). Defaults to self.debounce.
+
+        Yields
+        ------
+        event : ObstacleEvent
+        """
+        if debounce is None:
+            debounce = self.debounce
+        events = aio.Queue()
+
+        async def forward_edges(side, sensor):
+            try:
+                async for edge in sensor.edges(debounce=debounce):
+                    events.put_nowait(ObstacleEvent(
+                        side, edge.state == GpioState.LOW, edge.timestamp))
+            except aio.CancelledError:
+                raise
+            except Exception as error:
+                # Raised to the iterating coroutine.
+                events.put_nowait(error)
+
+        tasks = [aio.create_task(forward_edges('left', self._left_sensor)),
+                 aio.create_task(forward_edges('right', self._right_sensor))]
+        try:
+            while True:
+                event = await events.get()
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
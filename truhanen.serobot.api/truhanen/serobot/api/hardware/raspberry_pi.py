@@ -1,17 +1,24 @@
 
 import psutil
-import subprocess
-import asyncio as aio
+from typing import Optional
+
+from .backend import Backend, default_backend
+from .scheduler import hardware_scheduler
 
 
 class RaspberryPi:
+    # Device name for the hardware scheduler
+    io_device = 'rpi'
+
+    def __init__(self, backend: Optional[Backend] = None):
+        self._backend = backend or default_backend()
+
     def get_cpu_load(self):
         load = psutil.cpu_percent(interval=None)
         return load
 
     async def async_get_cpu_load(self):
-        return await aio.get_running_loop().run_in_executor(
-            None, self.get_cpu_load)
+        return await hardware_scheduler.run(self.io_device, self.get_cpu_load)
 
     def reboot(self):
-        subprocess.run(['sudo', 'reboot'])
\ No newline at end of file
+        self._backend.reboot()
\ No newline at end of file
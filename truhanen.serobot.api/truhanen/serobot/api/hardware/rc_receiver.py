@@ -1,10 +1,12 @@
 
 import asyncio as aio
-import time
+from array import array
 from enum import Enum
+from typing import Sequence, Union, Optional
 
+from .backend import Backend
 from .bcm_channel import BcmChannel
-from .gpio import GpioInput, GpioState
+from .gpio import GpioInput, GpioEdge, GpioEdgeEvent
 
 
 class RCCode(Enum):
@@ -17,86 +19,186 @@ class RCCode(Enum):
     PLUS =   0x15
 
 
-class RCReceiver:
-    def __init__(self):
-        self._sensor = GpioInput(BcmChannel.remote_control_sensor)
+# NEC protocol timing, in seconds. Pulse widths between the limits below are
+# interpreted as the respective signal parts.
+_leader_mark_limits = (7.5e-3, 10.5e-3)  # Nominally 9 ms
+_data_leader_space_min = 3.375e-3  # Nominally 4.5 ms, repeat 2.25 ms
+_one_bit_space_min = 1.125e-3  # Nominally 1.6875 ms, zero bit 0.5625 ms
+
+# Number of pulses in a frame, counting from the leader mark. Does not
+# include the final stop mark, which only terminates the last space.
+_repeat_frame_length = 2
+_data_frame_length = 2 + 2 * 32
+
+
+def decode_nec_pulses(pulse_widths: Sequence[float]) -> Union[RCCode, str, None]:
+    """Decode a NEC frame sent by a remote control.
+
+    Parameters
+    ----------
+    pulse_widths : Sequence[float]
+        Widths of the consecutive pulses of the signal, in seconds. Marks and
+        spaces alternate, starting from the leader mark.
+
+    Returns
+    -------
+    code : RCCode | 'repeat' | None
+        Return an RCCode value if one could be decoded.
+        Return 'repeat' if the frame repeats the previous code.
+        Return None if no code could be decoded.
+    """
+    if len(pulse_widths) < _repeat_frame_length:
+        return None
+    leader_mark_min, leader_mark_max = _leader_mark_limits
+    if not leader_mark_min <= pulse_widths[0] <= leader_mark_max:
+        return None
+    if pulse_widths[1] < _data_leader_space_min:
+        return 'repeat'
+    if len(pulse_widths) < _data_frame_length:
+        return None
+
+    # Four bytes, least significant bit first. The length of the space
+    # after each mark determines the bit.
+    data = [0] * 4
+    for i_bit in range(32):
+        if pulse_widths[3 + 2 * i_bit] >= _one_bit_space_min:
+            data[i_bit // 8] |= 1 << (i_bit % 8)
+
+    # The second and the fourth bytes are complements of the first and the
+    # third, which are the address and the command.
+    if data[0] + data[1] != 255 or data[2] + data[3] != 255:
+        return None
+    try:
+        return RCCode(data[2])
+    except ValueError:
+        return None
+
 
-    def get_code(self):
-        """Read the signal sent by a remote control.
+class RCReceiver:
+    # Number of the latest pulse widths kept in the ring buffer
+    pulse_buffer_length = 256
+    # Maximum number of decoded codes waiting to be read
+    code_queue_size = 16
+
+    def __init__(self, backend: Optional[Backend] = None):
+        self._sensor = GpioInput(BcmChannel.remote_control_sensor, backend=backend)
+
+        # Ring buffer of the latest pulse widths, in seconds
+        self._pulse_widths = array('d', [0.]) * self.pulse_buffer_length
+        # Total number of pulses recorded
+        self._pulse_count = 0
+        self._last_edge_time = None
+        # Pulse count at the leader mark of the current frame
+        self._frame_start = None
+
+        # Set while listening
+        self._loop: Optional[aio.AbstractEventLoop] = None
+        self._codes: Optional[aio.Queue] = None
+
+    @property
+    def codes(self) -> Optional[aio.Queue]:
+        """Queue of the received codes (RCCode or 'repeat'). None if not
+        listening, see start_listening().
+        """
+        return self._codes
 
-        TODO This is probably slow in Python.
-            Implement in Cython or use some other method for
-            reading the signal, e.g. a kernel module.
+    def start_listening(self) -> aio.Queue:
+        """Start decoding the signal of the sensor. Must be called from the
+        running event loop.
 
         Returns
         -------
-        code : RCCode | 'repeat' | None
-            The code received.
-            Return an RCCode value if one could be decoded.
-            Return 'repeat' if the previous code was repeated.
-            Return None if no code could be decoded.
+        codes : asyncio.Queue
+            Queue to which the received codes are put.
+        """
+        if self._codes is None:
+            self._loop = aio.get_running_loop()
+            self._codes = aio.Queue(maxsize=self.code_queue_size)
+            self._last_edge_time = None
+            self._frame_start = None
+            self._sensor.add_edge_callback(self._on_edge, GpioEdge.BOTH)
+        return self._codes
+
+    def stop_listening(self):
+        if self._codes is not None:
+            self._sensor.remove_edge_callback(self._on_edge)
+            self._loop = None
+            self._codes = None
+
+    def _on_edge(self, edge: GpioEdgeEvent):
+        """Record the width of the pulse ended by an edge. Called from the
+        event thread of RPi.GPIO.
+        """
+        edge_time = edge.timestamp
+        if self._last_edge_time is not None:
+            self.record_pulse(edge_time - self._last_edge_time)
+        self._last_edge_time = edge_time
+
+    def record_pulse(self, width: float):
+        """Add a pulse width to the ring buffer, and decode the current frame
+        if it is complete. Decoded codes are put to the queue self.codes.
+
+        Parameters
+        ----------
+        width : float
+            The width of the pulse, in seconds.
+        """
+        index = self._pulse_count
+        self._pulse_widths[index % self.pulse_buffer_length] = width
+        self._pulse_count = index + 1
+
+        leader_mark_min, leader_mark_max = _leader_mark_limits
+        if leader_mark_min <= width <= leader_mark_max:
+            self._frame_start = index
+            return
+        if self._frame_start is None:
+            return
+
+        frame_length = self._pulse_count - self._frame_start
+        if ((frame_length == _repeat_frame_length
+                and width < _data_leader_space_min)
+                or frame_length == _data_frame_length):
+            code = decode_nec_pulses(
+                self.recorded_pulses(self._frame_start, frame_length))
+            self._frame_start = None
+            if code is not None and self._loop is not None:
+                self._loop.call_soon_threadsafe(self._put_code, code)
+
+    def recorded_pulses(self, start: int, length: int) -> array:
+        """Return the pulse widths recorded in the ring buffer.
+
+        Parameters
+        ----------
+        start : int
+            Index of the first pulse, counting all pulses recorded.
+        length : int
+            The number of pulses. At most pulse_buffer_length.
         """
-        if self._sensor.state == GpioState.UNKNOWN:
-            return None
-
-        if self._sensor.state == GpioState.HIGH:
-            return None
-
-        # Catch the key initializer signal, 9 ms ON + 4.5 ms OFF.
-        count = 0
-        while self._sensor.state == GpioState.LOW and count < 200:
-            count += 1
-            time.sleep(.00006)
-        if count < 10:
-            # No initializer signal caught
-            return None
-        count = 0
-        while self._sensor.state == GpioState.HIGH and count < 80:
-            count += 1
-            time.sleep(.00006)
-
-        # Catch the key data, four bytes bit by bit.
-        i_byte = 0
-        i_bit = 0
-        data = [0] * 4
-        for _ in range(32):
-            # Catch the bit initializer signal.
-            count = 0
-            while self._sensor.state == GpioState.LOW and count < 15:
-                count += 1
-                time.sleep(.00006)
-            # The length of the next OFF period determines the bit.
-            count = 0
-            while self._sensor.state == GpioState.HIGH and count < 40:
-                count += 1
-                time.sleep(.00006)
-
-            # Set the bit to data.
-            if count > 7:
-                data[i_byte] |= 1 << i_bit
-            if i_bit == 7:
-                i_bit = 0
-                i_byte += 1
-            else:
-                i_bit += 1
-
-        # Return the decoded key.
-        if data[0] + data[1] == 255 and data[2] + data[3] == 255:
-            try:
-                code = RCCode(data[2])
-            except ValueError:
-                code = None
-            return code
-        else:
-            return 'repeat'
+        buffer_length = self.pulse_buffer_length
+        start %= buffer_length
+        end = start + length
+        if end <= buffer_length:
+            return self._pulse_widths[start:end]
+        return self._pulse_widths[start:] + self._pulse_widths[:end - buffer_length]
+
+    def _put_code(self, code):
+        if self._codes is None:
+            return
+        # Drop the oldest code if nobody is reading them.
+        if self._codes.full():
+            self._codes.get_nowait()
+        self._codes.put_nowait(code)
 
     async def async_read_ir_remote_keys(self):
         """Iterator for yielding keys received by the IR remote sensor.
 
-        TODO Create an asyncio.Task and put the keys to a asyncio.Queue.
+        Yields
+        ------
+        code : RCCode | 'repeat'
         """
-        while True:
-            key = self.get_code()
-            if key is not None:
-                yield key
-            await aio.sleep(.1)
+        codes = self.start_listening()
+        try:
+            while True:
+                yield await codes.get()
+        finally:
+            self.stop_listening()
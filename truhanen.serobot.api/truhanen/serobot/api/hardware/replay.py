@@ -0,0 +1,387 @@
+
+from bisect import bisect_right
+from collections import defaultdict
+from functools import partial
+from itertools import zip_longest
+import logging
+import math
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .bcm_channel import BcmChannel
+from .camera import Camera
+from ._pca import PCA
+from .rc_receiver import RCCode
+from .simulator import (
+    SimulatedBackend, SimulatedPiCamera, SimulatedPixelStrip, _proximity_channels,
+    _synthetic_jpeg, nec_pulse_widths)
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+# Line tracker values of a sample whose line trackers could not be read, see
+# the telemetry module
+_missing_line_tracker_value = -1
+
+_missing = object()
+
+
+class ReplayOutput(NamedTuple):
+    """Output of the hardware, captured during a replay."""
+    # Replay time of the change, in the time base of the recording
+    time: float
+    # 'motor_left', 'motor_right', 'servo_pan', 'servo_tilt', 'leds', or
+    # 'buzzer'
+    name: str
+    value: Any
+
+
+class ReplayClock:
+    """Clock of the recorded time during a replay.
+
+    A running clock advances speed times as fast as the real time. A clock
+    without a speed stands still until advanced, which makes the replay
+    deterministic.
+    """
+    def __init__(self, start_time: float, speed: Optional[float] = 1.):
+        """
+        Parameters
+        ----------
+        start_time : float
+            The replay time at the start.
+        speed : float | None
+            The ratio of the replay time to the real time, or None for
+            advancing the clock manually, see advance().
+        """
+        if speed is not None and speed <= 0:
+            raise ValueError('The speed must be positive.')
+        self._speed = speed
+        self._time = start_time
+        # Real time of self._time, once started
+        self._real_time: Optional[float] = None
+
+    @property
+    def speed(self) -> Optional[float]:
+        return self._speed
+
+    @property
+    def running(self) -> bool:
+        return self._real_time is not None
+
+    @property
+    def time(self) -> float:
+        real_time = self._real_time
+        if real_time is None:
+            return self._time
+        return self._time + (time.monotonic() - real_time) * self._speed
+
+    def start(self):
+        if self._speed is None:
+            raise RuntimeError('A clock without a speed cannot be started.')
+        if self._real_time is None:
+            self._real_time = time.monotonic()
+
+    def advance(self, duration: float):
+        if self.running:
+            raise RuntimeError('A running clock cannot be advanced.')
+        self._time += duration
+
+    def real_delay(self, replay_time: float) -> float:
+        """The real time until the given replay time, in seconds."""
+        if not self.running:
+            return math.inf
+        return max(0., (replay_time - self.time) / self._speed)
+
+
+class ReplayBackend(SimulatedBackend):
+    """Simulated backend replaying a recorded session.
+
+    The recorded sensor values are fed into the simulated hardware, so that
+    DistanceSensor, LineTrackers, ProximitySensors, RCReceiver, and Camera
+    read them through the same code paths as on the robot. The changes of the
+    proximity sensors and the remote control codes are fed to the GPIO edge
+    callbacks in the feeding thread, so that they are received at their
+    recorded times regardless of the event thread. The resulting
+    motor, servo, LED, and buzzer outputs are captured in self.outputs, for
+    comparing the behaviour of different versions of the control code, see
+    diff_replay_outputs().
+
+    The replay runs either in a background thread at a multiple of the
+    recorded speed, see start(), or is advanced manually, see step().
+    """
+    def __init__(self, telemetry: Dict[str, Sequence],
+                 frames: Sequence[Tuple[float, bytes]] = (),
+                 ir_codes: Sequence[Tuple[float, RCCode]] = (),
+                 speed: Optional[float] = 1., **kwargs):
+        """
+        Parameters
+        ----------
+        telemetry : Dict[str, Sequence]
+            The recorded samples by the names of the serobot_telemetry_columns,
+            e.g. from read_telemetry(). The 'timestamp' column is required,
+            and missing sensor columns are not replayed. The CPU load and the
+            motor columns are not replayed.
+        frames : Sequence[Tuple[float, bytes]]
+            The recorded camera images, as pairs of a timestamp and a JPEG
+            image. The camera returns the latest one at the replay time, or
+            a synthetic image before the first one.
+        ir_codes : Sequence[Tuple[float, RCCode]]
+            The received remote control codes and their timestamps.
+        speed : float | None
+            See ReplayClock.
+        kwargs
+            See SimulatedBackend.
+        """
+        super().__init__(**kwargs)
+        timestamps = [float(timestamp) for timestamp in telemetry['timestamp']]
+        if not timestamps:
+            raise ValueError('The telemetry has no samples.')
+        self._telemetry = telemetry
+        self._timestamps = timestamps
+        frames = sorted(frames, key=lambda frame: frame[0])
+        self._frame_times = [float(frame_time) for (frame_time, _) in frames]
+        self._frames = [frame for (_, frame) in frames]
+        self._ir_codes = sorted(ir_codes, key=lambda ir_code: ir_code[0])
+        self._frame_size = kwargs.get('camera_frame_size', 30000)
+
+        self.clock = ReplayClock(timestamps[0], speed)
+        self._next_sample = 0
+        self._next_ir_code = 0
+        # The replayed states of the proximity sensors
+        self._obstacles: Dict[str, bool] = dict()
+        self._apply_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._finished_event = threading.Event()
+
+        self._outputs: List[ReplayOutput] = []
+        self._latest_outputs: Dict[str, Any] = dict()
+        self._outputs_lock = threading.Lock()
+        self._capture_outputs(kwargs.get('led_show_time', 0.))
+
+        # The state at the start of the recording
+        self._apply_until(self.clock.time)
+
+    @property
+    def start_time(self) -> float:
+        return self._timestamps[0]
+
+    @property
+    def end_time(self) -> float:
+        ir_code_end_time = self._ir_codes[-1][0] if self._ir_codes else -math.inf
+        return max(self._timestamps[-1], ir_code_end_time)
+
+    @property
+    def time(self) -> float:
+        """The current replay time."""
+        return self.clock.time
+
+    @property
+    def finished(self) -> bool:
+        """Whether all the recorded samples have been fed."""
+        return (self._next_sample == len(self._timestamps)
+                and self._next_ir_code == len(self._ir_codes))
+
+    @property
+    def outputs(self) -> List[ReplayOutput]:
+        """The captured changes of the outputs, in order."""
+        with self._outputs_lock:
+            return list(self._outputs)
+
+    def start(self):
+        """Start replaying at the speed of the clock, in a background thread."""
+        if self._thread is not None:
+            return
+        self.clock.start()
+        self._thread = threading.Thread(
+            target=self._run, name='replay', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread of start()."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the replay started by start() has fed all the samples.
+
+        Returns
+        -------
+        finished : bool
+            False if the timeout expired.
+        """
+        return self._finished_event.wait(timeout)
+
+    def step(self, duration: float):
+        """Advance a replay without a speed, and feed the samples recorded
+        meanwhile.
+        """
+        self.clock.advance(duration)
+        self._apply_until(self.clock.time)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._apply_until(self.clock.time)
+            next_time = self._next_time()
+            if next_time is None:
+                self._finished_event.set()
+                logger.info('Replay finished.')
+                break
+            self._stop_event.wait(self.clock.real_delay(next_time))
+
+    def _next_time(self) -> Optional[float]:
+        times = []
+        if self._next_sample < len(self._timestamps):
+            times.append(self._timestamps[self._next_sample])
+        if self._next_ir_code < len(self._ir_codes):
+            times.append(self._ir_codes[self._next_ir_code][0])
+        return min(times, default=None)
+
+    def _apply_until(self, replay_time: float):
+        """Feed the samples recorded until the given time."""
+        with self._apply_lock:
+            while (self._next_sample < len(self._timestamps)
+                   and self._timestamps[self._next_sample] <= replay_time):
+                self._apply_sample(self._next_sample)
+                self._next_sample += 1
+            while (self._next_ir_code < len(self._ir_codes)
+                   and self._ir_codes[self._next_ir_code][0] <= replay_time):
+                # The sensor output is low during the marks.
+                self.gpio.apply_pulses(
+                    BcmChannel.remote_control_sensor,
+                    nec_pulse_widths(self._ir_codes[self._next_ir_code][1]),
+                    self.gpio.LOW)
+                self._next_ir_code += 1
+
+    def _apply_sample(self, index: int):
+        telemetry = self._telemetry
+        if 'distance' in telemetry:
+            self.ultrasonic_sensor.distance = float(telemetry['distance'][index])
+        for side in ('left', 'right'):
+            column = telemetry.get(f'{side}_proximity')
+            if column is not None:
+                detected = bool(column[index])
+                # Schedule only the changes, i.e. the edges.
+                if self._obstacles.get(side) != detected:
+                    self._obstacles[side] = detected
+                    # The sensor output is low when triggered.
+                    self.gpio.apply_input(
+                        _proximity_channels[side],
+                        self.gpio.LOW if detected else self.gpio.HIGH)
+        for channel in range(5):
+            column = telemetry.get(f'line_tracker_{channel}')
+            if column is not None and column[index] != _missing_line_tracker_value:
+                self.adc.values[channel] = int(column[index])
+
+    def _current_frame(self, frame_number: int) -> bytes:
+        """The recorded image at the replay time, see SimulatedPiCamera."""
+        index = bisect_right(self._frame_times, self.clock.time) - 1
+        if index < 0:
+            return _synthetic_jpeg(self._frame_size, frame_number)
+        return self._frames[index]
+
+    def _capture(self, name: str, value):
+        """Record a change of an output."""
+        with self._outputs_lock:
+            if self._latest_outputs.get(name, _missing) == value:
+                return
+            self._latest_outputs[name] = value
+            self._outputs.append(ReplayOutput(self.clock.time, name, value))
+
+    def _capture_outputs(self, led_show_time: float):
+        """Set up the capture of the outputs."""
+        self.picamera = SimpleNamespace(PiCamera=partial(
+            SimulatedPiCamera, frame_size=self._frame_size,
+            frame_source=self._current_frame))
+        self.rpi_ws281x = SimpleNamespace(PixelStrip=partial(
+            SimulatedPixelStrip, show_time=led_show_time,
+            on_show=lambda pixels, brightness: self._capture(
+                'leds', (tuple(pixels), brightness))))
+
+        # The motor outputs are signed duty cycles, negative backwards, as in
+        # Motors.velocity.
+        motor_levels = defaultdict(int)
+        motor_duty_cycles = defaultdict(float)
+
+        def on_motor_change(side):
+            direction = (motor_levels[f'{side}_forward']
+                         - motor_levels[f'{side}_backward'])
+            self._capture(f'motor_{side}', direction * motor_duty_cycles[side])
+
+        def on_motor_level(side, name, level):
+            motor_levels[name] = level
+            on_motor_change(side)
+
+        def on_motor_duty_cycle(side, duty_cycle):
+            motor_duty_cycles[side] = duty_cycle
+            on_motor_change(side)
+
+        for side, backward, forward, pwm in (
+                ('left', BcmChannel.motor_left_1, BcmChannel.motor_left_2,
+                 BcmChannel.motor_left_pwm),
+                ('right', BcmChannel.motor_right_1, BcmChannel.motor_right_2,
+                 BcmChannel.motor_right_pwm)):
+            self.gpio.add_output_listener(
+                backward, partial(on_motor_level, side, f'{side}_backward'))
+            self.gpio.add_output_listener(
+                forward, partial(on_motor_level, side, f'{side}_forward'))
+            self.gpio.add_pwm_listener(pwm, partial(on_motor_duty_cycle, side))
+
+        self.gpio.add_output_listener(
+            BcmChannel.buzzer, lambda level: self._capture('buzzer', level))
+
+        # The servo outputs are the OFF counts of the PCA channels.
+        registers = self.smbus.registers[Camera.i2c_camera_servo_address]
+
+        def on_i2c_write(address, register, count):
+            if address != Camera.i2c_camera_servo_address:
+                return
+            for name, channel in (('servo_pan', 0), ('servo_tilt', 1)):
+                off_register = PCA._LED0_OFF_L + PCA._LED_REGISTER_COUNT * channel
+                if register <= off_register + 1 and off_register < register + count:
+                    self._capture(name, registers[off_register]
+                                  | registers[off_register + 1] << 8)
+
+        self.smbus.add_write_listener(on_i2c_write)
+
+
+def diff_replay_outputs(expected: Sequence[ReplayOutput],
+                        actual: Sequence[ReplayOutput],
+                        time_tolerance: float = 0.
+                        ) -> List[Tuple[Optional[ReplayOutput], Optional[ReplayOutput]]]:
+    """Compare the outputs captured in two replays of the same recording.
+
+    The changes of each output are compared in order.
+
+    Parameters
+    ----------
+    time_tolerance : float
+        The largest difference of the times of matching changes, in seconds.
+
+    Returns
+    -------
+    differences : List[Tuple[ReplayOutput | None, ReplayOutput | None]]
+        The pairs of differing changes, in the order of time. None stands for
+        a change missing from either replay.
+    """
+    expected_by_name = defaultdict(list)
+    actual_by_name = defaultdict(list)
+    for output in expected:
+        expected_by_name[output.name].append(output)
+    for output in actual:
+        actual_by_name[output.name].append(output)
+
+    differences = []
+    for name in sorted(expected_by_name.keys() | actual_by_name.keys()):
+        for expected_output, actual_output in zip_longest(
+                expected_by_name[name], actual_by_name[name]):
+            if (expected_output is None or actual_output is None
+                    or expected_output.value != actual_output.value
+                    or abs(expected_output.time - actual_output.time) > time_tolerance):
+                differences.append((expected_output, actual_output))
+    return sorted(differences, key=lambda difference: min(
+        output.time for output in difference if output is not None))
@@ -0,0 +1,153 @@
+
+import asyncio as aio
+from concurrent.futures import Future
+from dataclasses import dataclass
+from enum import IntEnum
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Dict, Any
+
+from .metrics import metrics_registry
+
+
+_wait_time_histogram = metrics_registry.histogram(
+    'serobot_hardware_job_wait_seconds',
+    'Time the hardware jobs waited for the worker of their device.',
+    label_names=('device',))
+_run_time_histogram = metrics_registry.histogram(
+    'serobot_hardware_job_run_seconds',
+    'Run time of the hardware jobs, e.g. sensor reads.',
+    label_names=('device',))
+
+
+class Priority(IntEnum):
+    """Priorities of the jobs of a single device. Smaller runs first."""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+@dataclass
+class DeviceMetrics:
+    """Statistics of the jobs run for a single device. Times are in seconds."""
+    queue_depth:     int = 0
+    completed_count: int = 0
+    wait_time_total: float = 0.
+    wait_time_max:   float = 0.
+    run_time_total:  float = 0.
+    run_time_max:    float = 0.
+
+
+class _DeviceWorker:
+    """Thread that runs the I/O jobs of a single device one at a time, in the
+    order of priority and submission.
+    """
+    def __init__(self, device: str):
+        self._device = device
+        self._metrics = DeviceMetrics()
+        self._jobs = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._thread = threading.Thread(
+            target=self._run, name=f'hardware-{device}', daemon=True)
+        self._thread.start()
+
+    @property
+    def metrics(self) -> DeviceMetrics:
+        self._metrics.queue_depth = self._jobs.qsize()
+        return self._metrics
+
+    def submit(self, priority: Priority, function: Callable, args) -> Future:
+        future = Future()
+        # The sequence number keeps the order within a priority, and
+        # prevents comparing the other items.
+        self._jobs.put((priority, next(self._sequence), time.monotonic(),
+                        function, args, future))
+        return future
+
+    def _run(self):
+        metrics = self._metrics
+        wait_time_histogram = _wait_time_histogram.labels(self._device)
+        run_time_histogram = _run_time_histogram.labels(self._device)
+        while True:
+            _, _, submit_time, function, args, future = self._jobs.get()
+            # Skip jobs that were cancelled while waiting.
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            start_time = time.monotonic()
+            try:
+                result = function(*args)
+            except BaseException as exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+            end_time = time.monotonic()
+
+            wait_time = start_time - submit_time
+            run_time = end_time - start_time
+            metrics.completed_count += 1
+            metrics.wait_time_total += wait_time
+            metrics.wait_time_max = max(metrics.wait_time_max, wait_time)
+            metrics.run_time_total += run_time
+            metrics.run_time_max = max(metrics.run_time_max, run_time)
+            wait_time_histogram.observe(wait_time)
+            run_time_histogram.observe(run_time)
+
+
+class HardwareScheduler:
+    """Runs blocking hardware I/O in worker threads, one per device.
+
+    The jobs of a device are serialized, so concurrent calls to the same
+    device do not interleave, and a slow device does not delay the others.
+    """
+    def __init__(self):
+        self._workers: Dict[str, _DeviceWorker] = dict()
+        self._workers_lock = threading.Lock()
+
+    def _get_worker(self, device: str) -> _DeviceWorker:
+        worker = self._workers.get(device)
+        if worker is None:
+            with self._workers_lock:
+                worker = self._workers.get(device)
+                if worker is None:
+                    worker = self._workers[device] = _DeviceWorker(device)
+        return worker
+
+    def submit(self, device: str, function: Callable, *args,
+               priority: Priority = Priority.NORMAL) -> Future:
+        """Submit a function to be called by the worker of a device.
+
+        Parameters
+        ----------
+        device : str
+            Name of the device. Jobs with the same name are run one at a time.
+        function : Callable
+            The function to be called with args.
+        priority : Priority
+            Priority among the waiting jobs of the device.
+        """
+        return self._get_worker(device).submit(priority, function, args)
+
+    async def run(self, device: str, function: Callable, *args,
+                  priority: Priority = Priority.NORMAL) -> Any:
+        """Awaitable version of submit(). Returns the result of the function."""
+        return await aio.wrap_future(
+            self.submit(device, function, *args, priority=priority))
+
+    def metrics(self) -> Dict[str, DeviceMetrics]:
+        """Current metrics of each device that has had jobs."""
+        return {device: worker.metrics
+                for (device, worker) in list(self._workers.items())}
+
+
+# Scheduler shared by the hardware classes
+hardware_scheduler = HardwareScheduler()
+
+metrics_registry.gauge(
+    'serobot_hardware_queue_depth',
+    'The number of hardware jobs waiting for the worker of their device.',
+    label_names=('device',),
+    function=lambda: {(device, ): metrics.queue_depth for (device, metrics)
+                      in hardware_scheduler.metrics().items()})
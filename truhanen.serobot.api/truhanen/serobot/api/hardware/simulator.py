@@ -0,0 +1,746 @@
+
+from collections import defaultdict
+from functools import partial
+import heapq
+import itertools
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .backend import Backend
+from .bcm_channel import BcmChannel
+from .rc_receiver import RCCode
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+
+def _busy_wait(duration: float):
+    """Wait for a duration too short for time.sleep()."""
+    end_time = time.perf_counter() + duration
+    while time.perf_counter() < end_time:
+        pass
+
+
+class SimulatedGpio:
+    """Replacement of the RPi.GPIO module, simulating the levels of the GPIO
+    pins.
+
+    Output changes are passed to the listeners added with
+    add_output_listener(), e.g. simulated peripherals. Input changes are
+    scheduled with set_input(), and their edges are passed to the callbacks
+    of add_event_detect() from a single event thread, as in RPi.GPIO. Unlike
+    in RPi.GPIO, the callbacks also get the scheduled time of the edge, so
+    that the measured pulse widths do not depend on the latency of the event
+    thread, see GpioInput._on_edge().
+    """
+    # The constants of RPi.GPIO
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, call_time: float = 0.):
+        """
+        Parameters
+        ----------
+        call_time : float
+            Time spent in each call of input() and output(), in seconds.
+            Emulates the cost of accessing the actual pins.
+        """
+        self.call_time = call_time
+        self._levels: Dict[int, int] = dict()
+        self._event_detects: Dict[int, Tuple[int, Callable[[int, float], None]]] = dict()
+        self._output_listeners: Dict[int, List[Callable[[int], None]]] = defaultdict(list)
+        self._pwm_listeners: Dict[int, List[Callable[[float], None]]] = defaultdict(list)
+        self._lock = threading.RLock()
+
+        # Scheduled input changes as (time, sequence number, channel, level)
+        self._scheduled_inputs = []
+        self._sequence = itertools.count()
+        self._scheduled_changed = threading.Condition(self._lock)
+        self._event_thread = threading.Thread(
+            target=self._run_events, name='simulated-gpio-events', daemon=True)
+        self._event_thread.start()
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, warnings):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        channel = int(channel)
+        with self._lock:
+            if initial is not None:
+                self._levels[channel] = int(initial)
+            elif direction == self.OUT:
+                self._levels.setdefault(channel, self.LOW)
+            else:
+                # Keep the level of an attached peripheral.
+                self._levels.setdefault(
+                    channel, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def cleanup(self, channel=None):
+        with self._lock:
+            if channel is None:
+                self._event_detects.clear()
+            else:
+                self._event_detects.pop(int(channel), None)
+
+    def input(self, channel) -> int:
+        if self.call_time:
+            _busy_wait(self.call_time)
+        return self._levels.get(int(channel), self.LOW)
+
+    def output(self, channel, state):
+        if isinstance(channel, (list, tuple)):
+            if not isinstance(state, (list, tuple)):
+                state = [state] * len(channel)
+            for single_channel, single_state in zip(channel, state):
+                self.output(single_channel, single_state)
+            return
+
+        if self.call_time:
+            _busy_wait(self.call_time)
+        channel, level = int(channel), int(state)
+        with self._lock:
+            if self._levels.get(channel) == level:
+                return
+            self._levels[channel] = level
+            for listener in self._output_listeners.get(channel, ()):
+                listener(level)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if int(channel) in self._event_detects:
+                raise RuntimeError('Conflicting edge detection already enabled '
+                                   'for this GPIO channel')
+            self._event_detects[int(channel)] = (edge, callback)
+
+    def remove_event_detect(self, channel):
+        with self._lock:
+            self._event_detects.pop(int(channel), None)
+
+    def PWM(self, channel, frequency) -> 'SimulatedPwm':
+        return SimulatedPwm(channel, frequency, self._pwm_listeners[int(channel)])
+
+    def add_output_listener(self, channel, listener: Callable[[int], None]):
+        """Call a function with the new level whenever an output changes."""
+        self._output_listeners[int(channel)].append(listener)
+
+    def add_pwm_listener(self, channel, listener: Callable[[float], None]):
+        """Call a function with the effective duty cycle whenever the PWM of
+        a channel is started, stopped, or changed.
+        """
+        self._pwm_listeners[int(channel)].append(listener)
+
+    def set_level(self, channel, level: int):
+        """Set the level of a pin immediately, without edge detection. For
+        simulated peripherals driving their output pins.
+        """
+        self._levels[int(channel)] = level
+
+    def set_input(self, channel, level: int, delay: float = 0.,
+                  start_time: Optional[float] = None):
+        """Change the level of an input pin after a delay, with edge
+        detection.
+
+        Parameters
+        ----------
+        start_time : float | None
+            The time from which the delay is counted, in seconds of
+            time.monotonic(). By default the time of the call.
+        """
+        if start_time is None:
+            start_time = time.monotonic()
+        with self._lock:
+            heapq.heappush(self._scheduled_inputs, (
+                start_time + delay, next(self._sequence), int(channel),
+                int(level)))
+            self._scheduled_changed.notify()
+
+    def play_pulses(self, channel, pulse_widths: Sequence[float],
+                    first_level: int, delay: float = 0.,
+                    start_time: Optional[float] = None):
+        """Schedule a signal of consecutive pulses of alternating levels to
+        an input pin. The pin is left to the level opposite to first_level.
+
+        Parameters
+        ----------
+        pulse_widths : Sequence[float]
+            The pulse widths in seconds.
+        first_level : int
+            The level of the first pulse.
+        delay : float
+            The time until the first pulse, in seconds.
+        start_time : float | None
+            See set_input().
+        """
+        # The edges are scheduled from the same time, so that the widths
+        # are exact.
+        if start_time is None:
+            start_time = time.monotonic()
+        level = first_level
+        for width in pulse_widths:
+            self.set_input(channel, level, delay, start_time)
+            delay += width
+            level ^= 1
+        self.set_input(channel, level, delay, start_time)
+
+    def apply_input(self, channel, level: int, edge_time: Optional[float] = None):
+        """Change the level of an input pin immediately, with edge detection.
+        Unlike with set_input(), the edge callback is called in the calling
+        thread before returning, e.g. for feeding a replay deterministically.
+
+        Parameters
+        ----------
+        edge_time : float | None
+            The time of the edge passed to the callback, in seconds of
+            time.monotonic(). By default the time of the call.
+        """
+        if edge_time is None:
+            edge_time = time.monotonic()
+        channel, level = int(channel), int(level)
+        with self._lock:
+            if self._levels.get(channel) == level:
+                return
+            self._levels[channel] = level
+            edge, callback = self._event_detects.get(channel, (None, None))
+
+        if callback is not None and (
+                edge == self.BOTH
+                or edge == (self.RISING if level == self.HIGH else self.FALLING)):
+            try:
+                callback(channel, edge_time)
+            except Exception:
+                logger.exception('Error in a GPIO edge callback.')
+
+    def apply_pulses(self, channel, pulse_widths: Sequence[float],
+                     first_level: int, start_time: Optional[float] = None):
+        """Feed a signal of consecutive pulses to an input pin immediately,
+        see apply_input() and play_pulses().
+
+        Parameters
+        ----------
+        start_time : float | None
+            The time of the first edge, in seconds of time.monotonic(). By
+            default the time of the call.
+        """
+        edge_time = time.monotonic() if start_time is None else start_time
+        level = first_level
+        for width in pulse_widths:
+            self.apply_input(channel, level, edge_time)
+            edge_time += width
+            level ^= 1
+        self.apply_input(channel, level, edge_time)
+
+    def _run_events(self):
+        """Apply the scheduled input changes. Run in the event thread."""
+        while True:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if self._scheduled_inputs and self._scheduled_inputs[0][0] <= now:
+                        break
+                    timeout = (self._scheduled_inputs[0][0] - now
+                               if self._scheduled_inputs else None)
+                    self._scheduled_changed.wait(timeout)
+                edge_time, _, channel, level = heapq.heappop(self._scheduled_inputs)
+            self.apply_input(channel, level, edge_time)
+
+
+class SimulatedPwm:
+    """Replacement of RPi.GPIO.PWM."""
+    def __init__(self, channel, frequency,
+                 listeners: Sequence[Callable[[float], None]] = ()):
+        """
+        Parameters
+        ----------
+        listeners : Sequence[Callable[[float], None]]
+            Functions called with the effective duty cycle on its changes,
+            see SimulatedGpio.add_pwm_listener().
+        """
+        self.channel = channel
+        self.frequency = frequency
+        self.duty_cycle = 0.
+        self.running = False
+        self._listeners = listeners
+
+    def _notify(self):
+        for listener in self._listeners:
+            listener(self.duty_cycle if self.running else 0.)
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.running = True
+        self._notify()
+
+    def stop(self):
+        self.running = False
+        self._notify()
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self._notify()
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+
+class SimulatedUltrasonicSensor:
+    """Ultrasonic distance sensor, which answers a trigger pulse with an echo
+    pulse as long as the round trip of the sound.
+    """
+    def __init__(self, gpio: SimulatedGpio, trigger_channel, echo_channel,
+                 distance: Optional[float] = 1., response_time: float = .0005,
+                 sound_velocity: float = 343.):
+        """
+        Parameters
+        ----------
+        distance : float | None
+            The distance to the obstacle in meters. If None, there is no echo.
+        response_time : float
+            The time from the end of the trigger pulse to the start of the
+            echo, in seconds.
+        """
+        self.distance = distance
+        self.response_time = response_time
+        self.sound_velocity = sound_velocity
+        self._gpio = gpio
+        self._echo_channel = echo_channel
+        gpio.set_level(echo_channel, gpio.LOW)
+        gpio.add_output_listener(trigger_channel, self._on_trigger)
+
+    def _on_trigger(self, level):
+        if level != self._gpio.LOW or self.distance is None:
+            return
+        echo_width = 2 * self.distance / self.sound_velocity
+        self._gpio.play_pulses(self._echo_channel, [echo_width], self._gpio.HIGH,
+                               delay=self.response_time)
+
+
+class SimulatedTlc1543:
+    """TLC1543 10-bit ADC with a serial interface. The result of a conversion
+    is shifted out during the next transfer, while the next channel address
+    is shifted in.
+    """
+    channel_count = 11
+
+    def __init__(self, gpio: SimulatedGpio, chip_select_channel, address_channel,
+                 clock_channel, data_channel, values: Optional[Sequence[int]] = None):
+        """
+        Parameters
+        ----------
+        values : Sequence[int] | None
+            The 10-bit values of the analog input channels. Can be changed
+            later through self.values.
+        """
+        self.values = list(values) if values is not None else [512] * self.channel_count
+        self._gpio = gpio
+        self._address_channel = int(address_channel)
+        self._data_channel = int(data_channel)
+        self._address = 0
+        self._result = 0
+        self._shift_register = 0
+        self._clock_count = 0
+        gpio.set_level(data_channel, gpio.LOW)
+        gpio.add_output_listener(chip_select_channel, self._on_chip_select)
+        gpio.add_output_listener(clock_channel, self._on_clock)
+
+    def _output_bit(self):
+        bit_index = 9 - self._clock_count
+        self._gpio.set_level(
+            self._data_channel,
+            (self._shift_register >> bit_index) & 1 if bit_index >= 0 else 0)
+
+    def _on_chip_select(self, level):
+        if level == self._gpio.LOW:
+            # Start a transfer with the most significant bit of the result.
+            self._shift_register = self._result
+            self._clock_count = 0
+            self._address = 0
+            self._output_bit()
+        else:
+            # Convert the addressed channel.
+            value = self.values[self._address] if self._address < len(self.values) else 0
+            self._result = max(0, min(1023, int(value)))
+
+    def _on_clock(self, level):
+        if level == self._gpio.HIGH:
+            # The address is clocked in most significant bit first.
+            if self._clock_count < 4:
+                self._address = ((self._address << 1)
+                                 | self._gpio.input(self._address_channel))
+        else:
+            self._clock_count += 1
+            self._output_bit()
+
+
+class SimulatedSMBus:
+    """Replacement of the smbus module, with a register file for each I2C
+    device address.
+    """
+    def __init__(self, transaction_time: float = 0.):
+        """
+        Parameters
+        ----------
+        transaction_time : float
+            Time spent in each I2C transaction, in seconds.
+        """
+        self.transaction_time = transaction_time
+        self.transaction_count = 0
+        self.registers: Dict[int, bytearray] = defaultdict(lambda: bytearray(256))
+        self._write_listeners: List[Callable[[int, int, int], None]] = []
+        self._lock = threading.Lock()
+
+    def SMBus(self, bus=None) -> 'SimulatedSMBus':
+        return self
+
+    def add_write_listener(self, listener: Callable[[int, int, int], None]):
+        """Call a function with the device address, the first register, and
+        the number of the registers after each write.
+        """
+        self._write_listeners.append(listener)
+
+    def _transaction(self):
+        self.transaction_count += 1
+        if self.transaction_time:
+            time.sleep(self.transaction_time)
+
+    def _notify_write(self, address, register, count):
+        for listener in self._write_listeners:
+            listener(address, register, count)
+
+    def write_byte_data(self, address, register, value):
+        with self._lock:
+            self._transaction()
+            self.registers[address][register] = value & 0xff
+            self._notify_write(address, register, 1)
+
+    def read_byte_data(self, address, register) -> int:
+        with self._lock:
+            self._transaction()
+            return self.registers[address][register]
+
+    def write_i2c_block_data(self, address, register, values):
+        with self._lock:
+            self._transaction()
+            # The register address auto-increments and wraps around.
+            registers = self.registers[address]
+            for i, value in enumerate(values):
+                registers[(register + i) % 256] = value & 0xff
+            self._notify_write(address, register, len(values))
+
+    def read_i2c_block_data(self, address, register, length=32) -> List[int]:
+        with self._lock:
+            self._transaction()
+            registers = self.registers[address]
+            return [registers[(register + i) % 256] for i in range(length)]
+
+
+def _synthetic_jpeg(size: int, frame_number: int) -> bytes:
+    """A valid 8x8 grey JPEG image of the given size in bytes, padded with
+    comment segments that contain the frame number.
+    """
+    def segment(marker: int, payload: bytes) -> bytes:
+        return bytes((0xff, marker)) + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+    single_code_table = bytes((1,) + (0,) * 15 + (0,))
+    header = (
+        b'\xff\xd8'
+        + segment(0xdb, b'\x00' + b'\x01' * 64)
+        + segment(0xc0, b'\x08\x00\x08\x00\x08\x01\x01\x11\x00')
+        + segment(0xc4, b'\x00' + single_code_table)
+        + segment(0xc4, b'\x10' + single_code_table)
+        + segment(0xfe, f'serobot simulated frame {frame_number}'.encode()))
+    scan = segment(0xda, b'\x01\x01\x00\x00\x3f\x00') + b'\x3f' + b'\xff\xd9'
+
+    padding = []
+    padding_size = size - len(header) - len(scan)
+    while padding_size > 4:
+        payload_size = min(padding_size - 4, 0xffff - 2)
+        padding.append(segment(0xfe, b' ' * payload_size))
+        padding_size -= payload_size + 4
+    return header + b''.join(padding) + scan
+
+
+class SimulatedPiCamera:
+    """Replacement of picamera.PiCamera, producing synthetic JPEG images."""
+    # Size of the encoder output buffers, in bytes
+    buffer_size = 65536
+
+    def __init__(self, resolution=(1640, 1232), framerate=30, frame_size=30000,
+                 frame_source: Optional[Callable[[int], bytes]] = None,
+                 **_kwargs):
+        """
+        Parameters
+        ----------
+        frame_size : int
+            The size of each synthetic JPEG image, in bytes.
+        frame_source : Callable[[int], bytes] | None
+            If given, returns the JPEG image of the given frame number,
+            instead of a synthetic one.
+        """
+        self.resolution = resolution
+        self.framerate = framerate
+        self.frame_size = frame_size
+        self.frame_source = frame_source
+        self.exposure_mode = 'auto'
+        self.frame = SimpleNamespace(complete=False, index=0)
+        self._recording_thread = None
+        self._recording_stop = threading.Event()
+        self._recording_error = None
+
+    @property
+    def exposure_speed(self) -> int:
+        """Exposure time in microseconds."""
+        return int(1e6 / self.framerate)
+
+    def start_preview(self):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def close(self):
+        if self._recording_thread is not None:
+            self.stop_recording()
+
+    def _write_frame(self, output):
+        if self.frame_source is not None:
+            picture = self.frame_source(self.frame.index)
+        else:
+            picture = _synthetic_jpeg(self.frame_size, self.frame.index)
+        if isinstance(output, str):
+            with open(output, 'wb') as file:
+                file.write(picture)
+        else:
+            # The picture is split to encoder output buffers.
+            for start in range(0, len(picture), self.buffer_size):
+                end = start + self.buffer_size
+                self.frame.complete = end >= len(picture)
+                output.write(picture[start:end])
+        self.frame.index += 1
+
+    def capture(self, output, format='jpeg', **_kwargs):
+        # Wait for the next frame.
+        time.sleep(1 / self.framerate)
+        self._write_frame(output)
+
+    def start_recording(self, output, format='mjpeg', **_kwargs):
+        if self._recording_thread is not None:
+            raise RuntimeError('The camera is already recording')
+        self._recording_stop.clear()
+        self._recording_error = None
+        self._recording_thread = threading.Thread(
+            target=self._record, args=(output,), name='simulated-camera',
+            daemon=True)
+        self._recording_thread.start()
+
+    def _record(self, output):
+        next_time = time.monotonic()
+        try:
+            while not self._recording_stop.is_set():
+                self._write_frame(output)
+                next_time = max(next_time + 1 / self.framerate, time.monotonic())
+                self._recording_stop.wait(next_time - time.monotonic())
+        except Exception as error:
+            self._recording_error = error
+
+    def wait_recording(self, timeout=0):
+        """Wait for a while, raising the error of the recording, if any."""
+        if self._recording_thread is None:
+            raise RuntimeError('The camera is not recording')
+        self._recording_stop.wait(timeout)
+        if self._recording_error is not None:
+            raise self._recording_error
+
+    def stop_recording(self):
+        if self._recording_thread is None:
+            raise RuntimeError('The camera is not recording')
+        self._recording_stop.set()
+        self._recording_thread.join()
+        self._recording_thread = None
+
+
+class SimulatedPixelStrip:
+    """Replacement of rpi_ws281x.PixelStrip."""
+    def __init__(self, num, pin, freq_hz=800000, dma=10, invert=False,
+                 brightness=255, channel=0, show_time: float = 0.,
+                 on_show: Optional[Callable[[List[Tuple[int, int, int]], int], None]] = None):
+        """
+        Parameters
+        ----------
+        show_time : float
+            Time spent in each call of show(), in seconds.
+        on_show : Callable[[List[Tuple[int, int, int]], int], None] | None
+            Function called with the shown pixels and brightness on each
+            call of show().
+        """
+        self.show_time = show_time
+        self.on_show = on_show
+        self.show_count = 0
+        self._pixels = [(0, 0, 0)] * num
+        self._brightness = brightness
+        # The pixels and the brightness of the latest show()
+        self.shown_pixels = list(self._pixels)
+        self.shown_brightness = brightness
+
+    def begin(self):
+        pass
+
+    def numPixels(self):
+        return len(self._pixels)
+
+    def setPixelColorRGB(self, n, red, green, blue, white=0):
+        self._pixels[n] = (red, green, blue)
+
+    def getPixelColorRGB(self, n):
+        red, green, blue = self._pixels[n]
+        return SimpleNamespace(r=red, g=green, b=blue)
+
+    def setBrightness(self, brightness):
+        self._brightness = brightness
+
+    def getBrightness(self):
+        return self._brightness
+
+    def show(self):
+        if self.show_time:
+            time.sleep(self.show_time)
+        self.shown_pixels = list(self._pixels)
+        self.shown_brightness = self._brightness
+        self.show_count += 1
+        if self.on_show is not None:
+            self.on_show(self.shown_pixels, self.shown_brightness)
+
+
+# The input pins of the proximity sensors by the sides
+_proximity_channels = dict(left=BcmChannel.proximity_sensor_left,
+                           right=BcmChannel.proximity_sensor_right)
+
+
+def nec_pulse_widths(code: RCCode, address: int = 0x00) -> List[float]:
+    """The pulse widths of a NEC frame, in seconds, starting from the
+    leader mark and ending with the stop mark. See rc_receiver.
+    """
+    bit_mark = .5625e-3
+    widths = [9e-3, 4.5e-3]
+    data = (address, address ^ 0xff, code.value, code.value ^ 0xff)
+    for byte in data:
+        for i_bit in range(8):
+            widths.append(bit_mark)
+            widths.append(1.6875e-3 if (byte >> i_bit) & 1 else bit_mark)
+    widths.append(bit_mark)
+    return widths
+
+
+class SimulatedBackend(Backend):
+    """Backend simulating the hardware of the robot, for running the API and
+    the server off the robot.
+
+    The sensor signals can be scripted through the attributes and methods of
+    this instance, e.g. self.ultrasonic_sensor.distance, self.adc.values,
+    set_obstacle() and send_ir_code().
+    """
+    # Interval of the NEC repeat frames, in seconds
+    ir_repeat_period = .108
+
+    def __init__(self, gpio_call_time: float = 0., i2c_transaction_time: float = 0.,
+                 camera_frame_size: int = 30000, led_show_time: float = 0.,
+                 distance: Optional[float] = 1.,
+                 line_tracker_values: Optional[Sequence[int]] = None):
+        """
+        Parameters
+        ----------
+        gpio_call_time : float
+            See SimulatedGpio.
+        i2c_transaction_time : float
+            See SimulatedSMBus.
+        camera_frame_size : int
+            See SimulatedPiCamera.
+        led_show_time : float
+            See SimulatedPixelStrip.
+        distance : float | None
+            See SimulatedUltrasonicSensor.
+        line_tracker_values : Sequence[int] | None
+            The initial values of the line trackers, see SimulatedTlc1543.
+        """
+        gpio = SimulatedGpio(call_time=gpio_call_time)
+        super().__init__(
+            gpio=gpio,
+            smbus=SimulatedSMBus(transaction_time=i2c_transaction_time),
+            picamera=SimpleNamespace(PiCamera=partial(
+                SimulatedPiCamera, frame_size=camera_frame_size)),
+            rpi_ws281x=SimpleNamespace(PixelStrip=partial(
+                SimulatedPixelStrip, show_time=led_show_time)),
+            reboot=lambda: logger.info('Simulated reboot.'))
+
+        self.ultrasonic_sensor = SimulatedUltrasonicSensor(
+            gpio, BcmChannel.ultrasonic_emitter, BcmChannel.ultrasonic_sensor,
+            distance=distance)
+        adc_values = [512] * SimulatedTlc1543.channel_count
+        if line_tracker_values is not None:
+            adc_values[:len(line_tracker_values)] = line_tracker_values
+        self.adc = SimulatedTlc1543(
+            gpio, BcmChannel.line_trackers_conversation,
+            BcmChannel.line_trackers_address, BcmChannel.line_trackers_clock,
+            BcmChannel.line_trackers_sensors, adc_values)
+
+        # The idle levels of the active-low signals
+        for channel in (BcmChannel.line_trackers_conversation,
+                        BcmChannel.proximity_sensor_left,
+                        BcmChannel.proximity_sensor_right,
+                        BcmChannel.remote_control_sensor):
+            gpio.set_level(channel, gpio.HIGH)
+
+    def set_obstacle(self, side: str, detected: bool, delay: float = 0.):
+        """Trigger or release a proximity sensor.
+
+        Parameters
+        ----------
+        side : 'left' | 'right'
+        detected : bool
+            True to trigger the sensor.
+        delay : float
+            The time until the change, in seconds.
+        """
+        channel = _proximity_channels[side]
+        self.gpio.set_input(channel, self.gpio.LOW if detected else self.gpio.HIGH,
+                            delay)
+
+    def send_ir_code(self, code: RCCode, repeat_count: int = 0, delay: float = 0.):
+        """Send a code to the remote control sensor, as if a key of the
+        remote control was pressed.
+
+        Parameters
+        ----------
+        code : RCCode
+        repeat_count : int
+            The number of repeat frames sent after the code, as if the key
+            was held.
+        delay : float
+            The time until the start of the signal, in seconds.
+        """
+        start_time = time.monotonic()
+        # The sensor output is low during the marks.
+        self.gpio.play_pulses(BcmChannel.remote_control_sensor,
+                              nec_pulse_widths(code), self.gpio.LOW, delay,
+                              start_time)
+        for i_repeat in range(repeat_count):
+            self.gpio.play_pulses(
+                BcmChannel.remote_control_sensor, [9e-3, 2.25e-3, .5625e-3],
+                self.gpio.LOW, delay + (i_repeat + 1) * self.ir_repeat_period,
+                start_time)
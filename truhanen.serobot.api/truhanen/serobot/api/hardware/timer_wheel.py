@@ -0,0 +1,153 @@
+
+import asyncio as aio
+import logging
+from typing import Callable, List, Optional
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """Timer scheduled with TimerWheel.schedule()."""
+    __slots__ = ('_wheel', '_callback', '_deadline', '_slot', '_active')
+
+    def __init__(self, wheel: 'TimerWheel', callback: Callable[[], None],
+                 deadline: int):
+        self._wheel = wheel
+        self._callback = callback
+        # The tick at which the timer expires
+        self._deadline = deadline
+        # The index of the slot holding the timer, set by TimerWheel. None
+        # while the slot is being processed.
+        self._slot = None
+        self._active = True
+
+    @property
+    def active(self) -> bool:
+        """True until the timer expires or is cancelled."""
+        return self._active
+
+    def cancel(self):
+        if self._active:
+            self._active = False
+            self._wheel._active_count -= 1
+
+    def restart(self, delay: float):
+        """Reschedule the expiry of an active timer to delay seconds from
+        now.
+
+        A postponed timer is moved to its new slot only when its old slot
+        comes up, so postponing is cheap at any rate. A timer whose new
+        deadline comes before its old slot is moved right away.
+        """
+        if self._active:
+            self._deadline = self._wheel._deadline(delay)
+            if (self._slot is not None
+                    and self._deadline < self._wheel._next_visit(self._slot)):
+                self._wheel._move(self)
+
+
+class TimerWheel:
+    """Timers with a coarse resolution, driven by a single background task.
+
+    The timers are kept in a ring of slots, one slot per tick, so that
+    scheduling, restarting and cancelling a timer take constant time, and
+    each tick only visits the timers of its own slot. The background task
+    runs only while there are active timers.
+    """
+    def __init__(self, tick: float = .02, slot_count: int = 64):
+        """
+        Parameters
+        ----------
+        tick : float
+            Resolution of the timers, in seconds. The callbacks are called
+            at most one tick late.
+        slot_count : int
+            Number of slots in the ring. Timers further than slot_count ticks
+            away pass their slot the necessary number of times.
+        """
+        self._tick = tick
+        self._slots: List[List[TimerHandle]] = [[] for _ in range(slot_count)]
+        # The number of ticks processed
+        self._tick_count = 0
+        self._active_count = 0
+        self._start_time = None
+        self._task: Optional[aio.Task] = None
+
+    @property
+    def tick(self) -> float:
+        return self._tick
+
+    def _deadline(self, delay: float) -> int:
+        # Round up, so that a timer never expires early.
+        return self._tick_count + max(1, -int(-delay // self._tick))
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> TimerHandle:
+        """Call a function after a delay. Must be called from the running
+        event loop.
+
+        Parameters
+        ----------
+        delay : float
+            The delay in seconds.
+        callback : Callable[[], None]
+            The function to be called from the event loop.
+        """
+        if self._task is None or self._task.done():
+            loop = aio.get_running_loop()
+            self._start_time = loop.time() - self._tick_count * self._tick
+            self._task = loop.create_task(self._run())
+        handle = TimerHandle(self, callback, self._deadline(delay))
+        self._insert(handle)
+        self._active_count += 1
+        return handle
+
+    def _insert(self, handle: TimerHandle):
+        handle._slot = handle._deadline % len(self._slots)
+        self._slots[handle._slot].append(handle)
+
+    def _move(self, handle: TimerHandle):
+        """Move a timer to the slot of its deadline."""
+        self._slots[handle._slot].remove(handle)
+        self._insert(handle)
+
+    def _next_visit(self, slot: int) -> int:
+        """The tick at which a slot is processed next."""
+        return self._tick_count + 1 + (slot - self._tick_count - 1) % len(self._slots)
+
+    def _advance(self):
+        """Process the timers of the next tick."""
+        self._tick_count += 1
+        tick_count = self._tick_count
+        index = tick_count % len(self._slots)
+        handles, self._slots[index] = self._slots[index], []
+        for handle in handles:
+            handle._slot = None
+        for handle in handles:
+            if not handle._active:
+                continue
+            if handle._deadline > tick_count:
+                # Restarted, or expires on a later round.
+                self._insert(handle)
+                continue
+            handle.cancel()
+            try:
+                handle._callback()
+            except Exception:
+                logger.exception('Error in a timer callback.')
+
+    async def _run(self):
+        loop = aio.get_running_loop()
+        while self._active_count > 0:
+            await aio.sleep(max(
+                0., self._start_time + (self._tick_count + 1) * self._tick
+                - loop.time()))
+            # Catch up with the ticks missed while the event loop was busy.
+            current_tick = int((loop.time() - self._start_time) / self._tick)
+            while self._tick_count < current_tick and self._active_count > 0:
+                self._advance()
+
+
+# Timer wheel shared by the hardware classes
+timer_wheel = TimerWheel()
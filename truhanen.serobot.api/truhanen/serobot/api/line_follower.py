@@ -0,0 +1,337 @@
+
+import asyncio as aio
+from collections import deque
+import logging
+import math
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .hardware import LineTrackers, Motors
+from .hardware.metrics import metrics_registry
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+_jitter_histogram = metrics_registry.histogram(
+    'serobot_line_follower_jitter_seconds',
+    'Delay of the line follower updates from their schedule.')
+_overrun_counter = metrics_registry.counter(
+    'serobot_line_follower_overruns_total',
+    'Line follower updates skipped, since the previous ones took too long.')
+
+# Positions of the trackers under the robot. As in the reference line
+# follower of the AlphaBot2, the trackers are indexed from the right to the
+# left, so that a positive position, towards the last tracker, requires
+# turning left.
+_tracker_positions = np.linspace(-1., 1., LineTrackers.tracker_count)
+
+
+def line_positions(values, minimum, maximum, white_line: bool = False,
+                   threshold: float = .2) -> np.ndarray:
+    """Estimate the position of the line under the trackers.
+
+    The calibrated values of the trackers are used as weights of the tracker
+    positions, so that the estimate falls between the trackers.
+
+    Parameters
+    ----------
+    values : array_like
+        The 10-bit tracker values, of shape (..., tracker_count).
+    minimum, maximum : array_like
+        The calibrated range of the values of each tracker.
+    white_line : bool
+        False if the trackers read higher values on the line than off it,
+        True if lower.
+    threshold : float
+        The calibrated value, between 0 and 1, that at least one tracker must
+        exceed for the line to be detected.
+
+    Returns
+    -------
+    positions : numpy.ndarray
+        The positions of the line, of shape values.shape[:-1], in the range
+        [-1, 1] from the first to the last tracker. NaN where no line is
+        detected.
+    """
+    minimum = np.asarray(minimum, dtype=float)
+    span = np.maximum(np.asarray(maximum, dtype=float) - minimum, 1.)
+    weights = np.clip((np.asarray(values, dtype=float) - minimum) / span, 0., 1.)
+    if white_line:
+        weights = 1. - weights
+    weight_sums = weights.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        positions = (weights @ _tracker_positions) / weight_sums
+    return np.where(weights.max(axis=-1) > threshold, positions, np.nan)
+
+
+class LineFollower:
+    """Closed-loop line following with the line trackers and the motors.
+
+    A PID controller steers the robot towards the line, at a fixed rate. Each
+    update reads the trackers through the hardware scheduler, estimates the
+    position of the line, and applies differential duty cycles to the motors
+    without ramping, see Motors.async_set_duty_cycles(). The delays of the
+    updates from their schedule are collected in statistics.
+
+    The trackers should be calibrated on the surface first, see
+    async_calibrate(). Without calibration, the full 10-bit range is used.
+    """
+    # Number of the recent updates in statistics
+    statistics_window = 1000
+
+    def __init__(self, line_trackers: LineTrackers, motors: Motors,
+                 rate: float = 100., speed: float = 30.,
+                 kp: float = 40., ki: float = 0., kd: float = 1.,
+                 samples_per_update: int = 1, white_line: bool = False,
+                 lost_timeout: Optional[float] = 1.):
+        """
+        Parameters
+        ----------
+        rate : float
+            The number of updates per second.
+        speed : float
+            The duty cycle of both motors when on the line, in the range
+            [0, 100].
+        kp, ki, kd : float
+            The gains of the PID controller, from the position of the line,
+            in the range [-1, 1], to the difference of the duty cycles of the
+            motors.
+        samples_per_update : int
+            The number of pipelined tracker reads averaged in each update,
+            see LineTrackers.read_many().
+        white_line : bool
+            See line_positions().
+        lost_timeout : float | None
+            The time in seconds after which the following stops, if the line
+            is not detected. Meanwhile the robot turns towards the side where
+            the line was last seen, or stands still if the line has not been
+            seen yet. None for no timeout.
+        """
+        self._line_trackers = line_trackers
+        self._motors = motors
+        self.rate = rate
+        self.speed = speed
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.samples_per_update = samples_per_update
+        self.white_line = white_line
+        self.lost_timeout = lost_timeout
+
+        self._minimum = np.zeros(LineTrackers.tracker_count)
+        self._maximum = np.full(LineTrackers.tracker_count, 1023.)
+        self._calibrated = False
+        self._position: Optional[float] = None
+        self._task: Optional[aio.Task] = None
+
+        # Statistics of the updates
+        self._update_times = deque(maxlen=self.statistics_window)
+        self._jitters = deque(maxlen=self.statistics_window)
+        self._update_count = 0
+        self._overrun_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def position(self) -> Optional[float]:
+        """The latest estimated position of the line, see line_positions(),
+        or None if the line was not detected.
+        """
+        return self._position
+
+    @property
+    def calibrated(self) -> bool:
+        return self._calibrated
+
+    @property
+    def calibration(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The minimum and the maximum value of each tracker."""
+        return self._minimum.copy(), self._maximum.copy()
+
+    def set_calibration(self, minimum: Sequence[float], maximum: Sequence[float]):
+        """Set the range of the values of each tracker, e.g. as stored from
+        an earlier calibration.
+        """
+        self._minimum = np.array(minimum, dtype=float)
+        self._maximum = np.array(maximum, dtype=float)
+        self._calibrated = True
+
+    def calibrate(self, values: np.ndarray):
+        """Calibrate the trackers from values read both on and off the line.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Tracker values, of shape (count, tracker_count).
+        """
+        values = np.asarray(values)
+        self.set_calibration(values.min(axis=0), values.max(axis=0))
+        logger.info('Calibrated the line trackers to the minima %s and the '
+                    'maxima %s.', self._minimum, self._maximum)
+
+    async def async_calibrate(self, duration: float = 2.,
+                              turn_duty_cycle: float = Motors.dc_turn):
+        """Calibrate the trackers while turning the robot in place.
+
+        The robot is turned to the left, back to the right, and to the
+        starting direction, so that each tracker sweeps over the line.
+
+        Parameters
+        ----------
+        duration : float
+            The duration of the calibration, in seconds.
+        turn_duty_cycle : float
+            The duty cycle of the motors while turning. With 0, the robot
+            stands still and can be moved by hand.
+        """
+        if self.running:
+            raise RuntimeError('Cannot calibrate while following the line.')
+        loop = aio.get_running_loop()
+        start_time = loop.time()
+        samples = []
+        try:
+            while True:
+                phase = (loop.time() - start_time) / duration
+                if phase >= 1:
+                    break
+                direction = 1 if phase < .25 or phase >= .75 else -1
+                self._motors.set_velocity(-direction * turn_duty_cycle,
+                                          direction * turn_duty_cycle)
+                values = await self._line_trackers.async_read_many(10)
+                if values is None:
+                    raise RuntimeError('The line trackers cannot be read.')
+                samples.append(values)
+        finally:
+            self._motors.stop()
+        self.calibrate(np.concatenate(samples))
+
+    @property
+    def statistics(self) -> Dict[str, float]:
+        """Statistics of the updates.
+
+        'update_count' and 'overrun_count', the numbers of the updates and of
+        those skipped due to overruns, 'rate', the achieved updates per
+        second, and 'jitter_mean', 'jitter_p95', and 'jitter_max', the delays
+        of the updates from their schedule, in seconds. The rate and the
+        jitters are over the recent updates, see statistics_window.
+        """
+        update_times = list(self._update_times)
+        jitters = np.array(self._jitters)
+        statistics = dict(update_count=self._update_count,
+                          overrun_count=self._overrun_count,
+                          rate=math.nan, jitter_mean=math.nan,
+                          jitter_p95=math.nan, jitter_max=math.nan)
+        if len(update_times) > 1 and update_times[-1] > update_times[0]:
+            statistics['rate'] = ((len(update_times) - 1)
+                                  / (update_times[-1] - update_times[0]))
+        if len(jitters):
+            statistics.update(jitter_mean=float(jitters.mean()),
+                              jitter_p95=float(np.percentile(jitters, 95)),
+                              jitter_max=float(jitters.max()))
+        return statistics
+
+    def start(self):
+        """Start following the line. Must be called from the running event
+        loop.
+        """
+        if not self.running:
+            self._update_times.clear()
+            self._jitters.clear()
+            self._update_count = 0
+            self._overrun_count = 0
+            self._task = aio.get_running_loop().create_task(self._follow_worker())
+
+    def stop(self):
+        """Stop following the line, and the motors."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._motors.stop()
+
+    def _read_position(self, values: np.ndarray) -> Optional[float]:
+        positions = line_positions(values, self._minimum, self._maximum,
+                                   self.white_line)
+        positions = positions[~np.isnan(positions)]
+        if not len(positions):
+            return None
+        return float(positions.mean())
+
+    async def _follow_worker(self):
+        """Coroutine for the updates of the controller."""
+        loop = aio.get_running_loop()
+        period = 1 / self.rate
+        deadline = loop.time()
+        previous_time = None
+        # The error of the previous update on the line, None if it was off
+        previous_error: Optional[float] = None
+        # The position where the line was last seen
+        last_position: Optional[float] = None
+        integral = 0.
+        lost_time = None
+        try:
+            while True:
+                update_time = loop.time()
+                jitter = update_time - deadline
+                self._jitters.append(jitter)
+                _jitter_histogram.observe(jitter)
+                self._update_times.append(update_time)
+                self._update_count += 1
+                dt = period if previous_time is None else update_time - previous_time
+                previous_time = update_time
+
+                values = await self._line_trackers.async_read_many(
+                    self.samples_per_update)
+                if values is None:
+                    logger.warning('The line trackers cannot be read. '
+                                   'Stopping the line following.')
+                    break
+                self._position = self._read_position(values)
+
+                if self._position is None:
+                    if lost_time is None:
+                        lost_time = update_time
+                    elif (self.lost_timeout is not None
+                          and update_time - lost_time > self.lost_timeout):
+                        logger.info('Lost the line. Stopping the line following.')
+                        break
+                    previous_error = None
+                    if last_position is None:
+                        # Hold still until the line is seen, instead of
+                        # searching on an arbitrary side.
+                        left = right = 0.
+                    else:
+                        # Turn towards the side where the line was last seen.
+                        steering = self.kp * math.copysign(1., last_position)
+                        left, right = self.speed - steering, self.speed + steering
+                else:
+                    lost_time = None
+                    error = last_position = self._position
+                    integral = max(-1., min(1., integral + error * dt))
+                    # No derivative on reacquiring the line, whose position
+                    # jumps from that of the search.
+                    derivative = (0. if previous_error is None or dt <= 0
+                                  else (error - previous_error) / dt)
+                    previous_error = error
+                    steering = self.kp * error + self.ki * integral + self.kd * derivative
+                    left, right = self.speed - steering, self.speed + steering
+                await self._motors.async_set_duty_cycles(left, right)
+
+                deadline += period
+                delay = deadline - loop.time()
+                if delay < 0:
+                    # Skip the updates that are already late.
+                    skipped_count = math.ceil(-delay / period)
+                    self._overrun_count += skipped_count
+                    _overrun_counter.inc(skipped_count)
+                    deadline += skipped_count * period
+                    delay += skipped_count * period
+                await aio.sleep(delay)
+        finally:
+            # When cancelled by stop(), the motors are stopped there, and may
+            # already have been given new commands.
+            if self._task is aio.current_task():
+                self._motors.stop()
@@ -1,9 +1,12 @@
 
 import asyncio as aio
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field, fields
+import math
+import time
+from typing import List, Optional, Dict
 
 from .hardware import(
+    Backend,
     RaspberryPi,
     Camera,
     Motors,
@@ -15,32 +18,78 @@ from .hardware import(
     ProximitySensors,
     Speaker,
 )
+from .line_follower import LineFollower
+
+
+def _sampled(period: float):
+    """Dataclass field whose value is read from the hardware at most once
+    per the given period, in seconds.
+    """
+    return field(metadata=dict(sampling_period=period))
 
 
 @dataclass
 class SerobotStatus:
-    cpu_load:              float
-    distance_sensor_value: float
-    left_proximity_value:  bool
-    right_proximity_value: bool
-    line_tracker_values:   List[int]
+    cpu_load:              float = _sampled(2.)
+    distance_sensor_value: float = _sampled(.2)
+    left_proximity_value:  bool = _sampled(.1)
+    right_proximity_value: bool = _sampled(.1)
+    line_tracker_values:   List[int] = _sampled(.2)
+    # These are not read from the hardware and are always up to date.
     led_brightness:        int
     buzzer_on:             bool
-    camera_exposure:       int
+    camera_exposure:       Optional[int]
+
+    @classmethod
+    def sampling_periods(cls) -> Dict[str, float]:
+        """Sampling periods of the fields that are read from the hardware."""
+        return {f.name: f.metadata['sampling_period'] for f in fields(cls)
+                if 'sampling_period' in f.metadata}
 
 
 class Serobot:
-    def __init__(self):
-        self._rpi = RaspberryPi()
-        self._camera = Camera()
-        self._motors = Motors()
-        self._leds = Leds()
-        self._buzzer = Buzzer()
-        self._rc_receiver = RCReceiver()
-        self._distance_sensor = DistanceSensor()
-        self._line_trackers = LineTrackers()
-        self._proximity_sensors = ProximitySensors()
+    def __init__(self, backend: Optional[Backend] = None):
+        """
+        Parameters
+        ----------
+        backend : Backend | None
+            The libraries for accessing the hardware, e.g. a
+            hardware.SimulatedBackend for running off the robot. Defaults to
+            the installed Raspberry Pi libraries, see
+            hardware.default_backend().
+        """
+        self._backend = backend
+        self._rpi = RaspberryPi(backend)
+        self._camera = Camera(backend)
+        self._motors = Motors(backend)
+        self._leds = Leds(backend)
+        self._buzzer = Buzzer(backend)
+        self._rc_receiver = RCReceiver(backend)
+        self._distance_sensor = DistanceSensor(backend)
+        self._line_trackers = LineTrackers(backend)
+        self._proximity_sensors = ProximitySensors(backend)
         self._speaker = Speaker()
+        self._line_follower = LineFollower(self._line_trackers, self._motors)
+
+        # Coroutine functions for reading the sampled status fields
+        self._status_readers = dict(
+            cpu_load=self.rpi.async_get_cpu_load,
+            distance_sensor_value=self.distance_sensor.async_get_distance,
+            left_proximity_value=self.proximity_sensors.async_get_left_proximity,
+            right_proximity_value=self.proximity_sensors.async_get_right_proximity,
+            line_tracker_values=self.line_trackers.async_read_analog_values,
+        )
+        # The latest values of the sampled status fields and their read times
+        self._status_values = dict()
+        self._status_times = dict()
+        # The reads in progress of the sampled status fields, shared by
+        # concurrent callers
+        self._status_reads: Dict[str, aio.Future] = dict()
+
+    @property
+    def backend(self) -> Optional[Backend]:
+        """The backend given on construction."""
+        return self._backend
 
     @property
     def rpi(self):
@@ -82,16 +131,50 @@ class Serobot:
     def speaker(self):
         return self._speaker
 
-    async def get_status(self) -> SerobotStatus:
-        status = list(await aio.gather(
-            self.rpi.async_get_cpu_load(),
-            self.distance_sensor.async_get_distance(),
-            self.proximity_sensors.async_get_left_proximity(),
-            self.proximity_sensors.async_get_right_proximity(),
-            self.line_trackers.async_read_analog_values()
-        ))
-        status.extend([self.leds.brightness,
-                       self.buzzer.on,
-                       self.camera.camera.exposure_speed])
-
-        return SerobotStatus(*status)
+    @property
+    def line_follower(self) -> LineFollower:
+        return self._line_follower
+
+    async def get_status(self, max_age: Optional[float] = None) -> SerobotStatus:
+        """Get the hardware status.
+
+        A sampled status field is read from the hardware only if its cached
+        value is older than the sampling period of the field, see
+        SerobotStatus.sampling_periods(). Concurrent callers share the reads
+        in progress, and the fields that are fresh enough are returned without
+        waiting for the others.
+
+        Parameters
+        ----------
+        max_age : float | None
+            If given, the maximum age of the cached values to be returned, in
+            seconds, used for all fields instead of their sampling periods.
+        """
+        now = time.monotonic()
+        reads = []
+        for name, period in SerobotStatus.sampling_periods().items():
+            if (now - self._status_times.get(name, -math.inf)
+                    > (period if max_age is None else max_age)):
+                read = self._status_reads.get(name)
+                if read is None:
+                    read = self._status_reads[name] = aio.ensure_future(
+                        self._read_status_field(name))
+                reads.append(read)
+
+        # A cancelled caller must not cancel the reads shared with others.
+        await aio.gather(*(aio.shield(read) for read in reads))
+
+        return SerobotStatus(
+            **self._status_values,
+            led_brightness=self.leds.brightness,
+            buzzer_on=self.buzzer.on,
+            camera_exposure=(self.camera.camera.exposure_speed
+                             if self.camera.camera is not None else None))
+
+    async def _read_status_field(self, name: str):
+        """Read a sampled status field from the hardware to the cache."""
+        try:
+            self._status_values[name] = await self._status_readers[name]()
+            self._status_times[name] = time.monotonic()
+        finally:
+            del self._status_reads[name]
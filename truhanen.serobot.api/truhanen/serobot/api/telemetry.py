@@ -0,0 +1,385 @@
+
+from array import array
+import asyncio as aio
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import struct
+import sys
+import time
+from typing import Sequence, List, Dict, Optional, Iterable, Union, BinaryIO
+
+import numpy as np
+
+from .hardware import Motors
+from .serobot import Serobot, SerobotStatus
+from .hardware.scheduler import hardware_scheduler, Priority
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TelemetryColumn:
+    """Column of a telemetry log."""
+    name: str
+    # Type code of the array module, one of _typecodes
+    typecode: str
+
+
+# The fixed-width type codes that have the same size on every platform
+_typecodes = 'bBhHiIqQfd'
+
+# Chunk file header: magic, format version, byte order ('<' or '>'), column
+# count, capacity and count of the samples
+_header = struct.Struct('<4sBcHII')
+_magic = b'SRTL'
+_version = 1
+# Offset of the sample count in the header, updated after each write
+_sample_count_offset = 12
+# Column table entry: name and type code
+_column_entry = struct.Struct('<32sc7x')
+# Alignment of the column regions, in bytes
+_alignment = 8
+
+_chunk_suffix = '.tlm'
+
+# Line tracker values of a status whose line trackers could not be read
+_missing_line_tracker_value = -1
+
+# Columns of the Serobot telemetry, see serobot_telemetry_values()
+serobot_telemetry_columns = (
+    TelemetryColumn('timestamp', 'd'),
+    TelemetryColumn('cpu_load', 'f'),
+    TelemetryColumn('distance', 'f'),
+    TelemetryColumn('left_proximity', 'b'),
+    TelemetryColumn('right_proximity', 'b'),
+    *(TelemetryColumn(f'line_tracker_{i}', 'h') for i in range(5)),
+    TelemetryColumn('motor_left_target', 'f'),
+    TelemetryColumn('motor_right_target', 'f'),
+    TelemetryColumn('motor_left_dc', 'f'),
+    TelemetryColumn('motor_right_dc', 'f'),
+)
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _alignment) * _alignment
+
+
+def _region_offsets(columns: Sequence[TelemetryColumn], capacity: int) -> List[int]:
+    """The file offsets of the column regions of a chunk."""
+    offsets = []
+    offset = _aligned(_header.size + len(columns) * _column_entry.size)
+    for column in columns:
+        offsets.append(offset)
+        offset = _aligned(offset + capacity * array(column.typecode).itemsize)
+    offsets.append(offset)
+    return offsets
+
+
+class TelemetryRecorder:
+    """Recorder of timestamped samples into a columnar binary log.
+
+    The samples are appended to one array per column, and written by a
+    background task through the hardware scheduler, so that the event loop
+    never waits for the storage. The log is a directory of chunk files. Each
+    chunk has a fixed capacity of samples and consists of a header, a column
+    table, and a preallocated fixed-width region per column, so that each
+    column can be memory-mapped as is, see open_telemetry_chunk(). When a
+    chunk is full, the recording continues in a new one.
+
+    Use as an async context manager, or call start() and close().
+    """
+    # Device name for the hardware scheduler
+    io_device = 'telemetry'
+
+    def __init__(self, directory: Union[str, Path],
+                 columns: Sequence[TelemetryColumn] = serobot_telemetry_columns,
+                 chunk_capacity: int = 65536, flush_period: float = 1.):
+        """
+        Parameters
+        ----------
+        directory : str | Path
+            Directory of the chunk files. Created if missing. The chunks are
+            numbered after the existing ones.
+        columns : Sequence[TelemetryColumn]
+            The columns of the samples.
+        chunk_capacity : int
+            The number of samples in each chunk file.
+        flush_period : float
+            Interval of writing the recorded samples, in seconds. Longer
+            intervals mean fewer and larger writes.
+        """
+        for column in columns:
+            if column.typecode not in _typecodes:
+                raise ValueError(f'Unsupported type code of {column}.')
+            if len(column.name.encode()) > 32:
+                raise ValueError(f'Too long column name {column.name!r}.')
+        self._directory = Path(directory)
+        self._columns = tuple(columns)
+        self._chunk_capacity = chunk_capacity
+        self._flush_period = flush_period
+        self._region_offsets = _region_offsets(self._columns, chunk_capacity)
+        self._itemsizes = [array(column.typecode).itemsize for column in self._columns]
+
+        # Samples not yet passed to the writer
+        self._buffers = self._create_buffers()
+        self._flush_task: Optional[aio.Task] = None
+
+        # State of the writer, accessed only in the worker of io_device
+        self._chunk_index = self._next_chunk_index()
+        self._file: Optional[BinaryIO] = None
+        self._file_sample_count = 0
+        self._written_sample_count = 0
+
+    async def __aenter__(self) -> 'TelemetryRecorder':
+        self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    @property
+    def columns(self) -> Sequence[TelemetryColumn]:
+        return self._columns
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def buffered_sample_count(self) -> int:
+        """The number of recorded samples not yet passed to the writer."""
+        return len(self._buffers[0])
+
+    @property
+    def written_sample_count(self) -> int:
+        return self._written_sample_count
+
+    def _create_buffers(self) -> List[array]:
+        return [array(column.typecode) for column in self._columns]
+
+    def _next_chunk_index(self) -> int:
+        indices = [int(path.stem) for path in self._directory.glob(f'*{_chunk_suffix}')
+                   if path.stem.isdigit()]
+        return max(indices, default=-1) + 1
+
+    def start(self):
+        """Start the background task writing the samples. Must be called from
+        the running event loop.
+        """
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = aio.get_running_loop().create_task(self._flush_worker())
+
+    async def close(self):
+        """Write the remaining samples and close the chunk file."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except aio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await hardware_scheduler.run(self.io_device, self._close_file)
+
+    def record(self, values: Sequence):
+        """Append a sample, i.e. one value per column. Cheap enough for
+        recording at hundreds of samples per second. A sample with a wrong
+        number or type of values raises an error, and is not recorded.
+        """
+        buffers = self._buffers
+        if len(values) != len(buffers):
+            raise ValueError(f'Expected {len(buffers)} values, got {len(values)}.')
+        sample_count = len(buffers[0])
+        try:
+            for buffer, value in zip(buffers, values):
+                buffer.append(value)
+        except (TypeError, OverflowError):
+            # Keep the columns of the same length.
+            for buffer in buffers:
+                del buffer[sample_count:]
+            raise
+
+    async def flush(self):
+        """Write the recorded samples. The samples that could not be written
+        are kept for the next flush.
+        """
+        if not self.buffered_sample_count:
+            return
+        # Samples recorded during the write go to new buffers.
+        buffers, self._buffers = self._buffers, self._create_buffers()
+        written_sample_count = self._written_sample_count
+        try:
+            await hardware_scheduler.run(
+                self.io_device, self._write, buffers, priority=Priority.LOW)
+        except Exception:
+            # Put back the unwritten samples, before those recorded meanwhile.
+            written_count = self._written_sample_count - written_sample_count
+            self._buffers = [buffer[written_count:] + new_buffer
+                             for buffer, new_buffer in zip(buffers, self._buffers)]
+            raise
+
+    async def _flush_worker(self):
+        while True:
+            await aio.sleep(self._flush_period)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Could not write the telemetry.')
+
+    def _open_chunk(self):
+        """Create the next chunk file. Called in the worker of io_device."""
+        self._close_file()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self._directory / f'{self._chunk_index:06d}{_chunk_suffix}'
+        self._chunk_index += 1
+        self._file = open(path, 'w+b')
+        byteorder = b'<' if sys.byteorder == 'little' else b'>'
+        self._file.write(_header.pack(
+            _magic, _version, byteorder, len(self._columns),
+            self._chunk_capacity, 0))
+        for column in self._columns:
+            self._file.write(_column_entry.pack(
+                column.name.encode(), column.typecode.encode()))
+        # Preallocate the column regions.
+        self._file.truncate(self._region_offsets[-1])
+        self._file_sample_count = 0
+        logger.info('Recording telemetry to %s.', path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, buffers: List[array]):
+        """Write samples to the chunk files. Called in the worker of
+        io_device.
+        """
+        sample_count = len(buffers[0])
+        start = 0
+        while start < sample_count:
+            if self._file is None or self._file_sample_count == self._chunk_capacity:
+                self._open_chunk()
+            end = min(sample_count,
+                      start + self._chunk_capacity - self._file_sample_count)
+            for buffer, offset, itemsize in zip(
+                    buffers, self._region_offsets, self._itemsizes):
+                self._file.seek(offset + self._file_sample_count * itemsize)
+                self._file.write(memoryview(buffer)[start:end])
+            self._file_sample_count += end - start
+            # Update the count after the data, so that a chunk is consistent
+            # even if the recording is interrupted.
+            self._file.seek(_sample_count_offset)
+            self._file.write(struct.pack('<I', self._file_sample_count))
+            self._file.flush()
+            self._written_sample_count += end - start
+            start = end
+
+
+def serobot_telemetry_values(timestamp: float, status: SerobotStatus,
+                             motors: Motors) -> tuple:
+    """The values of a sample of serobot_telemetry_columns."""
+    line_tracker_values = status.line_tracker_values
+    if line_tracker_values is None:
+        line_tracker_values = (_missing_line_tracker_value, ) * 5
+    return (
+        timestamp,
+        status.cpu_load,
+        status.distance_sensor_value,
+        status.left_proximity_value,
+        status.right_proximity_value,
+        *line_tracker_values,
+        *motors.velocity_target,
+        *motors.velocity,
+    )
+
+
+async def record_serobot_telemetry(bot: Serobot, recorder: TelemetryRecorder,
+                                   period: float = .01):
+    """Coroutine for recording the status of a Serobot, and its motor
+    setpoints and duty cycles, into a recorder with the
+    serobot_telemetry_columns.
+
+    Parameters
+    ----------
+    period : float
+        Interval of the samples, in seconds. The status fields are read from
+        the hardware according to their own sampling periods, see
+        SerobotStatus.sampling_periods(). A sample that cannot be read or
+        recorded is logged and skipped.
+    """
+    while True:
+        try:
+            status = await bot.get_status()
+            recorder.record(serobot_telemetry_values(time.time(), status, bot.motors))
+        except aio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Could not record a telemetry sample.')
+        await aio.sleep(period)
+
+
+def open_telemetry_chunk(path: Union[str, Path], mmap: bool = True) -> Dict[str, np.ndarray]:
+    """Load a chunk file written by TelemetryRecorder.
+
+    Parameters
+    ----------
+    path : str | Path
+        The chunk file.
+    mmap : bool
+        If True, the columns are read-only memory maps of the file.
+        Otherwise they are read into arrays.
+
+    Returns
+    -------
+    columns : Dict[str, numpy.ndarray]
+        The written samples of each column.
+    """
+    with open(path, 'rb') as file:
+        magic, version, byteorder, column_count, capacity, sample_count = \
+            _header.unpack(file.read(_header.size))
+        if magic != _magic or version != _version:
+            raise ValueError(f'{path} is not a telemetry chunk of version {_version}.')
+        columns = []
+        for _ in range(column_count):
+            name, typecode = _column_entry.unpack(file.read(_column_entry.size))
+            columns.append(TelemetryColumn(
+                name.rstrip(b'\0').decode(), typecode.decode()))
+
+        data = dict()
+        for column, offset in zip(columns, _region_offsets(columns, capacity)):
+            dtype = np.dtype(byteorder.decode() + column.typecode)
+            if mmap and sample_count > 0:
+                data[column.name] = np.memmap(
+                    path, dtype=dtype, mode='r', offset=offset, shape=(sample_count,))
+            else:
+                file.seek(offset)
+                data[column.name] = np.fromfile(file, dtype=dtype, count=sample_count)
+    return data
+
+
+def read_telemetry(directory: Union[str, Path],
+                   chunk_paths: Optional[Iterable[Path]] = None) -> Dict[str, np.ndarray]:
+    """Load the chunks of a telemetry log into arrays, in recording order.
+
+    Parameters
+    ----------
+    directory : str | Path
+        The directory of the chunk files.
+    chunk_paths : Iterable[Path] | None
+        The chunks to be loaded. By default all chunks in the directory.
+
+    Returns
+    -------
+    columns : Dict[str, numpy.ndarray]
+        The samples of each column, concatenated over the chunks.
+    """
+    if chunk_paths is None:
+        chunk_paths = sorted(Path(directory).glob(f'*{_chunk_suffix}'))
+    chunks = [open_telemetry_chunk(path, mmap=True) for path in chunk_paths]
+    if not chunks:
+        return dict()
+    return {name: np.concatenate([chunk[name] for chunk in chunks])
+            for name in chunks[0]}
@@ -0,0 +1,25 @@
+
+from pathlib import Path
+
+from setuptools import setup, find_namespace_packages
+
+
+setup(
+    name='truhanen.serobot.benchmark',
+    version='0.1.0',
+    author='Tuukka Ruhanen',
+    author_email='tuukka.t.ruhanen@gmail.com',
+    description='Performance benchmarks of the Raspberry Pi robot software.',
+    install_requires=[
+        # Serobot API & web server
+        'truhanen.serobot.api',
+        'truhanen.serobot.web',
+        # Web clients
+        'aiohttp',
+    ],
+    packages=find_namespace_packages(),
+    scripts=[
+        str(Path(__file__).parent / 'scripts' / 'run_serobot_benchmark'),
+    ],
+    zip_safe=False,
+)
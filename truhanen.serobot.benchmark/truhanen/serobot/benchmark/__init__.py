@@ -0,0 +1,3 @@
+
+from .hardware_calls import benchmark_hardware_calls
+from .summary import latency_summary
@@ -0,0 +1,136 @@
+
+import tempfile
+import time
+from typing import Dict, Optional, Any
+
+from truhanen.serobot.api import Serobot, TelemetryRecorder
+from truhanen.serobot.api.telemetry import serobot_telemetry_values
+from truhanen.serobot.api.hardware import SimulatedBackend
+
+from .summary import latency_summary
+
+
+async def benchmark_get_status(bot: Serobot, duration: float,
+                               max_age: Optional[float] = None) -> Dict[str, float]:
+    """Measure the latency of Serobot.get_status() called repeatedly.
+
+    Parameters
+    ----------
+    bot : Serobot
+        The measured instance.
+    duration : float
+        The duration of the measurement, in seconds.
+    max_age : float | None
+        Passed to get_status(). Zero measures reading every status field
+        from the hardware, and None the use of the sampling periods.
+
+    Returns
+    -------
+    summary : Dict[str, float]
+        See latency_summary().
+    """
+    latencies = []
+    end_time = time.monotonic() + duration
+    while time.monotonic() < end_time:
+        start_time = time.perf_counter()
+        await bot.get_status(max_age=max_age)
+        latencies.append(time.perf_counter() - start_time)
+    return latency_summary(latencies)
+
+
+def benchmark_line_trackers(bot: Serobot, duration: float) -> Dict[str, float]:
+    """Measure the rate of reading the line trackers with
+    LineTrackers.read_analog_values().
+
+    Returns
+    -------
+    summary : Dict[str, float]
+        See latency_summary(), and 'rate', the reads per second.
+    """
+    latencies = []
+    start_time = time.perf_counter()
+    end_time = start_time + duration
+    read_start_time = start_time
+    while read_start_time < end_time:
+        bot.line_trackers.read_analog_values()
+        read_end_time = time.perf_counter()
+        latencies.append(read_end_time - read_start_time)
+        read_start_time = read_end_time
+    summary = latency_summary(latencies)
+    summary['rate'] = len(latencies) / (read_start_time - start_time)
+    return summary
+
+
+def benchmark_servo_updates(bot: Serobot, backend: SimulatedBackend,
+                            number: int) -> Dict[str, float]:
+    """Measure the cost of updating a camera servo position via the PCA.
+
+    Returns
+    -------
+    results : Dict[str, float]
+        'time_per_update' in seconds, and 'i2c_transactions_per_update'.
+    """
+    camera = bot.camera
+    pan_values = (camera.pan_center_value - 100, camera.pan_center_value + 100)
+    transaction_count = backend.smbus.transaction_count
+    start_time = time.perf_counter()
+    for i in range(number):
+        camera.pan_value = pan_values[i % 2]
+    elapsed_time = time.perf_counter() - start_time
+    camera.set_to_center()
+    return dict(
+        time_per_update=elapsed_time / number,
+        i2c_transactions_per_update=(
+            backend.smbus.transaction_count - transaction_count) / number,
+    )
+
+
+async def benchmark_telemetry(bot: Serobot, number: int) -> Dict[str, float]:
+    """Measure the cost of recording Serobot telemetry samples and the rate
+    of writing them to a temporary directory.
+
+    Returns
+    -------
+    results : Dict[str, float]
+        'time_per_record' in seconds, and 'write_samples_per_second'.
+    """
+    values = serobot_telemetry_values(time.time(), await bot.get_status(), bot.motors)
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = TelemetryRecorder(directory)
+        start_time = time.perf_counter()
+        for _ in range(number):
+            recorder.record(values)
+        record_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        await recorder.close()
+        write_time = time.perf_counter() - start_time
+    return dict(
+        time_per_record=record_time / number,
+        write_samples_per_second=number / write_time,
+    )
+
+
+async def run(duration: float = 2., number: int = 1000,
+              backend: Optional[SimulatedBackend] = None) -> Dict[str, Any]:
+    """Measure the API with simulated hardware.
+
+    Parameters
+    ----------
+    duration : float
+        The duration of each timed measurement, in seconds.
+    number : int
+        The number of servo updates. 100 times as many telemetry samples
+        are recorded.
+    backend : SimulatedBackend | None
+        The simulation, e.g. with nonzero call and transaction times. By
+        default without delays, which measures the cost of the software.
+    """
+    backend = backend or SimulatedBackend()
+    bot = Serobot(backend=backend)
+    return dict(
+        get_status_uncached=await benchmark_get_status(bot, duration, max_age=0.),
+        get_status_cached=await benchmark_get_status(bot, duration),
+        line_trackers=benchmark_line_trackers(bot, duration),
+        servo_updates=benchmark_servo_updates(bot, backend, number),
+        telemetry=await benchmark_telemetry(bot, 100 * number),
+    )
@@ -0,0 +1,89 @@
+
+import timeit
+from typing import Callable, Dict
+
+from truhanen.serobot.api.hardware import (
+    Backend, LineTrackers, SimulatedBackend, Counter, Histogram)
+from truhanen.serobot.api.hardware.bcm_channel import BcmChannel
+from truhanen.serobot.api.hardware.gpio import (
+    GpioInput, GpioOutput, GpioPwm, GpioState)
+from truhanen.serobot.api.hardware._pca import PCA
+
+
+def time_per_call(function: Callable[[], object], number: int,
+                  repeat: int = 5) -> float:
+    """The best average time of calling a function, in seconds.
+
+    Parameters
+    ----------
+    function : Callable[[], object]
+        The function to be timed.
+    number : int
+        The number of calls in each timing.
+    repeat : int
+        The number of timings, of which the fastest one is used.
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def benchmark_hardware_calls(backend: Backend, number: int = 10000) -> Dict[str, float]:
+    """Measure the cost of the frequent calls of the hardware classes.
+
+    Parameters
+    ----------
+    backend : Backend
+        The backend of the hardware classes.
+    number : int
+        The number of calls in each timing. The line tracker reads, which
+        consist of hundreds of GPIO calls, are called number / 100 times.
+
+    Returns
+    -------
+    times : Dict[str, float]
+        Time per call of each measured operation, in seconds.
+    """
+    gpio_input = GpioInput(BcmChannel.proximity_sensor_left, backend=backend)
+    gpio_output = GpioOutput(BcmChannel.buzzer, backend=backend)
+    gpio_pwm = GpioPwm(BcmChannel.motor_left_pwm, frequency=500, backend=backend)
+    pca = PCA(backend=backend)
+    line_trackers = LineTrackers(backend=backend)
+
+    def set_output_state():
+        gpio_output.state = GpioState.LOW
+
+    def set_pwm_duty_cycle():
+        gpio_pwm.duty_cycle = 50
+
+    def write_pca_register():
+        pca.write(PCA._LED0_OFF_L, 0, force=True)
+
+    # The instrumentation of the hot paths, see the metrics module
+    counter = Counter('benchmark_total', 'Benchmark counter.')
+    histogram = Histogram('benchmark_seconds', 'Benchmark histogram.')
+
+    return dict(
+        gpio_input_state=time_per_call(lambda: gpio_input.state, number),
+        gpio_output_state=time_per_call(set_output_state, number),
+        gpio_pwm_duty_cycle=time_per_call(set_pwm_duty_cycle, number),
+        pca_write=time_per_call(write_pca_register, number),
+        line_trackers_read=time_per_call(
+            line_trackers.read_analog_values, max(1, number // 100)),
+        metrics_counter_inc=time_per_call(counter.inc, number),
+        metrics_histogram_observe=time_per_call(
+            lambda: histogram.observe(.003), number),
+    )
+
+
+def run(number: int = 10000) -> Dict[str, Dict[str, float]]:
+    """Measure the cost of the hardware calls without the hardware libraries,
+    and with the simulated ones.
+
+    Returns
+    -------
+    results : Dict[str, Dict[str, float]]
+        The results of benchmark_hardware_calls() of each backend.
+    """
+    return dict(
+        no_hardware=benchmark_hardware_calls(Backend(), number),
+        simulated=benchmark_hardware_calls(SimulatedBackend(), number),
+    )
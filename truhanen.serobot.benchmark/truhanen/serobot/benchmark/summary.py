@@ -0,0 +1,29 @@
+
+import statistics
+from typing import Dict, Sequence
+
+
+def latency_summary(latencies: Sequence[float]) -> Dict[str, float]:
+    """Summarize measured latencies.
+
+    Parameters
+    ----------
+    latencies : Sequence[float]
+        The latencies in seconds.
+
+    Returns
+    -------
+    summary : Dict[str, float]
+        'count', and the 'mean', 'median', 'p95' (95th percentile), and
+        'max' latency in seconds. The latencies are None if there are none.
+    """
+    if not latencies:
+        return dict(count=0, mean=None, median=None, p95=None, max=None)
+    ordered = sorted(latencies)
+    return dict(
+        count=len(ordered),
+        mean=statistics.mean(ordered),
+        median=statistics.median(ordered),
+        p95=ordered[min(len(ordered) - 1, int(.95 * len(ordered)))],
+        max=ordered[-1],
+    )
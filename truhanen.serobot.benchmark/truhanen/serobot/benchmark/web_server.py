@@ -0,0 +1,212 @@
+
+import asyncio as aio
+import logging
+from pathlib import Path
+import secrets
+import tempfile
+import time
+from typing import Dict, Any, Sequence, List
+
+import aiohttp
+
+from truhanen.serobot.web import SerobotServer
+
+from .summary import latency_summary
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+# Username of the client sessions
+_username = 'benchmark'
+# The multipart boundary of the video stream, see SerobotServer
+_video_boundary = b'--ffserver'
+
+
+async def _login(url: str, password: str, timeout: float = 10.) -> aiohttp.ClientSession:
+    """Create a client session logged in to the server. Retry until the
+    server accepts connections, or the timeout expires.
+    """
+    # The session cookie is set for an IP address, which requires an
+    # unsafe cookie jar.
+    session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+    end_time = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.post(
+                    f'{url}/login', data=dict(username=_username, password=password),
+                    allow_redirects=False) as response:
+                if response.status != 302:
+                    raise RuntimeError(f'Login failed with status {response.status}.')
+            return session
+        except aiohttp.ClientConnectionError:
+            if time.monotonic() > end_time:
+                await session.close()
+                raise
+            await aio.sleep(.1)
+
+
+async def _websocket_client(session: aiohttp.ClientSession, url: str,
+                            duration: float) -> List[float]:
+    """Send command batches one at a time, each after the acknowledgement of
+    the previous one.
+
+    Returns
+    -------
+    latencies : List[float]
+        The round-trip time of each batch, in seconds.
+    """
+    latencies = []
+    async with session.ws_connect(f'{url}/ws') as ws:
+        seq = 0
+        end_time = time.monotonic() + duration
+        while time.monotonic() < end_time:
+            seq += 1
+            send_time = time.perf_counter()
+            await ws.send_json(dict(batch=[
+                dict(seq=seq, command=dict(led_brightness=seq % 256))]))
+            # Skip the status and log messages sent meanwhile.
+            while True:
+                message = await ws.receive_json()
+                if message.get('ack', {}).get('seq') == seq:
+                    break
+            latencies.append(time.perf_counter() - send_time)
+    return latencies
+
+
+async def _video_client(session: aiohttp.ClientSession, url: str,
+                        duration: float) -> Dict[str, float]:
+    """Receive the video stream.
+
+    Returns
+    -------
+    results : Dict[str, float]
+        'fps', the received images per second, and 'bytes_per_second'.
+    """
+    frame_count = 0
+    byte_count = 0
+    # End of the previous chunk, in case a boundary is split between chunks
+    tail = b''
+    async with session.get(f'{url}/video') as response:
+        start_time = time.monotonic()
+        end_time = start_time + duration
+        while True:
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                break
+            try:
+                chunk = await aio.wait_for(
+                    response.content.readany(), remaining_time)
+            except aio.TimeoutError:
+                break
+            if not chunk:
+                break
+            byte_count += len(chunk)
+            data = tail + chunk
+            frame_count += data.count(_video_boundary)
+            tail = data[-(len(_video_boundary) - 1):]
+        elapsed_time = time.monotonic() - start_time
+    return dict(fps=frame_count / elapsed_time,
+                bytes_per_second=byte_count / elapsed_time)
+
+
+async def benchmark_websocket(url: str, password: str, client_count: int,
+                              duration: float) -> Dict[str, float]:
+    """Measure the round-trip time of command batches, from sending a batch
+    to receiving its acknowledgement, with concurrent websocket clients.
+
+    Returns
+    -------
+    summary : Dict[str, float]
+        See latency_summary(), over the batches of all clients.
+    """
+    sessions = [await _login(url, password) for _ in range(client_count)]
+    try:
+        client_latencies = await aio.gather(*(
+            _websocket_client(session, url, duration) for session in sessions))
+    finally:
+        for session in sessions:
+            await session.close()
+    return latency_summary([latency for latencies in client_latencies
+                            for latency in latencies])
+
+
+async def benchmark_video(url: str, password: str, client_count: int,
+                          duration: float) -> Dict[str, float]:
+    """Measure the video stream with concurrent viewers.
+
+    Returns
+    -------
+    results : Dict[str, float]
+        'mean_fps' and 'min_fps' of the viewers, and 'mean_bytes_per_second'
+        and 'total_bytes_per_second'.
+    """
+    sessions = [await _login(url, password) for _ in range(client_count)]
+    try:
+        client_results = await aio.gather(*(
+            _video_client(session, url, duration) for session in sessions))
+    finally:
+        for session in sessions:
+            await session.close()
+    fps_values = [result['fps'] for result in client_results]
+    byte_rates = [result['bytes_per_second'] for result in client_results]
+    return dict(
+        mean_fps=sum(fps_values) / client_count,
+        min_fps=min(fps_values),
+        mean_bytes_per_second=sum(byte_rates) / client_count,
+        total_bytes_per_second=sum(byte_rates),
+    )
+
+
+async def run(client_counts: Sequence[int] = (1, 4, 16), duration: float = 5.,
+              port: int = 8080) -> Dict[str, Any]:
+    """Measure a SerobotServer with simulated hardware, running in the
+    current event loop.
+
+    Parameters
+    ----------
+    client_counts : Sequence[int]
+        The numbers of concurrent clients to be measured.
+    duration : float
+        The duration of each measurement, in seconds.
+    port : int
+        The port of the server, on localhost.
+
+    Returns
+    -------
+    results : Dict[str, Any]
+        'websocket' and 'video', mapping the client counts to the results of
+        benchmark_websocket() and benchmark_video().
+    """
+    password = secrets.token_urlsafe()
+    url = f'http://127.0.0.1:{port}'
+    results = dict(websocket=dict(), video=dict())
+
+    with tempfile.TemporaryDirectory() as directory:
+        auth_file = Path(directory) / 'benchmark_users.conf'
+        auth_file.write_text(f'[{_username}]\npassword = {password}\n')
+        server = SerobotServer(auth_file=auth_file, simulate=True, port=port,
+                               motor_watchdog_timeout=None)
+
+    server_task = aio.create_task(server.start())
+    try:
+        # Wait for the server to start.
+        session = await _login(url, password)
+        await session.close()
+
+        for client_count in client_counts:
+            logger.info('Measuring %d websocket clients.', client_count)
+            results['websocket'][client_count] = await benchmark_websocket(
+                url, password, client_count, duration)
+        for client_count in client_counts:
+            logger.info('Measuring %d video clients.', client_count)
+            results['video'][client_count] = await benchmark_video(
+                url, password, client_count, duration)
+    finally:
+        server_task.cancel()
+        try:
+            await server_task
+        except aio.CancelledError:
+            pass
+
+    return results
@@ -0,0 +1,167 @@
+
+import asyncio as aio
+from collections import deque
+from typing import Any, Set, List, Iterable
+
+
+class _Subscription:
+    """Base class for subscriptions to the broadcasters of this module."""
+    def __init__(self, broadcaster):
+        self._broadcaster = broadcaster
+        self._event = aio.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Stop receiving values from the broadcaster."""
+        self._broadcaster.unsubscribe(self)
+
+
+class LatestValueSubscription(_Subscription):
+    """Subscription to a LatestValueBroadcaster.
+
+    Holds only the newest published value. If the subscriber does not keep up
+    with the publisher, the older values are dropped.
+    """
+    def __init__(self, broadcaster: 'LatestValueBroadcaster'):
+        super().__init__(broadcaster)
+        self._value = None
+
+    def put(self, value: Any):
+        """Replace the current value of the slot. Called by the broadcaster."""
+        self._value = value
+        self._event.set()
+
+    async def get(self) -> Any:
+        """Wait for and return the newest value not yet returned."""
+        await self._event.wait()
+        self._event.clear()
+        value = self._value
+        # Do not keep a reference to the value after it has been consumed.
+        self._value = None
+        return value
+
+
+class LatestValueBroadcaster:
+    """Fan-out of published values to any number of subscribers.
+
+    Each subscriber has its own single-value slot, so that a slow subscriber
+    only drops values instead of slowing down the publisher or the other
+    subscribers. The published values are shared, not copied.
+    """
+    def __init__(self):
+        self._subscriptions: Set[LatestValueSubscription] = set()
+        self._latest = None
+
+    @property
+    def latest(self) -> Any:
+        """The latest published value, or None."""
+        return self._latest
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self) -> LatestValueSubscription:
+        """Create a new subscription. Use it as a context manager or call
+        its close() method when the subscriber is done.
+        """
+        subscription = LatestValueSubscription(self)
+        # Let the new subscriber start from the latest value.
+        if self._latest is not None:
+            subscription.put(self._latest)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LatestValueSubscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, value: Any):
+        """Pass a value to all current subscribers."""
+        self._latest = value
+        for subscription in self._subscriptions:
+            subscription.put(value)
+
+
+class BatchSubscription(_Subscription):
+    """Subscription to a RingBufferBroadcaster.
+
+    Collects the published values until they are consumed. At most maxlen
+    values are kept, the oldest ones being dropped first.
+    """
+    def __init__(self, broadcaster: 'RingBufferBroadcaster', maxlen: int,
+                 values: Iterable[Any] = ()):
+        super().__init__(broadcaster)
+        self._values = deque(values, maxlen=maxlen)
+        if self._values:
+            self._event.set()
+
+    @property
+    def pending_count(self) -> int:
+        """The number of values waiting to be consumed."""
+        return len(self._values)
+
+    def put(self, value: Any):
+        """Add a value to the subscription. Called by the broadcaster."""
+        self._values.append(value)
+        self._event.set()
+
+    async def get(self) -> List[Any]:
+        """Wait for and return all values not yet returned, oldest first."""
+        await self._event.wait()
+        self._event.clear()
+        values = list(self._values)
+        self._values.clear()
+        return values
+
+
+class RingBufferBroadcaster:
+    """Fan-out of published values to any number of subscribers, keeping
+    the latest values in a ring buffer.
+
+    New subscribers first receive the values in the ring buffer. Memory use
+    is bounded by maxlen values for the broadcaster and for each subscriber,
+    whether or not anybody consumes the values.
+    """
+    def __init__(self, maxlen: int = 100):
+        """
+        Parameters
+        ----------
+        maxlen : int
+            The number of latest values to be kept.
+        """
+        self._maxlen = maxlen
+        self._values = deque(maxlen=maxlen)
+        self._subscriptions: Set[BatchSubscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    @property
+    def max_pending_count(self) -> int:
+        """The largest number of values waiting in a subscription."""
+        return max((subscription.pending_count
+                    for subscription in list(self._subscriptions)), default=0)
+
+    def subscribe(self) -> BatchSubscription:
+        """Create a new subscription that starts with the values in the ring
+        buffer. Use it as a context manager or call its close() method when
+        the subscriber is done.
+        """
+        subscription = BatchSubscription(self, self._maxlen, self._values)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: BatchSubscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, value: Any):
+        """Pass a value to all current subscribers and to the ring buffer."""
+        self._values.append(value)
+        for subscription in self._subscriptions:
+            subscription.put(value)
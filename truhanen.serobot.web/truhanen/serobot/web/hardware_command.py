@@ -1,10 +1,37 @@
 
 from abc import ABC, abstractmethod
 import asyncio as aio
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, List
+import weakref
+
+
+# Module-level logger
+logger = logging.getLogger(__name__)
+
+# The LED frames whose errors are logged, see _log_led_errors()
+_watched_led_frames = weakref.WeakSet()
+
+
+def _log_led_errors(frame_shown: aio.Future):
+    """Log the error of an LED frame that is requested without waiting for
+    it, see Leds.request_rgb(). The requests of the same frame share the
+    future, whose error is logged once.
+    """
+    def log_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('Could not show the LEDs.', exc_info=future.exception())
+
+    if frame_shown not in _watched_led_frames:
+        _watched_led_frames.add(frame_shown)
+        frame_shown.add_done_callback(log_error)
 
 
 class AbstractHardwareCommand(ABC):
+    # If True, a command of this type supersedes the earlier ones in the same
+    # batch, so only the last one needs to be performed.
+    coalescable = False
+
     def __init__(self, bot: 'truhanen.serobot.Serobot'):
         self._bot = bot
 
@@ -34,8 +61,8 @@ class CameraPanCommand(AbstractHardwareCommand):
         direction : 'left' | 'right'
         """
         delta = self.delta_map[direction]
-        aio.create_task(self.bot.camera.async_set_pan_value(
-            self.bot.camera.pan_value + delta))
+        # Relative to the target, so that no presses are lost while moving.
+        self.bot.camera.move_to(pan=self.bot.camera.pan_target + delta)
 
 
 class CameraTiltCommand(AbstractHardwareCommand):
@@ -48,13 +75,15 @@ class CameraTiltCommand(AbstractHardwareCommand):
         direction : 'up' | 'down'
         """
         delta = self.delta_map[direction]
-        aio.create_task(self.bot.camera.async_set_tilt_value(
-            self.bot.camera.tilt_value + delta))
+        # Relative to the target, so that no presses are lost while moving.
+        self.bot.camera.move_to(tilt=self.bot.camera.tilt_target + delta)
 
 
 class CameraCenterCommand(AbstractHardwareCommand):
+    coalescable = True
+
     async def command(self, _):
-        aio.create_task(self.bot.camera.async_set_to_center())
+        self.bot.camera.move_to_center()
 
 
 class RebootCommand(AbstractHardwareCommand):
@@ -63,6 +92,8 @@ class RebootCommand(AbstractHardwareCommand):
 
 
 class MotorCommand(AbstractHardwareCommand):
+    coalescable = True
+
     async def command(self, function_name):
         """
         Parameters
@@ -70,10 +101,40 @@ class MotorCommand(AbstractHardwareCommand):
         function_name : str
             The name of the method to be called on self.bot.motors
         """
+        # Manual driving takes over the line following.
+        self.bot.line_follower.stop()
         getattr(self.bot.motors, function_name)()
 
 
+class MotorKeepaliveCommand(AbstractHardwareCommand):
+    coalescable = True
+
+    async def command(self, _):
+        """Keep the motion of the motors going, see Motors.enable_watchdog()."""
+        self.bot.motors.keepalive()
+
+
+class LineFollowCommand(AbstractHardwareCommand):
+    coalescable = True
+
+    async def command(self, on: bool):
+        """
+        Parameters
+        ----------
+        on : bool
+            True to start following the line with self.bot.line_follower,
+            False to stop.
+        """
+        if on:
+            self.bot.line_follower.start()
+        else:
+            self.bot.line_follower.stop()
+
+
 class BuzzerCommand(AbstractHardwareCommand):
+    # Not coalescable, since a press and a release in the same batch would
+    # leave only the release.
+
     async def command(self, on: bool):
         """
         Parameters
@@ -85,6 +146,8 @@ class BuzzerCommand(AbstractHardwareCommand):
 
 
 class LedRgbCommand(AbstractHardwareCommand):
+    coalescable = True
+
     async def command(self, rgb_dict: Dict[str, int]):
         """
         Parameters
@@ -94,10 +157,14 @@ class LedRgbCommand(AbstractHardwareCommand):
             Values range between 0-255.
         """
         rgb_tuple = tuple(rgb_dict[key] for key in ['red', 'green', 'blue'])
-        aio.create_task(self.bot.leds.async_set_rgb(rgb_tuple))
+        # Only the latest colour is shown if they arrive faster than the
+        # refresh rate of the LEDs.
+        _log_led_errors(self.bot.leds.request_rgb(rgb_tuple))
 
 
 class LedBrightnessCommand(AbstractHardwareCommand):
+    coalescable = True
+
     async def command(self, brightness: int):
         """
         Parameters
@@ -105,7 +172,17 @@ class LedBrightnessCommand(AbstractHardwareCommand):
         brightness : int
             The brightness value to be set on self.bot.leds. Value range 0-255.
         """
-        aio.create_task(self.bot.leds.async_set_brightness(brightness))
+        _log_led_errors(self.bot.leds.request_brightness(brightness))
+
+
+def is_command_batch(batch: Any) -> bool:
+    """Whether a message received from the web frontend is a batch of the
+    form expected by HardwareCommander.command_batch().
+    """
+    return (isinstance(batch, list) and len(batch) > 0
+            and all(isinstance(item, dict) and 'seq' in item
+                    and isinstance(item.get('command'), dict)
+                    for item in batch))
 
 
 class HardwareCommander:
@@ -120,6 +197,8 @@ class HardwareCommander:
             camera_center=CameraCenterCommand(self.bot),
             reboot=RebootCommand(self.bot),
             motors=MotorCommand(self.bot),
+            motors_keepalive=MotorKeepaliveCommand(self.bot),
+            line_follow=LineFollowCommand(self.bot),
             buzzer=BuzzerCommand(self.bot),
             led_rgb=LedRgbCommand(self.bot),
             led_brightness=LedBrightnessCommand(self.bot),
@@ -157,3 +236,50 @@ class HardwareCommander:
             else:
                 unconsumed_commands[command_name] = parameters
         return unconsumed_commands
+
+    async def command_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Perform a batch of sequenced commands in order.
+
+        Of the coalescable commands, only the last one of each name in the
+        batch is performed.
+
+        Parameters
+        ----------
+        batch : List[Dict[str, Any]]
+            Batch message as received from the web frontend. Items are of the
+            form {'seq': int, 'command': Dict[str, Any]}, where 'seq' is a
+            sequence number increasing within the connection, and 'command'
+            is as the parameter of command().
+
+        Returns
+        -------
+        result : Dict[str, Any]
+            'seq': the sequence number of the last item of the batch.
+            'performed': the number of performed commands.
+            'coalesced': the number of commands skipped as superseded.
+            'unconsumed': commands that could not be performed.
+        """
+        commands = [(command_name, parameters)
+                    for item in batch
+                    for (command_name, parameters) in item['command'].items()]
+        last_indices = {command_name: i
+                        for (i, (command_name, _)) in enumerate(commands)}
+
+        performed_count = 0
+        coalesced_count = 0
+        unconsumed_commands = dict()
+        for i, (command_name, parameters) in enumerate(commands):
+            command = self.commands.get(command_name)
+            if command is None:
+                unconsumed_commands[command_name] = parameters
+            elif command.coalescable and last_indices[command_name] != i:
+                coalesced_count += 1
+            else:
+                await command.command(parameters)
+                performed_count += 1
+
+        return dict(
+            seq=batch[-1]['seq'] if batch else None,
+            performed=performed_count,
+            coalesced=coalesced_count,
+            unconsumed=unconsumed_commands)
@@ -1,12 +1,13 @@
 
 import json
 import asyncio as aio
+import time
 import async_timeout
-import io
 import logging
 from pathlib import Path
 import ssl
 import base64
+from collections import Counter
 from dataclasses import asdict
 
 from aiohttp import web, WSMsgType, ClientError
@@ -20,11 +21,14 @@ from aiohttp_security import (
     check_permission, check_authorized,
 )
 
-from truhanen.serobot.api import Serobot
+from truhanen.serobot.api import Serobot, TelemetryRecorder, record_serobot_telemetry
+from truhanen.serobot.api.hardware import (
+    SimulatedBackend, MetricsRegistry, metrics_registry)
 
 from .authorization import DictionaryAuthorizationPolicy, check_credentials
 from .user import User
-from .hardware_command import HardwareCommander
+from .hardware_command import HardwareCommander, is_command_batch
+from .broadcast import LatestValueBroadcaster, RingBufferBroadcaster
 
 
 # Module-level logger
@@ -32,7 +36,21 @@ logger = logging.getLogger(__name__)
 
 
 class SerobotServer:
-    def __init__(self, auth_file=None, ssl_certfile=None, ssl_keyfile=None):
+    # The number of latest log messages sent to new clients
+    client_log_length = 100
+    # The number of received command messages waiting to be performed
+    hardware_command_queue_size = 16
+    # Delay before restarting a failed background worker, in seconds
+    worker_restart_delay = 1.
+
+    # Multipart delimiters written around each JPEG image of the video stream
+    _video_part_header = b'--ffserver\r\nContent-Type: image/jpeg\r\n\r\n'
+    _video_part_footer = b'\r\n'
+
+    def __init__(self, auth_file=None, ssl_certfile=None, ssl_keyfile=None,
+                 status_period=.1, motor_watchdog_timeout=.5, simulate=False,
+                 port=None, metrics_public=False, telemetry_dir=None,
+                 telemetry_period=.01):
         """
         Parameters
         ----------
@@ -44,6 +62,28 @@ class SerobotServer:
             server listening on port 80.
         ssl_keyfile : Path | None
             See ssl_certfile.
+        status_period : float
+            Interval of updating the hardware status for the clients, in
+            seconds. Each status field is read from the hardware according
+            to its own sampling period, see SerobotStatus.sampling_periods().
+        motor_watchdog_timeout : float | None
+            Halt the motors if a client does not send keepalives within this
+            many seconds during a motion, see Motors.enable_watchdog(). If
+            None, the watchdog is disabled.
+        simulate : bool
+            If True, simulate the hardware of the robot instead of using the
+            actual one, see SimulatedBackend. For running the server on
+            another system than the robot.
+        port : int | None
+            The port of the server, instead of the default 443 or 80.
+        metrics_public : bool
+            If True, the /metrics route can be scraped without logging in.
+            Otherwise it requires the same authorization as the app.
+        telemetry_dir : Path | None
+            If given, record the hardware status into a telemetry log in
+            this directory, see TelemetryRecorder.
+        telemetry_period : float
+            Interval of the telemetry samples, in seconds.
         """
         if not auth_file:
             raise RuntimeError('Missing argument "auth_file".')
@@ -51,22 +91,47 @@ class SerobotServer:
 
         self._ssl_certfile = ssl_certfile
         self._ssl_keyfile = ssl_keyfile
+        self._status_period = status_period
+        self._port = port
+        self._metrics_public = metrics_public
+        self._telemetry_dir = telemetry_dir
+        self._telemetry_period = telemetry_period
 
-        self._bot = Serobot()
+        self._bot = Serobot(backend=SimulatedBackend() if simulate else None)
         self._hardware_commander = HardwareCommander(self.bot)
+        if motor_watchdog_timeout is not None:
+            self.bot.motors.enable_watchdog(motor_watchdog_timeout)
 
-        # These queues are initialized in the start() coroutine.
-        self._client_log_queue = None
-        self._client_image_queue = None
+        # Camera images are passed to each connected video client.
+        self._image_broadcaster = LatestValueBroadcaster()
+        # Hardware status is passed to each connected websocket client.
+        self._status_broadcaster = LatestValueBroadcaster()
+        # Log messages are passed to each connected websocket client.
+        self._log_broadcaster = RingBufferBroadcaster(self.client_log_length)
+
+        # This queue is initialized in the start() coroutine.
         self._hardware_command_queue = None
 
+        # Metrics of the server, served with those of the hardware classes.
+        self._metrics = MetricsRegistry()
+        self._create_metrics()
+        # The number of the video streams of each client address, whose
+        # metrics are removed after its last stream
+        self._video_stream_counts = Counter()
+
     async def start(self):
         """Setup and start serving the web application."""
         await self._init_queues()
 
         # Start background tasks.
-        aio.create_task(self._hardware_command_worker())
-        aio.create_task(self._camera_capture_worker())
+        workers = [
+            aio.create_task(self._hardware_command_worker()),
+            aio.create_task(self._camera_capture_worker()),
+            aio.create_task(self._status_sampler_worker()),
+            aio.create_task(self._obstacle_event_worker()),
+        ]
+        if self._telemetry_dir is not None:
+            workers.append(aio.create_task(self._telemetry_worker()))
 
         # Create the web app.
         app = self._create_application()
@@ -84,6 +149,9 @@ class SerobotServer:
             ssl_context = None
             port = 80
 
+        if self._port is not None:
+            port = self._port
+
         # Start the server.
         tcp_site = web.TCPSite(
             app_runner, host='0.0.0.0', port=port, ssl_context=ssl_context)
@@ -100,6 +168,8 @@ class SerobotServer:
                 await aio.sleep(1)
         finally:
             await app_runner.cleanup()
+            for worker in workers:
+                worker.cancel()
 
     @property
     def bot(self) -> Serobot:
@@ -111,22 +181,74 @@ class SerobotServer:
 
     async def _init_queues(self):
         """Initialize asyncio queues."""
-        self._client_log_queue = aio.Queue()
-        self._client_image_queue = aio.Queue(maxsize=1)
-        self._hardware_command_queue = aio.Queue()
+        self._hardware_command_queue = aio.Queue(
+            maxsize=self.hardware_command_queue_size)
 
     @property
-    def client_log_queue(self) -> aio.Queue:
-        return self._client_log_queue
+    def log_broadcaster(self) -> RingBufferBroadcaster:
+        return self._log_broadcaster
 
     @property
-    def client_image_queue(self) -> aio.Queue:
-        return self._client_image_queue
+    def image_broadcaster(self) -> LatestValueBroadcaster:
+        return self._image_broadcaster
+
+    @property
+    def status_broadcaster(self) -> LatestValueBroadcaster:
+        return self._status_broadcaster
 
     @property
     def hardware_command_queue(self) -> aio.Queue:
         return self._hardware_command_queue
 
+    @property
+    def metrics(self) -> MetricsRegistry:
+        return self._metrics
+
+    def _create_metrics(self):
+        """Create the metrics of the server, see the /metrics route.
+
+        The depths and the client counts are read only when scraped.
+        """
+        metrics = self.metrics
+        metrics.gauge(
+            'serobot_hardware_command_queue_depth',
+            'Received hardware command batches waiting to be performed.',
+            function=lambda: (self.hardware_command_queue.qsize()
+                              if self.hardware_command_queue is not None else 0))
+        metrics.gauge(
+            'serobot_log_messages_pending_max',
+            'The largest number of log messages waiting to be sent to a '
+            'websocket client.',
+            function=lambda: self.log_broadcaster.max_pending_count)
+        metrics.gauge(
+            'serobot_websocket_clients', 'Connected websocket clients.',
+            function=lambda: self.status_broadcaster.subscriber_count)
+        metrics.gauge(
+            'serobot_video_clients', 'Connected video clients.',
+            function=lambda: self.image_broadcaster.subscriber_count)
+        self._command_batch_counter = metrics.counter(
+            'serobot_hardware_command_batches_total',
+            'Hardware command batches received from the clients.')
+        self._command_counter = metrics.counter(
+            'serobot_hardware_commands_total',
+            'Hardware commands by their result: performed, coalesced, '
+            'unconsumed, or failed.',
+            label_names=('result',))
+        self._command_latency_histogram = metrics.histogram(
+            'serobot_hardware_command_latency_seconds',
+            'Time from receiving a hardware command batch to performing it.')
+        self._status_read_histogram = metrics.histogram(
+            'serobot_status_read_seconds',
+            'Time of reading the hardware status for the clients.')
+        self._video_frame_counter = metrics.counter(
+            'serobot_video_frames_sent_total',
+            'Camera images sent to the video clients.',
+            label_names=('client',))
+        self._video_byte_counter = metrics.counter(
+            'serobot_video_bytes_sent_total',
+            'Bytes of the camera images sent to the video clients.',
+            label_names=('client',))
+
     def _create_application(self) -> web.Application:
         """Create and setup the web app."""
         app = web.Application()
@@ -151,6 +273,7 @@ class SerobotServer:
         app.router.add_get('/logout', self._logout_handler)
         app.router.add_get('/video', self._video_stream_handler)
         app.router.add_get('/ws', self._websocket_handler)
+        app.router.add_get('/metrics', self._metrics_handler)
         static_dnames = ['js', 'css', 'img']
         for static_dname in static_dnames:
             path = Path(__file__).parent / 'frontend' / 'dist' / static_dname
@@ -159,17 +282,53 @@ class SerobotServer:
 
         return app
 
+    async def _status_sampler_worker(self):
+        """Coroutine for reading the hardware status for all clients."""
+        logger.info('Start reading hardware status.')
+
+        while True:
+            start_time = time.monotonic()
+            try:
+                status = await self.bot.get_status()
+                self._status_read_histogram.observe(time.monotonic() - start_time)
+                self.status_broadcaster.publish(asdict(status))
+            except aio.CancelledError:
+                raise
+            except Exception:
+                # Keep the status of every client updating after a failure.
+                logger.exception('Could not read the hardware status.')
+            await aio.sleep(self._status_period)
+
+    async def _telemetry_worker(self):
+        """Coroutine for recording the hardware status into a telemetry log."""
+        logger.info(f'Start recording telemetry to {self._telemetry_dir}.')
+
+        async with TelemetryRecorder(self._telemetry_dir) as recorder:
+            await record_serobot_telemetry(
+                self.bot, recorder, self._telemetry_period)
+
     async def _status_response_worker(self, ws: web.WebSocketResponse):
-        """Coroutine for sending hardware status via a websocket."""
+        """Coroutine for sending hardware status via a websocket.
+
+        The first message contains the full status, and the subsequent
+        messages only the values that have changed.
+        """
         logger.info('Start sending status messages via the websocket.')
 
-        while True:
-            status = asdict(await self.bot.get_status())
-            if not ws.closed:
-                await ws.send_json(dict(status=status))
-            else:
-                break
-            await aio.sleep(1)
+        sent_status = dict()
+        with self.status_broadcaster.subscribe() as status_subscription:
+            while True:
+                status = await status_subscription.get()
+                changed_status = {
+                    name: value for (name, value) in status.items()
+                    if name not in sent_status or sent_status[name] != value}
+                if not changed_status:
+                    continue
+                if not ws.closed:
+                    await ws.send_json(dict(status=changed_status))
+                    sent_status.update(changed_status)
+                else:
+                    break
 
         logger.info('Stopped sending status messages to a client.')
 
@@ -177,57 +336,88 @@ class SerobotServer:
         """Coroutine for sending log messages to the client via a websocket."""
         logger.info('Start sending log messages via the websocket.')
 
-        while True:
-            message = await self.client_log_queue.get()
-            message = {'log': f'Log: {message}'}
+        with self.log_broadcaster.subscribe() as log_subscription:
+            while True:
+                # Send all messages received meanwhile in a single message.
+                messages = await log_subscription.get()
+                message = {'log': [f'Log: {message}' for message in messages]}
 
-            if not ws.closed:
-                await ws.send_json(message)
-            else:
-                break
+                if not ws.closed:
+                    await ws.send_json(message)
+                else:
+                    break
 
         logger.info('Stopped sending log messages via the websocket.')
 
     async def _hardware_command_worker(self):
-        """Coroutine for handling hardware commands sent from the app."""
+        """Coroutine for handling hardware commands sent from the app.
+
+        The queue items are tuples (batch, ws, receive_time), see
+        HardwareCommander.command_batch(). If ws is not None, an
+        acknowledgement is sent to it after performing the batch.
+        """
         logger.info('Start handling hardware commands.')
 
         while True:
             # Wait for a command.
-            message = await self.hardware_command_queue.get()
-            logger.debug(f'Received HW command "{message}"')
-            unconsumed_commands = await self.hardware_commander.command(message)
-            if unconsumed_commands:
-                logger.debug(f'Unknown hardware commands: {unconsumed_commands}')
+            batch, ws, receive_time = await self.hardware_command_queue.get()
+            logger.debug('Received HW command batch "%s"', batch)
+            self._command_batch_counter.inc()
+            try:
+                result = await self.hardware_commander.command_batch(batch)
+            except Exception:
+                logger.exception(f'Failed to perform HW command batch "{batch}"')
+                seq = (batch[-1].get('seq') if isinstance(batch, list) and batch
+                       and isinstance(batch[-1], dict) else None)
+                result = dict(seq=seq, error=True)
+                self._command_counter.labels('failed').inc(
+                    len(batch) if isinstance(batch, list) else 1)
+            else:
+                self._command_counter.labels('performed').inc(result['performed'])
+                self._command_counter.labels('coalesced').inc(result['coalesced'])
+                self._command_counter.labels('unconsumed').inc(len(result['unconsumed']))
+            if result.get('unconsumed'):
+                logger.debug('Unknown hardware commands: %s', result['unconsumed'])
+            latency = time.monotonic() - receive_time
+            self._command_latency_histogram.observe(latency)
+
+            if ws is not None and not ws.closed:
+                result['latency'] = latency
+                try:
+                    await ws.send_json(dict(ack=result))
+                except ConnectionResetError:
+                    # The client disconnected meanwhile.
+                    pass
+
+    async def _obstacle_event_worker(self):
+        """Coroutine for telling the clients about the obstacles as soon as
+        the proximity sensors detect them.
+        """
+        while True:
+            try:
+                async for event in self.bot.proximity_sensors.async_obstacle_events():
+                    if event.detected:
+                        self.log_broadcaster.publish(
+                            f'Obstacle detected on the {event.side}')
+            except aio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Could not follow the proximity sensors. '
+                                 'Subscribing again.')
+            await aio.sleep(self.worker_restart_delay)
 
     async def _camera_capture_worker(self):
         """Coroutine for continuously capturing new images by the camera."""
-        jpg_stream = io.BytesIO()
-
         logger.info('Start capturing camera images.')
-        await self.client_log_queue.put('Server is capturing camera')
+        self.log_broadcaster.publish('Server is capturing camera')
 
-        while True:
-            # Take picture to the stream.
-            await self.bot.camera.async_take_picture(
-                jpg_stream, format='jpeg', resize=(640, 480))
-
-            # Read jpg bytes from the start of the stream.
-            jpg_stream.seek(0)
-            jpg_bytes = jpg_stream.read()
-
-            # If the previous image has not yet been taken from the queue,
-            # take it away before adding a new one.
-            if self.client_image_queue.full():
-                self.client_image_queue.get_nowait()
+        async for jpg_view in self.bot.camera.async_stream_pictures(
+                resize=(640, 480)):
+            # Pass the same buffer to every video client.
+            self.image_broadcaster.publish(jpg_view)
+            del jpg_view
 
-            self.client_image_queue.put_nowait(jpg_bytes)
-
-            # Reset the stream for the next capture.
-            jpg_stream.seek(0)
-            jpg_stream.truncate()
-
-            await aio.sleep(.2)
+        logger.info('Stopped capturing camera images.')
 
     @staticmethod
     def _create_response_from_html_file(filename):
@@ -275,35 +465,56 @@ class SerobotServer:
         await response.prepare(request)
 
         logger.info(f'Start streaming camera images to {request.remote}.')
+        frame_counter = self._video_frame_counter.labels(request.remote)
+        byte_counter = self._video_byte_counter.labels(request.remote)
+        self._video_stream_counts[request.remote] += 1
 
         try:
-            while True:
-                # Wait for an image.
-                with async_timeout.timeout(timeout):
-                    data = await self.client_image_queue.get()
-
-                if data is None:
-                    raise ValueError
-
-                # Format the binary response.
-                data = (b'--ffserver\r\n' +
-                        b'Content-Type: image/jpeg\r\n\r\n' +
-                        data +
-                        b'\r\n')
-
-                await response.write(data)
+            with self.image_broadcaster.subscribe() as image_subscription:
+                while True:
+                    # Wait for the newest image.
+                    async with async_timeout.timeout(timeout):
+                        data = await image_subscription.get()
+
+                    if data is None:
+                        raise ValueError
+
+                    # Write the image without concatenating it with
+                    # the delimiters, which would copy it.
+                    await response.write(self._video_part_header)
+                    await response.write(data)
+                    await response.write(self._video_part_footer)
+                    frame_counter.inc()
+                    byte_counter.inc(len(data))
+                    del data
+        except (aio.CancelledError, ConnectionResetError):
+            # The connection was closed by the client.
+            pass
         except (aio.TimeoutError, ValueError, ClientError):
             # Close connection gracefully if there was a problem
             # capturing images or in the connection with the client.
             await response.write_eof()
-        except aio.CancelledError:
-            # The connection was closed by the client.
-            pass
+        finally:
+            self._video_stream_counts[request.remote] -= 1
+            if not self._video_stream_counts[request.remote]:
+                del self._video_stream_counts[request.remote]
+                self._video_frame_counter.remove(request.remote)
+                self._video_byte_counter.remove(request.remote)
 
         logger.info(f'Stopped streaming camera images to {request.remote}.')
 
         return response
 
+    async def _metrics_handler(self, request: web.Request):
+        """Handler for the metrics of the server and the hardware classes, in
+        the Prometheus text exposition format.
+        """
+        if not self._metrics_public:
+            await check_permission(request, 'protected')
+        return web.Response(
+            text=metrics_registry.render() + self.metrics.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
     async def _websocket_handler(self, request: web.Request):
         """Handler for the websocket connection."""
         await check_permission(request, 'protected')
@@ -314,21 +525,43 @@ class SerobotServer:
         logger.info(f'Open a websocket connection to {request.remote}.')
 
         # Start background tasks that feed data to the client via the websocket.
-        aio.create_task(self._status_response_worker(ws))
-        aio.create_task(self._log_response_worker(ws))
+        response_workers = [
+            aio.create_task(self._status_response_worker(ws)),
+            aio.create_task(self._log_response_worker(ws)),
+        ]
 
         async for msg in ws:
             if msg.type == WSMsgType.TEXT:
                 data = json.loads(msg.data)
                 if msg.data == 'close':
                     await ws.close()
+                elif not isinstance(data, dict):
+                    logger.debug('Unrecognized message: %s', msg.data)
+                elif 'batch' in data:
+                    if not is_command_batch(data['batch']):
+                        logger.warning('Rejected a malformed HW command batch '
+                                       '"%s"', data['batch'])
+                        continue
+                    # Waiting for the queue slows down a flooding client.
+                    await self.hardware_command_queue.put(
+                        (data['batch'], ws, time.monotonic()))
                 elif 'command' in data:
-                    self.hardware_command_queue.put_nowait(data['command'])
+                    # Single command without acknowledgement
+                    batch = [dict(seq=None, command=data['command'])]
+                    if not is_command_batch(batch):
+                        logger.warning('Rejected a malformed HW command "%s"',
+                                       data['command'])
+                        continue
+                    await self.hardware_command_queue.put(
+                        (batch, None, time.monotonic()))
                 else:
-                    logger.debug(f'Unrecognized message: {msg.data}')
+                    logger.debug('Unrecognized message: %s', msg.data)
             elif msg.type == WSMsgType.ERROR:
                 logger.info(f'Websocket connection closed with exception {ws.exception()}')
 
+        for response_worker in response_workers:
+            response_worker.cancel()
+
         logger.info(f'Closed websocket connection to {request.remote}')
 
         return ws